@@ -1,44 +1,243 @@
+import io
 import os
-from flask import Flask, send_file, jsonify, request,render_template
-import pandas as pd
+from urllib.parse import quote, urlencode
+from flask import Flask, send_file, jsonify, request,render_template, abort, Response, stream_with_context
+from werkzeug.security import safe_join
+from mapping_index import MappingIndex, NOT_FOUND
+from pdf_raster import RasterCache, DEFAULT_DPI, DEFAULT_DPIS, is_pdf
+from violin_store import ViolinRenderer
+from umap_render import UmapRenderer, has_dataset
+from figure_export import resolve_items, iter_zip, iter_ndjson, MAX_EXPORT_ITEMS
+from file_hash import FileHashes
+from image_optimize import VariantIndex, accepted_types
+from metrics import (REGISTRY, CONTENT_TYPE, LOOKUP_SECONDS, LOOKUP_RESULTS, FIGURE_BYTES, FIGURE_REQUESTS,
+                     StageTimer, SampledLogger)
 
-def search_third_column(csv_file, col1_value, col2_value):
-    # 读取CSV文件
-    df = pd.read_csv(csv_file)
-    
-    # 匹配前两列的值，获取对应的第三列数据
-    # 假设CSV的列名分别为'col1'、'col2'、'col3'，可根据实际列名修改
-    result = df[(df['Gene'] == col1_value) & (df['Meta information'] == col2_value)]['image_path']
+# 进程级映射索引，启动时加载一次，CSV变化时自动重新加载
+MAPPING_INDEX = MappingIndex()
+MAPPING_INDEX.register('umap', "mapping.csv")  # 替换为你的CSV文件路径
+MAPPING_INDEX.register('violin', "mapping-violin.csv")
+
+def search_third_column(plot_type, col1_value, col2_value):
+    # 匹配基因和meta信息，获取对应的图片路径
+    result = MAPPING_INDEX.lookup(plot_type, col1_value, col2_value)
     
     # 处理结果
-    if not result.empty:
-        return result.values[0]  # 返回匹配到的第三列值
+    if result is not None:
+        return result  # 返回匹配到的第三列值
     else:
-        return "未找到匹配的数据"
+        return NOT_FOUND
 
 app = Flask(__name__)
 # 配置 PDF 存储目录，这里使用当前目录下的 pdfs 文件夹
 PDF_FOLDER = os.path.join(os.getcwd(), 'static/umap_figure')
 os.makedirs(PDF_FOLDER, exist_ok=True)
+# 图片根目录（pdfUrl 中 static/ 之后的路径相对于此目录）
+FIGURE_ROOT = os.path.join(os.getcwd(), 'static')
+# 图片内容哈希（按 路径+mtime+大小 记忆），用于版本化URL和强ETag
+FILE_HASHES = FileHashes()
+# image_optimize.py 生成的PNG/WebP/AVIF变体，/figures 按 Accept 发送客户端接受的最小无损变体（见 MAGE_SERVE_LOSSY）
+FIGURE_VARIANTS = VariantIndex(FIGURE_ROOT)
+VERSION_LENGTH = 16
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# PDF栅格化缓存，可用 pdf_raster.py 批量预生成
+RASTER_CACHE = RasterCache(hashes=FILE_HASHES)
+# 每个请求的结构化日志按 MAGE_LOG_SAMPLE_RATE 采样输出（默认1%），完整统计见 /metrics
+REQUEST_LOG = SampledLogger('mage.requests')
+# 小提琴图摘要存储（violin_store.py build 生成）；映射中没有PDF时按需渲染
+VIOLIN_RENDERER = ViolinRenderer()
+# UMAP即时渲染（umap_data/ 下有坐标和表达矩阵时启用）；映射中没有图片时按需渲染
+UMAP_RENDERER = UmapRenderer() if has_dataset() else None
 @app.route('/')
 def index():
     return render_template('index.html')
 @app.route('/pdfs',methods={'POST'})
 def serve_pdf():
-    i3 = request.form.get('plotType')
-    if i3 == 'umap':
-        csv_path = "mapping.csv"  # 替换为你的CSV文件路径
+    timer = StageTimer()
+    with timer.stage('form_parse'):
+        i3 = request.form.get('plotType')
+        plot_type = 'umap' if i3 == 'umap' else 'violin'
+        input_col1 = request.form.get('gene')
+        input_col2 = request.form.get('cellType')
+    third_col_value, outcome, urls = lookup_urls(timer, plot_type, input_col1, input_col2)
+    result = {'success':'success','type':i3}
+    result.update(urls)
+    response = jsonify(result)
+    REQUEST_LOG.log('lookup', plotType=i3, gene=input_col1, cellType=input_col2, path=third_col_value,
+                    result=outcome, stages_ms=timer.milliseconds())
+    return response
+
+# /pdfs 的一次查询：映射查找（含CSV变化检查）、文件检查、按需渲染URL和内容哈希，返回 (映射路径, 结果, URL)；
+# 全部是阻塞操作，ASGI版本整体放到线程池中执行
+def lookup_urls(timer, plot_type, gene, meta):
+    with timer.stage('lookup'), LOOKUP_SECONDS.time(plot_type=plot_type):
+        third_col_value = search_third_column(plot_type, gene, meta)
+    with timer.stage('file_stat'):
+        full_path = figure_file(third_col_value)
+        rendered = rendered_urls(plot_type, gene, meta) if full_path is None else None
+    outcome = record_lookup(plot_type, third_col_value, full_path, rendered)
+    with timer.stage('response'):
+        urls = rendered or versioned_urls(third_col_value, full_path)
+    return third_col_value, outcome, urls
+
+# 查询结果计数：hit / rendered（按需渲染）/ miss（映射到的文件不存在）/ not_found（映射中没有该组合）
+def record_lookup(plot_type, path, full_path, rendered=None):
+    if rendered:
+        outcome = 'rendered'
     else:
-        csv_path = "mapping-violin.csv" 
-    input_col1 = request.form.get('gene')
-    input_col2 = request.form.get('cellType')
-    #i3 = request.form.get('plotType')
-    print(input_col1,input_col2)
-    third_col_value = search_third_column(csv_path, input_col1, input_col2)
-    print(f"对应的第三列值为：{third_col_value}")
-    
-    return jsonify({'success':'success','type':i3,'pdfUrl':'static/'+third_col_value})
+        outcome = 'not_found' if path == NOT_FOUND else ('hit' if full_path else 'miss')
+    LOOKUP_RESULTS.inc(plot_type=plot_type, result=outcome)
+    return outcome
+
+# 图片在磁盘上的路径；越出图片根目录或文件不存在时返回None
+def figure_file(path):
+    full_path = safe_join(FIGURE_ROOT, path)
+    if full_path is None or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+# 图片URL：文件存在时带内容哈希版本号（?v=），内容变化即换URL，可被浏览器永久缓存
+def figure_urls(path):
+    return versioned_urls(path, figure_file(path))
+
+def versioned_urls(path, full_path):
+    if full_path is None:
+        return {'pdfUrl':'static/'+path}
+    version = FILE_HASHES(full_path)[:VERSION_LENGTH]
+    urls = {'pdfUrl':'figures/'+path+'?v='+version}
+    if is_pdf(path):
+        urls['imageUrl'] = 'raster/'+path+'?v='+version
+    return urls
+
+# 映射中没有图片时按需渲染的图片URL（小提琴图来自摘要存储，UMAP来自表达数据）；无法渲染时返回None
+def rendered_urls(plot_type, gene, meta):
+    if plot_type == 'violin':
+        return violin_urls(meta, gene)
+    return umap_urls(gene)
+
+def umap_urls(gene):
+    if UMAP_RENDERER is None or gene not in UMAP_RENDERER:
+        return None
+    url = 'umap?'+urlencode({'gene':gene,'v':UMAP_RENDERER.version[:VERSION_LENGTH]})
+    return {'pdfUrl':url,'imageUrl':url}
+
+# 由摘要渲染的小提琴图URL；摘要中没有该 meta/基因 时返回None
+def violin_urls(meta, gene):
+    version = VIOLIN_RENDERER.version(meta)
+    if version is None or not VIOLIN_RENDERER.store.has(meta, gene):
+        return None
+    url = 'violin?'+urlencode({'meta':meta,'gene':gene,'v':version[:VERSION_LENGTH]})
+    return {'pdfUrl':url,'imageUrl':url}
+
+# 带强ETag的条件响应（304、Range 由 send_file 处理）；
+# URL中的版本号与当前内容一致时标记为 immutable，否则要求每次用ETag重新验证
+# source 为文件路径或内存中的图片字节；发送变体时 version 为原图的哈希（URL中的版本号来自原图）
+def send_versioned(source, digest, mimetype=None, version=None):
+    # send_file 把相对路径当作相对于应用目录，缓存目录按当前目录解析，这里统一转为绝对路径
+    source = io.BytesIO(source) if isinstance(source, bytes) else os.path.abspath(source)
+    response = send_file(source, mimetype=mimetype, conditional=True, etag=digest)
+    if request.args.get('v') == (version or digest)[:VERSION_LENGTH]:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+# 图片与PDF原文件
+@app.route('/figures/<path:figure>')
+def serve_figure(figure):
+    full_path = figure_file(figure)
+    if full_path is None:
+        abort(404)
+    source, mimetype = FIGURE_VARIANTS.smallest(full_path, accepted_types(request.headers.get('Accept')))
+    if mimetype is None:
+        return count_figure('figures', send_versioned(full_path, FILE_HASHES(full_path)))
+    response = send_versioned(source, FILE_HASHES(source), mimetype, version=FILE_HASHES(full_path))
+    response.vary.add('Accept')
+    return count_figure('figures', response)
+
+def count_figure(route, response):
+    FIGURE_REQUESTS.inc(route=route, status=response.status_code)
+    FIGURE_BYTES.inc(response.content_length or 0, route=route)
+    return response
+
+# 请求中的列表参数：JSON数组、重复的表单字段或逗号分隔的字符串；JSON中的值不是字符串或数组时返回400
+def request_list(payload, name):
+    if payload is not None:
+        values = payload.get(name) or []
+        if isinstance(values, str):
+            values = [values]
+        elif not isinstance(values, list):
+            abort(400)
+    else:
+        values = request.form.getlist(name) or request.args.getlist(name)
+    result = []
+    for value in values:
+        result.extend(v.strip() for v in str(value).split(',') if v.strip())
+    return result
+
+# 批量导出：genes × cellTypes × plotTypes 一次解析，format=zip（默认）流式返回ZIP，
+# format=ndjson 返回每行一个条目的URL清单；未匹配的组合逐条标记 status
+# plotTypes 缺省为 violin，与 /pdfs 一致；JSON请求体必须是对象
+@app.route('/pdfs/batch',methods={'POST'})
+def export_batch():
+    payload = request.get_json(silent=True)
+    if request.is_json and not isinstance(payload, dict):
+        abort(400)
+    genes = request_list(payload, 'genes')
+    metas = request_list(payload, 'cellTypes')
+    plot_types = ['umap' if p == 'umap' else 'violin' for p in request_list(payload, 'plotTypes')] or ['violin']
+    fmt = (payload or request.values).get('format', 'zip')
+    if not genes or fmt not in ('zip', 'ndjson'):
+        abort(400)
+    if len(genes) * max(len(metas), 1) * len(plot_types) > MAX_EXPORT_ITEMS:
+        abort(413)
+
+    items = resolve_items(MAPPING_INDEX, dict.fromkeys(plot_types), genes, metas)
+    if fmt == 'ndjson':
+        return Response(stream_with_context(iter_ndjson(items, FIGURE_ROOT, figure_urls)),
+                        mimetype='application/x-ndjson')
+    return Response(stream_with_context(iter_zip(items, FIGURE_ROOT)), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=figures.zip'})
+
+# PDF小提琴图的栅格化PNG，首次请求时渲染并缓存
+@app.route('/raster/<path:figure>')
+def serve_raster(figure):
+    pdf_path = safe_join(FIGURE_ROOT, figure)
+    if pdf_path is None or not is_pdf(pdf_path) or not os.path.isfile(pdf_path):
+        abort(404)
+    dpi = request.args.get('dpi', DEFAULT_DPI, type=int)
+    if dpi not in DEFAULT_DPIS:
+        abort(400)
+    digest = RASTER_CACHE.source_hash(pdf_path)
+    return count_figure('raster', send_versioned(RASTER_CACHE.rasterize(pdf_path, dpi), f'{digest}-{dpi}',
+                                                 mimetype='image/png'))
+
+# 按需渲染的小提琴图PNG（首次请求时渲染并缓存到磁盘）
+@app.route('/violin')
+def serve_violin():
+    meta, gene = request.args.get('meta'), request.args.get('gene')
+    path = VIOLIN_RENDERER.render_path(meta, gene)
+    if path is None:
+        abort(404)
+    version = VIOLIN_RENDERER.version(meta)
+    return count_figure('violin', send_versioned(path, f'{version}-{quote(gene)}', mimetype='image/png'))
+
+# 即时渲染的UMAP基因表达图（内存LRU缓存）
+@app.route('/umap')
+def serve_umap():
+    gene = request.args.get('gene')
+    png = UMAP_RENDERER.render(gene) if UMAP_RENDERER is not None and gene else None
+    if png is None:
+        abort(404)
+    return count_figure('umap', send_versioned(png, f'{UMAP_RENDERER.version}-{quote(gene)}', mimetype='image/png'))
+
+# Prometheus 指标
+@app.route('/metrics')
+def serve_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
     
 if __name__ == '__main__':
     app.run(debug=True)
-
@@ -0,0 +1,259 @@
+import argparse
+import os
+import sys
+from urllib.parse import quote
+
+import anyio
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from werkzeug.security import safe_join
+
+from app import (MAPPING_INDEX, FIGURE_ROOT, FILE_HASHES, FIGURE_VARIANTS, RASTER_CACHE, VERSION_LENGTH, IMMUTABLE_MAX_AGE,
+                 REQUEST_LOG, VIOLIN_RENDERER, UMAP_RENDERER, figure_urls, lookup_urls)
+from image_optimize import accepted_types
+from figure_export import resolve_items, iter_zip, iter_ndjson, MAX_EXPORT_ITEMS
+from mapping_store import compile_csv, fresh_compiled_path
+from metrics import REGISTRY, CONTENT_TYPE, FIGURE_BYTES, FIGURE_REQUESTS, StageTimer
+from pdf_raster import DEFAULT_DPI, DEFAULT_DPIS, is_pdf
+
+# app.py 的异步（ASGI）版本，接口与URL完全相同，用 uvicorn 多进程运行
+#
+# - 事件循环只解析请求和发送响应：/pdfs 的映射查询（含CSV变化检查）、文件检查、内容哈希和URL生成，
+#   /figures、/raster 的路径检查、变体选择和哈希，各作为一次调用整体放到线程池，
+#   PDF栅格化、按需渲染和ZIP打包同样在线程池中进行
+# - 文件由 FileResponse 分块异步发送（服务器支持 zerocopysend 扩展时使用sendfile），支持Range
+# - 多个worker进程共享映射：启动前把CSV编译为 .midx，各进程以内存映射方式打开，
+#   由操作系统页缓存共享同一份数据，而不是每个进程各自解析CSV
+DEFAULT_WORKERS = os.cpu_count() or 1
+TEMPLATES = Jinja2Templates(directory='templates')
+# /pdfs 查询和 /figures、/raster 的路径解析各用单独的线程额度，
+# 互不排队，也不与 FileResponse 读取文件块的线程排队
+LOOKUP_LIMITER = anyio.CapacityLimiter(int(os.environ.get('MAGE_LOOKUP_THREADS', '16')))
+RESOLVE_LIMITER = anyio.CapacityLimiter(int(os.environ.get('MAGE_RESOLVE_THREADS', '16')))
+
+
+# 图片一般为几百KB到几MB，用较大的块减少线程池往返次数
+class FigureResponse(FileResponse):
+    chunk_size = 1024 * 1024
+
+
+def _cache_headers(request, digest, version=None):
+    if request.query_params.get('v') == (version or digest)[:VERSION_LENGTH]:
+        cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = 'no-cache'
+    return {'ETag': f'"{digest}"', 'Cache-Control': cache_control}
+
+
+# 带强ETag的文件响应：If-None-Match 命中时返回304，Range 由 FileResponse 处理；
+# source 为文件路径或内存中的图片字节；发送变体时 version 为原图的哈希，并按 Accept 区分缓存
+def _send_versioned(request, source, digest, media_type=None, version=None):
+    headers = _cache_headers(request, digest, version)
+    if version is not None:
+        headers['Vary'] = 'Accept'
+    if_none_match = request.headers.get('if-none-match', '')
+    if headers['ETag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+    if isinstance(source, bytes):
+        return Response(source, media_type=media_type, headers=headers)
+    return FigureResponse(source, media_type=media_type, headers=headers)
+
+
+def _figure_path(figure, check):
+    full_path = safe_join(FIGURE_ROOT, figure)
+    if full_path is None or not check(full_path) or not os.path.isfile(full_path):
+        raise HTTPException(404)
+    return full_path
+
+
+async def index(request):
+    return TEMPLATES.TemplateResponse(request, 'index.html')
+
+
+async def serve_pdf(request):
+    timer = StageTimer()
+    with timer.stage('form_parse'):
+        form = await request.form()
+        i3 = form.get('plotType')
+        plot_type = 'umap' if i3 == 'umap' else 'violin'
+    third_col_value, outcome, urls = await anyio.to_thread.run_sync(
+        lookup_urls, timer, plot_type, form.get('gene'), form.get('cellType'), limiter=LOOKUP_LIMITER)
+    result = {'success': 'success', 'type': i3}
+    result.update(urls)
+    response = JSONResponse(result)
+    REQUEST_LOG.log('lookup', plotType=i3, gene=form.get('gene'), cellType=form.get('cellType'),
+                    path=third_col_value, result=outcome, stages_ms=timer.milliseconds())
+    return response
+
+
+# /figures 的一次解析：路径检查、变体选择（含清单加载）和内容哈希，返回 (文件, 类型, 哈希, 原图哈希)；
+# 全部是阻塞操作，整体放到线程池中执行
+def _resolve_figure(figure, accept):
+    full_path = _figure_path(figure, lambda path: True)
+    source, media_type = FIGURE_VARIANTS.smallest(full_path, accepted_types(accept))
+    digest = FILE_HASHES(full_path)
+    if media_type is None:
+        return full_path, None, digest, None
+    return source, media_type, FILE_HASHES(source), digest
+
+
+async def serve_figure(request):
+    source, media_type, digest, version = await anyio.to_thread.run_sync(
+        _resolve_figure, request.path_params['figure'], request.headers.get('accept'), limiter=RESOLVE_LIMITER)
+    return _send_versioned(request, source, digest, media_type, version=version)
+
+
+# PDF路径检查和源文件哈希
+def _resolve_raster(figure):
+    pdf_path = _figure_path(figure, is_pdf)
+    return pdf_path, RASTER_CACHE.source_hash(pdf_path)
+
+
+async def serve_raster(request):
+    pdf_path, digest = await anyio.to_thread.run_sync(_resolve_raster, request.path_params['figure'],
+                                                      limiter=RESOLVE_LIMITER)
+    try:
+        dpi = int(request.query_params.get('dpi', DEFAULT_DPI))
+    except ValueError:
+        raise HTTPException(400)
+    if dpi not in DEFAULT_DPIS:
+        raise HTTPException(400)
+    png = await run_in_threadpool(RASTER_CACHE.rasterize, pdf_path, dpi)
+    return _send_versioned(request, png, f'{digest}-{dpi}', media_type='image/png')
+
+
+async def serve_violin(request):
+    meta, gene = request.query_params.get('meta'), request.query_params.get('gene')
+    path = await run_in_threadpool(VIOLIN_RENDERER.render_path, meta, gene)
+    if path is None:
+        raise HTTPException(404)
+    version = VIOLIN_RENDERER.version(meta)
+    return _send_versioned(request, path, f'{version}-{quote(gene)}', media_type='image/png')
+
+
+async def serve_umap(request):
+    gene = request.query_params.get('gene')
+    png = await run_in_threadpool(UMAP_RENDERER.render, gene) if UMAP_RENDERER is not None and gene else None
+    if png is None:
+        raise HTTPException(404)
+    return _send_versioned(request, png, f'{UMAP_RENDERER.version}-{quote(gene)}', media_type='image/png')
+
+
+# 与 app.request_list 相同：JSON数组、重复的表单字段或逗号分隔的字符串；
+# JSON请求体不是对象、或其中的值不是字符串或数组时返回400
+def _json_list(payload, name):
+    values = payload.get(name) or []
+    if isinstance(values, str):
+        return [values]
+    if not isinstance(values, list):
+        raise HTTPException(400)
+    return values
+
+
+async def _request_lists(request, names):
+    if request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(400)
+        if not isinstance(payload, dict):
+            raise HTTPException(400)
+        getlist = lambda name: _json_list(payload, name)
+        get = payload.get
+    else:
+        form = await request.form()
+        getlist = lambda name: form.getlist(name) or request.query_params.getlist(name)
+        get = lambda name, default=None: form.get(name) or request.query_params.get(name, default)
+    lists = []
+    for name in names:
+        result = []
+        for value in getlist(name):
+            result.extend(v.strip() for v in str(value).split(',') if v.strip())
+        lists.append(result)
+    return lists, get('format', 'zip')
+
+
+async def export_batch(request):
+    (genes, metas, plot_types), fmt = await _request_lists(request, ('genes', 'cellTypes', 'plotTypes'))
+    plot_types = ['umap' if p == 'umap' else 'violin' for p in plot_types] or ['violin']  # 与 /pdfs 的缺省一致
+    if not genes or fmt not in ('zip', 'ndjson'):
+        raise HTTPException(400)
+    if len(genes) * max(len(metas), 1) * len(plot_types) > MAX_EXPORT_ITEMS:
+        raise HTTPException(413)
+
+    items = resolve_items(MAPPING_INDEX, dict.fromkeys(plot_types), genes, metas)
+    # 同步生成器由 StreamingResponse 在线程池中迭代
+    if fmt == 'ndjson':
+        return StreamingResponse(iter_ndjson(items, FIGURE_ROOT, figure_urls), media_type='application/x-ndjson')
+    return StreamingResponse(iter_zip(items, FIGURE_ROOT), media_type='application/zip',
+                             headers={'Content-Disposition': 'attachment; filename=figures.zip'})
+
+
+async def serve_metrics(request):
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+
+# 统计 /figures、/raster 和按需渲染的 /violin、/umap 实际发出的字节数（含Range部分响应）
+class FigureMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route = scope['path'].split('/')[1] if scope['type'] == 'http' else None
+        if route not in ('figures', 'raster', 'violin', 'umap'):
+            return await self.app(scope, receive, send)
+
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                FIGURE_REQUESTS.inc(route=route, status=message['status'])
+            elif message['type'] == 'http.response.body':
+                FIGURE_BYTES.inc(len(message.get('body', b'')), route=route)
+            await send(message)
+
+        await self.app(scope, receive, counting_send)
+
+
+app = Starlette(routes=[
+    Route('/', index),
+    Route('/pdfs', serve_pdf, methods=['POST']),
+    Route('/pdfs/batch', export_batch, methods=['POST']),
+    Route('/figures/{figure:path}', serve_figure),
+    Route('/raster/{figure:path}', serve_raster),
+    Route('/violin', serve_violin),
+    Route('/umap', serve_umap),
+    Route('/metrics', serve_metrics),
+    Mount('/static', StaticFiles(directory=FIGURE_ROOT), name='static'),
+], middleware=[Middleware(FigureMetricsMiddleware)])
+
+
+# 启动worker之前编译映射CSV，使各worker直接内存映射 .midx
+def compile_mappings():
+    compiled = []
+    for csv_file in MAPPING_INDEX.sources().values():
+        if os.path.exists(csv_file) and not fresh_compiled_path(csv_file):
+            compiled.append(compile_csv(csv_file))
+    return compiled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以ASGI模式（uvicorn多进程）运行图片查询服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="worker进程数")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    for path in compile_mappings():
+        print(f"已编译 {path}")
+    uvicorn.run("asgi_app:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
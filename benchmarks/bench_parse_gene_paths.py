@@ -0,0 +1,90 @@
+import argparse
+import os
+import random
+import sys
+import time
+from io import StringIO
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gene_path_parser import parse_gene_paths
+
+
+# 原先 newnew.py 中基于 iterrows 的实现（去掉streamlit依赖），作为对照；重复基因保留最后一条
+def legacy_parse_gene_paths(csv_content, gene_col="gene", path_col="image_path", sep=","):
+    gene_paths = {}
+    df = pd.read_csv(StringIO(csv_content), sep=sep)
+    gene_col_name = gene_col if gene_col in df.columns else df.columns[0]
+    if path_col in df.columns:
+        path_col_name = path_col
+    else:
+        path_col_name = df.columns[1] if len(df.columns) > 1 else df.columns[0]
+    for _, row in df.iterrows():
+        gene = str(row[gene_col_name]).strip()
+        path = str(row[path_col_name]).strip()
+        if gene and path:
+            gene_paths[gene] = path
+    return gene_paths
+
+
+# 生成合成映射CSV：带空白、少量重复基因（重复行的路径各不相同）
+def make_synthetic_mapping(rows, duplicate_ratio=0.01, seed=0):
+    rng = random.Random(seed)
+    lines = ["gene,image_path"]
+    n_unique = int(rows * (1 - duplicate_ratio))
+    for i in range(rows):
+        if i < n_unique:
+            lines.append(f" GENE{i} , images/Subset{i % 7}/GENE{i}.png ")
+        else:
+            g = rng.randrange(n_unique)
+            lines.append(f" GENE{g} , images/Subset{g % 7}/GENE{g}_row{i}.png ")
+    return "\n".join(lines) + "\n"
+
+
+# 期望结果：没有Meta列时，每个基因保留CSV中的第一条
+def first_rows(csv_content):
+    expected = {}
+    for line in csv_content.splitlines()[1:]:
+        gene, path = (value.strip() for value in line.split(","))
+        expected.setdefault(gene, path)
+    return expected
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="parse_gene_paths 与 iterrows 实现的性能对比")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    content = make_synthetic_mapping(args.rows)
+
+    legacy_time, legacy = best_of(lambda: legacy_parse_gene_paths(content), args.repeat)
+    new_time, (gene_paths, dropped) = best_of(lambda: parse_gene_paths(content), args.repeat)
+
+    # 重复基因的规则已改变：原实现保留最后一条，parse_gene_paths 按 (gene, meta) 顺序保留第一条
+    duplicated = {gene for gene, _ in dropped}
+    assert gene_paths == first_rows(content), "重复基因未按第一条保留"
+    assert all(legacy[gene] == path for gene, path in gene_paths.items() if gene not in duplicated), \
+        "非重复基因的结果与原实现不一致"
+    assert {(gene, legacy[gene]) for gene in duplicated} <= set(dropped), "原实现保留的行未列为被忽略"
+    assert len(gene_paths) + len(dropped) == args.rows
+    print(f"rows={args.rows} genes={len(gene_paths)} duplicated={len(duplicated)} dropped={len(dropped)}")
+    print(f"iterrows      : {legacy_time * 1000:9.1f} ms")
+    print(f"vectorized    : {new_time * 1000:9.1f} ms")
+    print(f"speedup       : {legacy_time / new_time:9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw
+
+from file_index import FileIndex
+from gene_path_parser import parse_gene_paths
+from github_client import GitHubClient
+from image_cache import ImageCache
+from image_tiles import MAX_DISPLAY_WIDTH, decode_tile, encode_for_display
+from mapping_index import MappingIndex
+from mapping_store import MappingStore, compile_csv
+from repo_snapshot import RepoSnapshots
+from storage import GitHubStorage
+
+# 热点路径的基准测试
+#
+# 在临时目录中按固定随机种子生成合成数据，各热点路径单独计时（准备工作不计入）：
+#   mapping.*    映射CSV解析、加载、编译和查询（/pdfs 的 search_third_column），按行数分级
+#   files.*      文件索引的首次扫描、无变化刷新和单目录变化刷新（bigsets 的 get_all_image_files），按文件数分级
+#   snapshot.*   GitHub仓库快照（一次递归树请求）
+#   fetch.*      GitHub图片读取：首次下载、缓存期内、304重新验证（newnew 的 get_github_image）
+#   decode.*     图片完整解码、图块解码和显示编码
+# GitHub请求由本地HTTP替身服务（raw、commits、git trees），不访问网络。
+# 每次运行的结果（每次操作的秒数，多次重复取最小值）连同提交号追加到JSON历史文件，并与上一次运行对比。
+ROW_SCALES = (1_000, 30_000, 300_000)
+FILE_SCALES = (100, 10_000)
+DEFAULT_HISTORY = os.path.join(ROOT, "benchmarks", "history.json")
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.2  # 比上一次慢20%以上视为退步
+LOOKUPS = 10_000
+FETCH_FILES = 24
+FIGURE_SIZE = 864
+FIGURE_POINTS = 20_000
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".pdf")
+METAS = ("Major.cell.type", "Subset1", "Subset2", "Patient", "Tissue", "Treatment")
+OWNER, REPO, BRANCH = "bench", "figures", "main"
+
+
+# ---- 合成数据 ----
+
+# 映射行 (gene, meta, path)：每个基因在每个meta下一行，10%的查询不命中
+def make_mapping_rows(rows):
+    genes = max(1, rows // len(METAS))
+    return [(f"GENE{g}", meta, f"VlnPlot/{meta}/GENE{g}.pdf")
+            for g in range(genes) for meta in METAS][:rows]
+
+
+def write_mapping_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Gene,Meta information,image_path\n")
+        f.writelines(f"{gene},{meta},{image_path}\n" for gene, meta, image_path in rows)
+
+
+# newnew.py 使用的两列映射（gene,image_path），带空白和1%重复基因
+def make_gene_path_csv(rows, seed=0):
+    rng = random.Random(seed)
+    unique = int(rows * 0.99)
+    lines = ["gene,image_path"]
+    for i in range(rows):
+        g = i if i < unique else rng.randrange(unique)
+        lines.append(f" GENE{g} , images/Subset{g % 7}/GENE{g}.png ")
+    return "\n".join(lines) + "\n"
+
+
+def make_queries(rows, count, seed=0):
+    rng = random.Random(seed)
+    genes = max(1, rows // len(METAS))
+    queries = []
+    for _ in range(count):
+        g = rng.randrange(genes) if rng.random() < 0.9 else genes + rng.randrange(genes)
+        queries.append((f"GENE{g}", rng.choice(METAS)))
+    return queries
+
+
+# 图片目录树：<meta>/<分组>/GENE<i>.<扩展名>，每个目录约100个文件
+def make_figure_tree(root, files):
+    for i in range(files):
+        directory = os.path.join(root, METAS[i % len(METAS)], f"group{i // (100 * len(METAS))}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"GENE{i}{IMAGE_EXTENSIONS[i % len(IMAGE_EXTENSIONS)]}"), "wb") as f:
+            f.write(b"x")
+
+
+# 类似UMAP图的PNG：白底上的大量彩色散点
+def make_figure(seed):
+    rng = random.Random(seed)
+    image = Image.new("RGBA", (FIGURE_SIZE, FIGURE_SIZE), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(FIGURE_POINTS):
+        x, y = rng.gauss(FIGURE_SIZE / 2, FIGURE_SIZE / 6), rng.gauss(FIGURE_SIZE / 2, FIGURE_SIZE / 6)
+        level = rng.randrange(256)
+        draw.ellipse((x - 2, y - 2, x + 2, y + 2), fill=(level, 64, 255 - level, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+# git trees API 格式的目录树条目
+def tree_entries(root):
+    entries = []
+    for dirpath, dirs, files in os.walk(root):
+        rel = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        prefix = "" if rel == "." else rel + "/"
+        entries.extend({"path": prefix + d, "type": "tree", "sha": prefix + d} for d in dirs)
+        entries.extend({"path": prefix + f, "type": "blob", "size": 1} for f in files)
+    return entries
+
+
+# ---- 本地GitHub替身 ----
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", etag=None, content_type="application/octet-stream"):
+        self.server.requests.append((self.path.split("?", 1)[0], status))
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_cached(self, body, content_type):
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, etag=etag)
+        self._send(200, body, etag, content_type)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        fixture = self.server.fixture
+        raw_prefix = f"/raw/{OWNER}/{REPO}/{BRANCH}/"
+        api_prefix = f"/api/repos/{OWNER}/{REPO}/"
+        if path.startswith(raw_prefix) and path[len(raw_prefix):] in fixture["raw"]:
+            return self._send_cached(fixture["raw"][path[len(raw_prefix):]], "image/png")
+        if path == api_prefix + f"commits/{BRANCH}":
+            return self._send_cached(fixture["sha"].encode(), "text/plain")
+        if path == api_prefix + f"git/trees/{fixture['sha']}":
+            return self._send(200, fixture["tree"], content_type="application/json")
+        self._send(404)
+
+
+# 在后台线程中运行替身服务，返回 (server, base_url)；server.requests 记录每个请求的 (路径, 状态码)
+def start_fixture(raw_files, entries=()):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.requests = []
+    tree = json.dumps({"sha": "tree", "tree": entries, "truncated": False}).encode()
+    server.fixture = {"raw": raw_files, "sha": hashlib.sha1(tree).hexdigest(), "tree": tree}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fixture_client(base):
+    return GitHubClient(OWNER, REPO, BRANCH, api_base=base + "/api", raw_base=base + "/raw", max_rate_wait=0)
+
+
+# ---- 计时 ----
+
+# 每次重复前调用 setup()（不计时），返回每次操作的秒数：{"min", "median", "repeat"}
+def measure(fn, setup=None, repeat=DEFAULT_REPEAT, ops=1):
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        timings.append((time.perf_counter() - start) / ops)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+class Suite:
+    def __init__(self, workdir, repeat, only=None, previous=None, threshold=DEFAULT_THRESHOLD):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.only = only
+        self.previous = previous or {}
+        self.threshold = threshold
+        self.results = {}
+        self.regressions = []
+
+    def tempdir(self, name):
+        return tempfile.mkdtemp(prefix=name + ".", dir=self.workdir)
+
+    def wanted(self, *names):
+        return not self.only or any(pattern in name for pattern in self.only for name in names)
+
+    def run(self, name, fn, setup=None, ops=1, repeat=None):
+        if not self.wanted(name):
+            return
+        result = measure(fn, setup, repeat or self.repeat, ops)
+        self.results[name] = result
+        line = f"{name:40s} {format_seconds(result['min']):>10s}  (中位数 {format_seconds(result['median'])})"
+        previous = self.previous.get(name)
+        if previous:
+            change = result["min"] / previous["min"] - 1
+            line += f"  上次 {format_seconds(previous['min']):>10s} {change:+7.1%}"
+            if change > self.threshold:
+                line += "  ← 退步"
+                self.regressions.append(name)
+        print(line, flush=True)
+
+    # 映射：解析、加载、编译、查询
+    def mapping(self, rows):
+        scale = f"rows={rows}"
+        if not self.wanted(*(f"{kind}/{scale}" for kind in ("parse.gene_paths", "mapping.load", "mapping.lookup",
+                                                             "mapping.compile", "mapping.store_lookup"))):
+            return
+        directory = self.tempdir("mapping")
+        csv_file = os.path.join(directory, "mapping.csv")
+        write_mapping_csv(csv_file, make_mapping_rows(rows))
+        gene_paths = make_gene_path_csv(rows)
+        queries = make_queries(rows, LOOKUPS)
+
+        self.run(f"parse.gene_paths/{scale}", lambda _: parse_gene_paths(gene_paths))
+        self.run(f"mapping.load/{scale}", lambda _: MappingIndex().register("violin", csv_file))
+        index = MappingIndex(check_interval=60)
+        index.register("violin", csv_file)
+        self.run(f"mapping.lookup/{scale}",
+                 lambda _: [index.lookup("violin", gene, meta) for gene, meta in queries], ops=len(queries))
+
+        midx = compile_csv(csv_file, os.path.join(directory, "mapping.midx"))
+        self.run(f"mapping.compile/{scale}", lambda _: compile_csv(csv_file, midx))
+        store = MappingStore.open(midx)
+        self.run(f"mapping.store_lookup/{scale}",
+                 lambda _: [store.lookup(gene, meta) for gene, meta in queries], ops=len(queries))
+        store.close()
+
+    # 文件索引：首次扫描、无变化刷新、单目录变化刷新，以及同样规模的仓库快照
+    def files(self, count):
+        scale = f"files={count}"
+        if not self.wanted(*(f"{kind}/{scale}" for kind in ("files.cold", "files.warm", "files.one_dir_changed",
+                                                             "snapshot.cold"))):
+            return
+        root = os.path.join(self.tempdir("files"), "figures")
+        make_figure_tree(root, count)
+        db_dir = self.tempdir("index")
+
+        def cold_setup():
+            path = os.path.join(tempfile.mkdtemp(dir=db_dir), "index.sqlite")
+            return FileIndex(path)
+
+        def list_files(index):
+            index.refresh(root)
+            return index.files(root, IMAGE_EXTENSIONS)
+
+        self.run(f"files.cold/{scale}", list_files, cold_setup)
+        index = cold_setup()
+        list_files(index)
+        self.run(f"files.warm/{scale}", lambda _: list_files(index))
+        changed_dir = os.path.join(root, METAS[0], "group0")
+        marker = os.path.join(changed_dir, "NEW.png")
+
+        def touch():
+            if os.path.exists(marker):
+                os.remove(marker)
+            else:
+                open(marker, "wb").close()
+
+        self.run(f"files.one_dir_changed/{scale}", lambda _: list_files(index), touch)
+        index.close()
+
+        server, base = start_fixture({}, tree_entries(root))
+        try:
+            self.run(f"snapshot.cold/{scale}", lambda client: RepoSnapshots(client).current(),
+                     lambda: fixture_client(base))
+        finally:
+            server.shutdown()
+
+    # GitHub图片读取（并发，经本地图片缓存）与解码
+    def figures(self):
+        if not self.wanted(*(f"fetch.{kind}/files={FETCH_FILES}" for kind in ("cold", "fresh", "revalidate")),
+                           "decode.full", "decode.tile", "decode.display"):
+            return
+        figures = [make_figure(seed) for seed in range(4)]
+        raw_files = {f"images/GENE{i}.png": figures[i % len(figures)] for i in range(FETCH_FILES)}
+        paths = sorted(raw_files)
+        server, base = start_fixture(raw_files, [])
+        client = fixture_client(base)
+        try:
+            def storage(max_age, warm):
+                cache = ImageCache(cache_dir=self.tempdir("image_cache"), max_age=max_age, session=client)
+                backend = GitHubStorage(client, cache)
+                if warm:
+                    read_all(backend)
+                return backend
+
+            def read_all(backend):
+                results = backend.map(backend.read, paths)
+                errors = [r for r in results.values() if isinstance(r, Exception)]
+                if errors:
+                    raise errors[0]
+
+            self.run(f"fetch.cold/files={FETCH_FILES}", read_all, lambda: storage(300, False))
+            self.run(f"fetch.fresh/files={FETCH_FILES}", read_all, lambda: storage(300, True))
+            self.run(f"fetch.revalidate/files={FETCH_FILES}", read_all, lambda: storage(0, True))
+        finally:
+            client.close()
+            server.shutdown()
+
+        self.run("decode.full", lambda _: [Image.open(io.BytesIO(data)).load() for data in figures],
+                 ops=len(figures))
+        self.run("decode.tile", lambda _: [decode_tile(data, 300) for data in figures], ops=len(figures))
+        self.run("decode.display", lambda _: [encode_for_display(decode_tile(data, MAX_DISPLAY_WIDTH))
+                                             for data in figures], ops=len(figures))
+
+
+# ---- 历史记录 ----
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                check=True, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "-C", ROOT, "status", "--porcelain", "--untracked-files=no"],
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def machine():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def load_history(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+# 同一台机器上每个项目最近一次的结果 {name: {"min", ...}}（只运行部分项目的记录也计入）
+def previous_results(history):
+    current = machine()
+    results = {}
+    for run in history:
+        if run.get("machine") == current:
+            results.update(run["results"])
+    return results
+
+
+def save_history(path, history, results):
+    history.append({
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machine(),
+        "results": results,
+    })
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def parse_scales(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="映射查询、解析、文件列表、GitHub读取和图片解码的基准测试")
+    parser.add_argument("--rows", default=",".join(map(str, ROW_SCALES)), help="映射行数分级（逗号分隔）")
+    parser.add_argument("--files", default=",".join(map(str, FILE_SCALES)), help="图片文件数分级（逗号分隔）")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每项重复次数（取最小值）")
+    parser.add_argument("--only", action="append", help="只运行名称包含该字符串的项目（可重复）")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON历史文件")
+    parser.add_argument("--no-save", action="store_true", help="不写入历史文件")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="比上次慢多少视为退步（比例）")
+    parser.add_argument("--check", action="store_true", help="有退步时退出码为1")
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    previous = previous_results(history)
+    workdir = tempfile.mkdtemp(prefix="mage-bench.")
+    suite = Suite(workdir, args.repeat, args.only, previous, args.threshold)
+    try:
+        for rows in parse_scales(args.rows):
+            suite.mapping(rows)
+        for count in parse_scales(args.files):
+            suite.files(count)
+        suite.figures()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not args.no_save and suite.results:
+        save_history(args.history, history, suite.results)
+        print(f"结果已追加到 {args.history}")
+    if suite.regressions:
+        print(f"{len(suite.regressions)} 项比上次慢 {args.threshold:.0%} 以上: {', '.join(suite.regressions)}")
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 图片查询服务的压测工具
+#
+# 每个虚拟用户循环：POST /pdfs 查询随机的 (基因, meta, plotType)，命中时再 GET 返回的 pdfUrl。
+# 分别统计查询和取图两类请求的 p50/p99 延迟与每秒请求数。
+# --compare 会在 --root 目录下分别启动 Flask 开发服务器和 ASGI 多进程服务并依次压测。
+# 客户端是基于 asyncio 的最小 HTTP/1.1 keep-alive 实现：通用HTTP客户端（如httpx）自身的
+# CPU开销足以成为瓶颈，在核数少的机器上会掩盖服务端的差异。
+SERVERS = {
+    "flask": lambda port, workers: [sys.executable, "-m", "flask", "--app", "app", "run",
+                                    "--port", str(port), "--with-threads"],
+    "asgi": lambda port, workers: [sys.executable, os.path.join(ROOT, "asgi_app.py"),
+                                   "--port", str(port), "--workers", str(workers)],
+}
+
+
+# 从映射CSV读取查询样本 [(plotType, gene, meta)]
+def load_queries(root):
+    queries = []
+    for plot_type, name in (("umap", "mapping.csv"), ("violin", "mapping-violin.csv")):
+        path = os.path.join(root, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                queries.append((plot_type, (row.get("Gene") or "").strip(), (row.get("Meta information") or "").strip()))
+    return queries
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class HTTPError(Exception):
+    pass
+
+
+# 单个keep-alive连接，只支持本压测需要的 Content-Length / chunked 响应
+class Connection:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _read_body(self, headers):
+        if "content-length" in headers:
+            return await self.reader.readexactly(int(headers["content-length"]))
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    return b"".join(body)
+                body.append(chunk[:-2])
+        return await self.reader.read()
+
+    async def request(self, method, path, body=b"", content_type=None):
+        if self.writer is None:
+            await self._connect()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        if content_type:
+            lines.append(f"Content-Type: {content_type}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await self.writer.drain()
+            head = await self.reader.readuntil(b"\r\n\r\n")
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.close()
+            raise HTTPError(str(e))
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        data = await self._read_body(headers)
+        if headers.get("connection", "").lower() == "close" or status_line.startswith("HTTP/1.0"):
+            self.close()
+        return int(status_line.split()[1]), data
+
+
+async def _user(base, queries, deadline, stats, rng, fetch_figures):
+    conn = Connection(base.hostname, base.port or 80)
+    prefix = base.path.rstrip("/")
+    while time.perf_counter() < deadline:
+        plot_type, gene, meta = rng.choice(queries)
+        body = urlencode({"plotType": plot_type, "gene": gene, "cellType": meta}).encode()
+        start = time.perf_counter()
+        try:
+            status, data = await conn.request("POST", prefix + "/pdfs", body, "application/x-www-form-urlencoded")
+            ok = status == 200
+            url = json.loads(data).get("pdfUrl") if ok else None
+        except (HTTPError, ValueError):
+            ok, url = False, None
+        stats["lookup"].append((time.perf_counter() - start, ok))
+
+        if fetch_figures and url and not url.startswith("static/未"):
+            start = time.perf_counter()
+            try:
+                status, _ = await conn.request("GET", prefix + "/" + url)
+                ok = status == 200
+            except HTTPError:
+                ok = False
+            stats["figure"].append((time.perf_counter() - start, ok))
+    conn.close()
+
+
+# 对 base_url 压测 duration 秒，返回 {请求类型: 统计}
+async def run_load(base_url, queries, concurrency, duration, fetch_figures=True, seed=0):
+    stats = {"lookup": [], "figure": []}
+    base = urlsplit(base_url)
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[
+        _user(base, queries, deadline, stats, random.Random(seed + i), fetch_figures)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    report = {}
+    for kind, samples in stats.items():
+        latencies = sorted(t for t, _ in samples)
+        report[kind] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, ok in samples if not ok),
+            "rps": len(samples) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    return report
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout} 秒内启动（端口 {port}）")
+
+
+# 在 root 目录下启动服务，压测后关闭
+def run_server(name, root, workers, queries, args):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.Popen(SERVERS[name](port, workers), cwd=root, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        return asyncio.run(run_load(f"http://127.0.0.1:{port}", queries, args.concurrency, args.duration,
+                                    not args.lookup_only))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def print_report(label, report):
+    for kind, r in report.items():
+        if r["requests"]:
+            print(f"{label:<8} {kind:<7} n={r['requests']:<7} err={r['errors']:<4} "
+                  f"rps={r['rps']:8.1f}  p50={r['p50_ms']:7.1f} ms  p99={r['p99_ms']:7.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="图片查询服务压测（p50/p99延迟与每秒请求数）")
+    parser.add_argument("--url", action="append", default=[], help="已运行服务的地址，可多次指定")
+    parser.add_argument("--compare", action="store_true", help="分别启动 Flask 和 ASGI 服务并对比")
+    parser.add_argument("--root", default=os.getcwd(), help="服务工作目录（含 mapping.csv 和 static/）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ASGI worker进程数")
+    parser.add_argument("--concurrency", type=int, default=100, help="并发虚拟用户数")
+    parser.add_argument("--duration", type=float, default=20.0, help="每个服务的压测秒数")
+    parser.add_argument("--lookup-only", action="store_true", help="只压测 /pdfs 查询，不取图")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    queries = load_queries(args.root)
+    if not queries:
+        parser.error(f"{args.root} 下没有 mapping.csv / mapping-violin.csv")
+
+    results = {}
+    for url in args.url:
+        results[url] = asyncio.run(run_load(url, queries, args.concurrency, args.duration, not args.lookup_only))
+        print_report(url, results[url])
+    if args.compare:
+        for name in SERVERS:
+            results[name] = run_server(name, args.root, args.workers, queries, args)
+            print_report(name, results[name])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
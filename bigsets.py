@@ -1,8 +1,11 @@
 import streamlit as st
-from PIL import Image
 import os
-import glob
-from collections import defaultdict
+import html
+from image_optimize import VariantIndex
+from image_pyramid import PyramidIndex
+from pdf_raster import DEFAULT_DPI, FULL_RES_DPI, RasterCache, is_pdf
+from file_index import FileIndex
+from image_tiles import DisplayCache, GridItem, TileLoader, file_tile_key, render_tile_grid, tile_width
 
 st.set_page_config(layout="wide", page_title="多级目录图片展示系统")
 st.title("📂 多级目录图片展示系统")
@@ -14,79 +17,143 @@ BASE_DIR = "images"
 UMAP_DIR = os.path.join(BASE_DIR, "images")
 VIOLIN_DIR = os.path.join(BASE_DIR, "VlnPlot")
 
+# 预览区显示宽度（像素），用于选择图片分级
+UMAP_DISPLAY_WIDTH = 520
+VIOLIN_DISPLAY_WIDTH = 1040
+
 # 创建目录结构（如果不存在）
 def create_dirs():
     for path in [UMAP_DIR, VIOLIN_DIR]:
         if not os.path.exists(path):
             os.makedirs(path)
 
-# 递归获取目录结构
-def get_directory_structure(rootdir):
-    dir_structure = {}
-    rootdir = rootdir.rstrip(os.sep)
-    start = rootdir.rfind(os.sep) + 1
-    for path, dirs, files in os.walk(rootdir):
-        folders = path[start:].split(os.sep)
-        subdir = dict.fromkeys(files)
-        parent = dir_structure
-        for folder in folders:
-            parent = parent.setdefault(folder, {})
-        parent.update(subdir)
-    return dir_structure
-
-# 递归获取所有图片文件
+# 图片文件扩展名
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf')
+
+# 持久化文件索引（SQLite），跨重跑和重启复用
+@st.cache_resource
+def get_file_index():
+    return FileIndex()
+
+# 增量刷新索引：只检查目录mtime，变化的目录才重新列出
 @st.cache_data(ttl=300)
-def get_all_image_files(directory):
-    image_files = []
-    for root, _, files in os.walk(directory):
+def refresh_file_index(rootdir):
+    return get_file_index().refresh(rootdir)
+
+# 目录树中每个目录每页显示的文件数
+TREE_PAGE_SIZE = int(os.environ.get("MAGE_TREE_PAGE_SIZE", "200"))
+
+# 基因 -> 图片文件路径列表（来自文件索引，基因名在建索引时已提取）
+def get_gene_map(directory):
+    refresh_file_index(directory)
+    return get_file_index().gene_map(directory, IMAGE_EXTENSIONS)
+
+# 图片金字塔清单（由 image_pyramid.py 生成），跨重跑共享
+@st.cache_resource
+def get_pyramid_index(root):
+    return PyramidIndex(root)
+
+# 无损重新压缩的变体清单（由 image_optimize.py 生成），原图按解码最快的变体读取
+@st.cache_resource
+def get_variant_index(root):
+    return VariantIndex(root)
+
+# PDF栅格化缓存（由 pdf_raster.py 批量预生成），跨重跑共享
+@st.cache_resource
+def get_raster_cache():
+    return RasterCache()
+
+# 显示缓存（解码、缩小、编码后的字节，按路径+mtime失效），跨重跑共享
+@st.cache_resource
+def get_display_cache():
+    return DisplayCache()
+
+# 显示图片：默认使用适合显示宽度的分级，勾选后才加载原图
+# PDF使用栅格化后的PNG，未预生成时在此渲染一次并缓存
+def show_image(file, root, display_width, full_res):
+    if is_pdf(file):
+        with st.spinner("正在渲染PDF..."):
+            display_path = get_raster_cache().rasterize(file, FULL_RES_DPI if full_res else DEFAULT_DPI)
+    elif full_res:
+        display_path = get_variant_index(root).fastest(file)
+    else:
+        display_path = get_variant_index(root).fastest(get_pyramid_index(root).best_path(file, display_width))
+    st.image(get_display_cache().get(display_path), use_container_width=True)
+
+# 同一基因有多个文件时用单选切换，只解码选中的一个（st.tabs 会渲染全部标签页）
+def show_gene_files(files, root, display_width, full_res, key):
+    if len(files) > 1:
+        labels = [os.path.basename(os.path.dirname(f)) or "根目录" for f in files]
+        choice = st.radio("文件", range(len(files)), format_func=labels.__getitem__,
+                          horizontal=True, label_visibility="collapsed", key=key)
+        file = files[choice]
+    else:
+        file = files[0]
+    st.markdown(f'<div class="selected-path">{file}</div>', unsafe_allow_html=True)
+    show_image(file, root, display_width, full_res)
+
+# 对比网格的图块加载器（线程池 + 已解码图块缓存），跨重跑共享
+@st.cache_resource
+def get_tile_loader():
+    return TileLoader()
+
+# 对比网格的图块：PDF用低DPI栅格，图片用适合图块宽度的分级；同一基因有多个文件时都列出
+def grid_items(genes, gene_map, root, width):
+    raster_cache, pyramid, variants = get_raster_cache(), get_pyramid_index(root), get_variant_index(root)  # 在主线程取得，工作线程只调用方法
+    items = []
+    for gene in genes:
+        files = gene_map.get(gene, [])
         for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_files.append(os.path.join(root, file))
-    return image_files
-
-# 从路径中提取基因名称
-def extract_gene_name(path):
-    filename = os.path.splitext(os.path.basename(path))[0]
-    # 尝试从文件名中提取基因名称（去掉后缀）
-    return filename.split("_")[0] if "_" in filename else filename
-
-# 显示目录树
-def display_directory_tree(tree, path=""):
-    for key, value in tree.items():
-        full_path = os.path.join(path, key)
-        if isinstance(value, dict):  # 文件夹
-            with st.expander(f"📁 {key}", expanded=False):
-                display_directory_tree(value, full_path)
-        else:  # 文件
-            st.markdown(f'<div class="file-item">{key}</div>', unsafe_allow_html=True)
-
-# 创建基因到文件路径的映射
-def create_gene_map(files):
-    gene_map = defaultdict(list)
-    for file in files:
-        gene = extract_gene_name(file)
-        gene_map[gene].append(file)
-    return gene_map
+            label = gene if len(files) == 1 else f"{gene} · {os.path.basename(os.path.dirname(file)) or '根目录'}"
+            if is_pdf(file):
+                fetch = lambda file=file: raster_cache.rasterize(file, 72)
+            else:
+                fetch = lambda file=file: variants.fastest(pyramid.best_path(file, width))
+            items.append(GridItem(label, file_tile_key(file, width), fetch))
+    return items
+
+# 显示目录树的一层：子目录只显示文件数，勾选打开后才查询其内容；
+# 文件按名称分页，每页 TREE_PAGE_SIZE 个，合成一个元素显示
+def display_directory_node(index, path):
+    for sub, file_count in index.subdirs(path):
+        if st.checkbox(f"📁 {os.path.basename(sub)}（{file_count} 个文件）", key=f"tree_open:{sub}"):
+            with st.container(border=True):
+                display_directory_node(index, sub)
+
+    total = index.count_files(path)
+    if not total:
+        return
+    pages = -(-total // TREE_PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"页（共 {pages} 页，{total} 个文件）", 1, pages, 1, key=f"tree_page:{path}")
+    names = index.list_files(path, (page - 1) * TREE_PAGE_SIZE, TREE_PAGE_SIZE)
+    st.markdown("".join(f'<div class="file-item">{html.escape(name)}</div>' for name in names),
+                unsafe_allow_html=True)
+
+# 目录浏览器（片段）：数据来自文件索引，只查询已打开的目录；打开、折叠、翻页只重跑这个片段
+@st.fragment
+def directory_browser(rootdir, label):
+    refresh_file_index(rootdir)
+    index = get_file_index()
+    total = index.count_files(rootdir, recursive=True)
+    if not total:
+        st.info(f"{label} 目录为空")
+        return
+    st.caption(f"共 {total} 个文件")
+    display_directory_node(index, rootdir)
 
 # 确保目录存在
 create_dirs()
 
-# 获取所有图片文件
-umap_files = get_all_image_files(UMAP_DIR)
-violin_files = get_all_image_files(VIOLIN_DIR)
-
 # 创建基因映射
-umap_gene_map = create_gene_map(umap_files)
-violin_gene_map = create_gene_map(violin_files)
+umap_gene_map = get_gene_map(UMAP_DIR)
+violin_gene_map = get_gene_map(VIOLIN_DIR)
 
 # 获取基因列表
 umap_genes = sorted(umap_gene_map.keys())
 violin_genes = sorted(violin_gene_map.keys())
 
-# 获取目录结构
-umap_structure = get_directory_structure(UMAP_DIR)
-violin_structure = get_directory_structure(VIOLIN_DIR)
-
 # 侧边栏
 with st.sidebar:
     st.markdown("## 🗂️ 目录浏览器")
@@ -95,79 +162,64 @@ with st.sidebar:
     
     with tab1:
         st.subheader("UMAP 目录结构")
-        if umap_structure:
-            display_directory_tree(umap_structure, UMAP_DIR)
-        else:
-            st.info("UMAP 目录为空")
+        directory_browser(UMAP_DIR, "UMAP")
     
     with tab2:
         st.subheader("Violin 目录结构")
-        if violin_structure:
-            display_directory_tree(violin_structure, VIOLIN_DIR)
-        else:
-            st.info("Violin 目录为空")
+        directory_browser(VIOLIN_DIR, "Violin")
     
     st.markdown("---")
     st.markdown("## 🔧 控制面板")
     
-    # UMAP 部分
-    st.markdown("### UMAP 图")
-    umap_gene = st.selectbox("选择基因 (UMAP)", umap_genes, index=0 if umap_genes else None)
-    
-    # Violin 部分
-    st.markdown("### Violin 图")
-    violin_gene = st.selectbox("选择基因 (Violin)", violin_genes, index=0 if violin_genes else None)
+    # 多基因对比
+    st.markdown("### 多基因对比")
+    compare_type = st.radio("对比图类型", ["UMAP", "Violin"], horizontal=True, key="compare_type")
+    compare_genes = st.multiselect("选择基因 (对比)", umap_genes if compare_type == "UMAP" else violin_genes,
+                                   key="compare_genes")
+    compare_columns = st.slider("每行图片数", 2, 6, 4, key="compare_columns")
     
     # 刷新按钮
     if st.button("刷新图片列表", use_container_width=True):
-        st.cache_data.clear()
+        refresh_file_index.clear()
         st.rerun()
     
     st.markdown("---")
     st.markdown("### 系统信息")
-    st.info(f"UMAP 图片数量: {len(umap_files)}")
-    st.info(f"Violin 图片数量: {len(violin_files)}")
+    st.info(f"UMAP 图片数量: {sum(map(len, umap_gene_map.values()))}")
+    st.info(f"Violin 图片数量: {sum(map(len, violin_gene_map.values()))}")
     st.info(f"UMAP 基因数量: {len(umap_genes)}")
     st.info(f"Violin 基因数量: {len(violin_genes)}")
 
+# 预览面板：基因选择和预览在同一个片段（st.fragment）中，切换基因、文件或原图只重跑该面板，
+# 不会重新读取目录结构，也不会重新执行另一个面板的查找和解码
+@st.fragment
+def preview_pane(label, genes, gene_map, image_dir, display_width):
+    key = label.lower()
+    st.subheader(f"{label} 图预览")
+    gene = st.selectbox(f"选择基因 ({label})", genes, index=0 if genes else None, key=f"{key}_gene")
+    if gene and gene in gene_map:
+        full_res = st.toggle("加载原图", key=f"{key}_full_res")
+        show_gene_files(gene_map[gene], image_dir, display_width, full_res, key=f"{key}_file_{gene}")
+    elif genes:
+        st.info("请在上方选择基因")
+    else:
+        st.warning(f"{label} 目录中没有图片")
+
 # 主内容区
 col1, col2 = st.columns([1, 2])
 
 with col1:
-    st.subheader("UMAP 图预览")
-    if umap_gene and umap_gene in umap_gene_map:
-        files = umap_gene_map[umap_gene]
-        
-        if len(files) > 1:
-            tabs = st.tabs([os.path.basename(os.path.dirname(f)) or "根目录" for f in files])
-            for tab, file in zip(tabs, files):
-                with tab:
-                    st.markdown(f'<div class="selected-path">{file}</div>', unsafe_allow_html=True)
-                    st.image(Image.open(file), use_container_width=True)
-        else:
-            st.markdown(f'<div class="selected-path">{files[0]}</div>', unsafe_allow_html=True)
-            st.image(Image.open(files[0]), use_container_width=True)
-    elif umap_genes:
-        st.info("请从左侧选择基因")
-    else:
-        st.warning("UMAP 目录中没有图片")
+    preview_pane("UMAP", umap_genes, umap_gene_map, UMAP_DIR, UMAP_DISPLAY_WIDTH)
 
 with col2:
-    st.subheader("Violin 图预览")
-    if violin_gene and violin_gene in violin_gene_map:
-        files = violin_gene_map[violin_gene]
-        
-        if len(files) > 1:
-            tabs = st.tabs([os.path.basename(os.path.dirname(f)) or "根目录" for f in files])
-            for tab, file in zip(tabs, files):
-                with tab:
-                    st.markdown(f'<div class="selected-path">{file}</div>', unsafe_allow_html=True)
-                    st.image(Image.open(file), use_container_width=True)
-        else:
-            st.markdown(f'<div class="selected-path">{files[0]}</div>', unsafe_allow_html=True)
-            st.image(Image.open(files[0]), use_container_width=True)
-    elif violin_genes:
-        st.info("请从左侧选择基因")
+    preview_pane("Violin", violin_genes, violin_gene_map, VIOLIN_DIR, VIOLIN_DISPLAY_WIDTH)
+
+if compare_genes:
+    st.markdown("---")
+    st.subheader(f"{compare_type} 多基因对比")
+    width = tile_width(compare_columns)
+    if compare_type == "UMAP":
+        items = grid_items(compare_genes, umap_gene_map, UMAP_DIR, width)
     else:
-        st.warning("Violin 目录中没有图片")
-        
+        items = grid_items(compare_genes, violin_gene_map, VIOLIN_DIR, width)
+    render_tile_grid(items, get_tile_loader(), compare_columns, width)
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 基因表达矩阵（基因 × 细胞，CSR格式），小提琴图摘要和UMAP渲染的共同输入
+#
+# 目录布局：
+#   genes.txt   每行一个基因名（行顺序）
+#   cells.txt   每行一个细胞条码（列顺序）
+#   data.npy    float32 非零表达值
+#   indices.npy int32   非零值所在的细胞列号
+#   indptr.npy  int64   每个基因在 data/indices 中的起止位置
+#   meta.json   {"n_genes", "n_cells", "nnz"}
+# 数组以内存映射方式打开，只读取被访问的基因行。
+FORMAT_VERSION = 1
+
+
+class ExpressionMatrix:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.genes = read_lines(os.path.join(path, "genes.txt"))
+        self.cells = read_lines(os.path.join(path, "cells.txt"))
+        self.n_cells = self.meta["n_cells"]
+        self.gene_index = {gene: i for i, gene in enumerate(self.genes)}
+        self.data = np.load(os.path.join(path, "data.npy"), mmap_mode="r")
+        self.indices = np.load(os.path.join(path, "indices.npy"), mmap_mode="r")
+        self.indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+
+    def __contains__(self, gene):
+        return gene in self.gene_index
+
+    def __len__(self):
+        return len(self.genes)
+
+    # 某基因的非零项 (细胞列号, 表达值)
+    def row(self, gene):
+        i = self.gene_index[gene]
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return np.asarray(self.indices[start:end]), np.asarray(self.data[start:end])
+
+    # 某基因在全部细胞上的表达（稠密 float32）
+    def dense_row(self, gene):
+        cols, values = self.row(gene)
+        out = np.zeros(self.n_cells, dtype=np.float32)
+        out[cols] = values
+        return out
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def write_lines(path, values):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(f"{v}\n" for v in values)
+
+
+# 由坐标格式 (基因行号, 细胞列号, 值) 写出CSR目录；重复坐标的值相加
+def write_matrix(path, genes, cells, rows, cols, values):
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float32)
+    keep = values != 0
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+
+    order = np.lexsort((cols, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    if len(rows):
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        starts = np.flatnonzero(first)
+        values = np.add.reduceat(values, starts)
+        rows, cols = rows[starts], cols[starts]
+    indptr = np.zeros(len(genes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(genes)), out=indptr[1:])
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "data.npy"), values.astype(np.float32))
+    np.save(os.path.join(path, "indices.npy"), cols.astype(np.int32))
+    np.save(os.path.join(path, "indptr.npy"), indptr)
+    write_lines(os.path.join(path, "genes.txt"), genes)
+    write_lines(os.path.join(path, "cells.txt"), cells)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT_VERSION, "n_genes": len(genes), "n_cells": len(cells), "nnz": len(values)}, f)
+    return path
+
+
+# 读取 MatrixMarket 坐标格式（如 Seurat/10x 导出的 matrix.mtx，行为基因、列为细胞）
+def read_mtx(mtx_path):
+    with open(mtx_path, encoding="utf-8") as f:
+        header = f.readline()
+        if not header.startswith("%%MatrixMarket") or "coordinate" not in header:
+            raise ValueError(f"{mtx_path} 不是 MatrixMarket 坐标格式")
+        line = f.readline()
+        while line.startswith("%"):
+            line = f.readline()
+        n_rows, n_cols, _ = (int(x) for x in line.split())
+        entries = pd.read_csv(f, sep=r"\s+", header=None, names=["row", "col", "value"],
+                              dtype={"row": np.int64, "col": np.int64, "value": np.float32})
+    return (n_rows, n_cols), entries["row"].to_numpy() - 1, entries["col"].to_numpy() - 1, entries["value"].to_numpy()
+
+
+# features.tsv / barcodes.tsv：取第一列（10x 的 features.tsv 第二列是基因符号时用 column=1）
+def read_names(path, column=0):
+    return pd.read_csv(path, sep="\t", header=None, dtype=str).iloc[:, column].tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把表达矩阵转换为内存映射的CSR目录")
+    parser.add_argument("output", help="输出目录")
+    parser.add_argument("--mtx", help="MatrixMarket 文件（基因 × 细胞）")
+    parser.add_argument("--features", help="基因名文件（与 --mtx 一起使用）")
+    parser.add_argument("--feature-column", type=int, default=0)
+    parser.add_argument("--barcodes", help="细胞条码文件（与 --mtx 一起使用）")
+    parser.add_argument("--csv", help="稠密CSV：第一列为基因名，其余列为细胞")
+    args = parser.parse_args(argv)
+
+    if args.mtx:
+        if not (args.features and args.barcodes):
+            parser.error("--mtx 需要同时指定 --features 和 --barcodes")
+        shape, rows, cols, values = read_mtx(args.mtx)
+        genes = read_names(args.features, args.feature_column)
+        cells = read_names(args.barcodes)
+        if (len(genes), len(cells)) != shape:
+            parser.error(f"矩阵形状 {shape} 与基因数 {len(genes)}、细胞数 {len(cells)} 不一致")
+    elif args.csv:
+        df = pd.read_csv(args.csv, index_col=0)
+        genes, cells = df.index.astype(str).tolist(), df.columns.astype(str).tolist()
+        rows, cols = np.nonzero(df.to_numpy())
+        values = df.to_numpy()[rows, cols]
+    else:
+        parser.error("需要 --mtx 或 --csv")
+
+    write_matrix(args.output, genes, cells, rows, cols, values)
+    print(f"{len(genes)} 个基因 × {len(cells)} 个细胞，非零 {len(values)} -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import json
+import os
+import zipfile
+
+from werkzeug.security import safe_join
+
+from mapping_index import NOT_FOUND
+
+# 批量导出：多个 plotType × 基因 × meta 一次解析，流式返回ZIP或NDJSON清单
+#
+# ZIP以流方式生成：zipfile写入一个不可seek的缓冲区，每写一块就取走，
+# 文件按 CHUNK_SIZE 分块读取，内存占用与图片数量和大小无关。
+# 图片本身已压缩（PNG/PDF），存储时不再压缩。
+CHUNK_SIZE = 256 * 1024
+MAX_EXPORT_ITEMS = 20000
+MANIFEST_NAME = "manifest.ndjson"
+
+STATUS_OK = "ok"
+STATUS_NOT_FOUND = "not_found"          # 映射中没有该组合
+STATUS_FILE_MISSING = "file_missing"    # 映射有记录，但文件不存在
+
+
+# zipfile 的输出目标：只追加，不支持seek/tell，写入的数据由生成器取走
+class _StreamSink:
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# 一次性解析全部组合，返回条目列表（按输入顺序，重复组合只保留一次）
+def resolve_items(index, plot_types, genes, metas):
+    items = []
+    seen = set()
+    for plot_type in plot_types:
+        for gene in genes:
+            for meta in metas or [""]:
+                key = (plot_type, gene, meta)
+                if key in seen:
+                    continue
+                seen.add(key)
+                path = index.lookup(plot_type, gene, meta)
+                item = {"plotType": plot_type, "gene": gene, "cellType": meta}
+                if path is None or path == NOT_FOUND:
+                    item["status"] = STATUS_NOT_FOUND
+                else:
+                    item["status"] = STATUS_OK
+                    item["path"] = path
+                items.append(item)
+    return items
+
+
+# 条目对应的磁盘文件；路径越出 root 或文件不存在时返回None
+def item_file(root, item):
+    if item["status"] != STATUS_OK:
+        return None
+    full_path = safe_join(root, item["path"])
+    if full_path is None or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+
+def _ndjson_line(record):
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+# NDJSON清单：每行一个条目，包含静态文件URL；缺失的组合逐条标出
+def iter_ndjson(items, root, url_for_item):
+    for item in items:
+        record = dict(item)
+        if item["status"] == STATUS_OK:
+            if item_file(root, item) is None:
+                record["status"] = STATUS_FILE_MISSING
+            else:
+                record.update(url_for_item(item["path"]))
+        yield _ndjson_line(record)
+
+
+# 流式ZIP：同一文件只打包一次，最后写入包含每个条目状态的 manifest.ndjson
+def iter_zip(items, root, chunk_size=CHUNK_SIZE):
+    sink = _StreamSink()
+    archived = {}  # path -> 归档内文件名
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for item in items:
+            if item["status"] != STATUS_OK or item["path"] in archived:
+                continue
+            full_path = item_file(root, item)
+            if full_path is None:
+                continue
+            arcname = item["path"].replace(os.sep, "/").lstrip("/")
+            info = zipfile.ZipInfo.from_file(full_path, arcname)
+            with open(full_path, "rb") as src, zf.open(info, "w") as dst:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            archived[item["path"]] = arcname
+            yield sink.drain()
+
+        manifest = []
+        for item in items:
+            record = dict(item)
+            if item["status"] == STATUS_OK:
+                if item["path"] in archived:
+                    record["file"] = archived[item["path"]]
+                else:
+                    record["status"] = STATUS_FILE_MISSING
+            manifest.append(_ndjson_line(record))
+        zf.writestr(MANIFEST_NAME, b"".join(manifest))
+    yield sink.drain()
@@ -0,0 +1,39 @@
+import hashlib
+import os
+import threading
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# 文件内容哈希，按绝对路径记忆 (mtime, 大小, 哈希)：文件未变时不再重新读取，
+# 变化后替换该路径的旧记录，记忆的条目数不超过出现过的文件数
+class FileHashes:
+    def __init__(self):
+        self._hashes = {}  # 绝对路径 -> (mtime_ns, 大小, 哈希)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __call__(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached is not None and cached[:2] == stamp:
+            return cached[2]
+        digest = hash_file(path)
+        with self._lock:
+            self._hashes[key] = (*stamp, digest)
+        return digest
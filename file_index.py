@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+
+DEFAULT_DB_PATH = os.environ.get("MAGE_FILE_INDEX", ".file_index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    gene TEXT
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_dir_name ON files(dir, name);
+CREATE INDEX IF NOT EXISTS files_gene ON files(gene);
+"""
+
+
+# 从路径中提取基因名称
+def extract_gene_name(path):
+    filename = os.path.splitext(os.path.basename(path))[0]
+    # 尝试从文件名中提取基因名称（去掉后缀）
+    return filename.split("_")[0] if "_" in filename else filename
+
+
+# 子树范围查询的上下界：path 以 root/ 开头等价于 root/ <= path < root0
+# （不用LIKE，避免路径中的 _ 和 % 被当作通配符）
+def subtree_bounds(root):
+    prefix = root.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+# 持久化的文件索引（SQLite），记录路径、大小、mtime和基因名
+#
+# 刷新时只对每个目录做一次stat：目录mtime未变说明其中没有增删改名，
+# 直接沿用索引中的文件和子目录；变化的目录才重新列出内容。
+# 因此刷新耗时取决于变化的目录数，而不是图片总数。
+class FileIndex:
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    # 删除某目录及其所有子目录、文件的记录
+    def _forget_dir(self, cur, path):
+        lo, hi = subtree_bounds(path)
+        cur.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, lo, hi))
+        cur.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, lo, hi))
+
+    # 重新列出一个目录的内容，返回子目录列表
+    def _rescan_dir(self, cur, path, mtime_ns):
+        old_files = {row[0] for row in cur.execute("SELECT path FROM files WHERE dir = ?", (path,))}
+        old_dirs = {row[0] for row in cur.execute("SELECT path FROM dirs WHERE parent = ?", (path,))}
+        subdirs, rows = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue  # 跳过 .pyramid 等生成目录
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    rows.append((entry.path, path, entry.name, stat.st_size, stat.st_mtime_ns,
+                                 extract_gene_name(entry.name)))
+
+        cur.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+        gone = old_files - {row[0] for row in rows}
+        cur.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+        for sub in old_dirs - set(subdirs):
+            self._forget_dir(cur, sub)
+        cur.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, "
+                    "(SELECT parent FROM dirs WHERE path = ?), ?)", (path, path, mtime_ns))
+        return subdirs
+
+    # 增量刷新 root 下的索引，返回 {"dirs": 检查的目录数, "changed": 重新列出的目录数}
+    def refresh(self, root):
+        root = os.path.normpath(root)
+        stats = {"dirs": 0, "changed": 0}
+        with self._lock:
+            cur = self._conn.cursor()
+            if not os.path.isdir(root):
+                self._forget_dir(cur, root)
+                self._conn.commit()
+                return stats
+
+            cur.execute("INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, NULL, NULL)", (root,))
+            stack = [root]
+            while stack:
+                path = stack.pop()
+                stats["dirs"] += 1
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    self._forget_dir(cur, path)
+                    continue
+                row = cur.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (path,)).fetchone()
+                if row and row[0] == mtime_ns:
+                    subdirs = [r[0] for r in cur.execute("SELECT path FROM dirs WHERE parent = ?", (path,))]
+                else:
+                    stats["changed"] += 1
+                    subdirs = self._rescan_dir(cur, path, mtime_ns)
+                    for sub in subdirs:
+                        cur.execute("INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, NULL)",
+                                    (sub, path))
+                stack.extend(subdirs)
+            self._conn.commit()
+        return stats
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # root 下的全部文件路径，可按扩展名过滤
+    def files(self, root, extensions=None):
+        root = os.path.normpath(root)
+        rows = self._query("SELECT path FROM files WHERE dir = ? OR (dir >= ? AND dir < ?) ORDER BY path",
+                           (root, *subtree_bounds(root)))
+        paths = [r[0] for r in rows]
+        if extensions:
+            paths = [p for p in paths if p.lower().endswith(tuple(extensions))]
+        return paths
+
+    # 基因 -> 文件路径列表
+    def gene_map(self, root, extensions=None):
+        root = os.path.normpath(root)
+        rows = self._query("SELECT gene, path FROM files WHERE dir = ? OR (dir >= ? AND dir < ?) ORDER BY path",
+                           (root, *subtree_bounds(root)))
+        gene_map = {}
+        for gene, path in rows:
+            if extensions and not path.lower().endswith(tuple(extensions)):
+                continue
+            gene_map.setdefault(gene, []).append(path)
+        return gene_map
+
+    # 目录中的文件数；recursive 时包括所有子目录
+    def count_files(self, path, recursive=False):
+        path = os.path.normpath(path)
+        if recursive:
+            return self._query("SELECT COUNT(*) FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)",
+                               (path, *subtree_bounds(path)))[0][0]
+        return self._query("SELECT COUNT(*) FROM files WHERE dir = ?", (path,))[0][0]
+
+    # 直接子目录 [(路径, 子树中的文件数)]，按名称排序
+    def subdirs(self, path):
+        path = os.path.normpath(path)
+        rows = self._query("SELECT path FROM dirs WHERE parent = ? ORDER BY path", (path,))
+        return [(sub, self.count_files(sub, recursive=True)) for (sub,) in rows]
+
+    # 目录中按名称排序的一页文件名（由 (dir, name) 索引直接取出，不读取整个目录）
+    def list_files(self, path, offset=0, limit=-1):
+        path = os.path.normpath(path)
+        rows = self._query("SELECT name FROM files WHERE dir = ? ORDER BY name LIMIT ? OFFSET ?",
+                           (path, limit, offset))
+        return [r[0] for r in rows]
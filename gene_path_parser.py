@@ -0,0 +1,66 @@
+from io import StringIO
+
+import pandas as pd
+
+from mapping_store import detect_columns
+
+
+# 按列名（大小写不敏感）或列序号识别列，找不到时用 detect_columns 识别出的位置
+def resolve_column(columns, column, default_idx):
+    if isinstance(column, str):
+        for name in columns:
+            if str(name).strip().lower() == column.strip().lower():
+                return name
+    if isinstance(column, int) and 0 <= column < len(columns):
+        return columns[column]
+    return columns[min(default_idx, len(columns) - 1)]
+
+
+# 把CSV内容解析为 {gene: path}，全部使用整列操作，不再逐行 iterrows
+# 返回 (gene_paths, dropped)，dropped 为被忽略的重复行 [(gene, path), ...]
+# 列识别与 MappingIndex / .midx 编译相同（mapping_store.detect_columns）；同一基因出现多次时
+# 与 MappingStore.gene_paths 相同，取 (gene, meta) 排序最前的一条，因此有无 .midx 文件时显示的图片相同
+def parse_gene_paths(csv_content, gene_col="gene", path_col="image_path", sep=",", has_header=True):
+    df = pd.read_csv(
+        StringIO(csv_content),
+        sep=sep,
+        header=0 if has_header else None,
+        dtype=str,
+        keep_default_na=False,
+    )
+    if df.empty or len(df.columns) == 0:
+        return {}, []
+
+    columns = list(df.columns)
+    gene_idx, meta_idx, path_idx = detect_columns([str(c) for c in columns]) if has_header else (0, None, 1)
+    gene_col_name = resolve_column(columns, gene_col, gene_idx)
+    path_col_name = resolve_column(columns, path_col, path_idx)
+
+    frame = pd.DataFrame({
+        "gene": df[gene_col_name].str.strip(),
+        "meta": df[columns[meta_idx]].str.strip() if meta_idx is not None else "",
+        "path": df[path_col_name].str.strip(),
+    })
+
+    # 过滤空值
+    frame = frame[(frame["gene"] != "") & (frame["path"] != "")]
+
+    # 重复基因：按 (gene, meta) 稳定排序后保留第一条，记录被忽略的行
+    frame = frame.sort_values(["gene", "meta"], kind="stable")
+    duplicated = frame["gene"].duplicated(keep="first")
+    dropped = list(zip(frame["gene"][duplicated].tolist(), frame["path"][duplicated].tolist()))
+
+    kept = frame[~duplicated]
+    gene_paths = dict(zip(kept["gene"].tolist(), kept["path"].tolist()))
+    return gene_paths, dropped
+
+
+# 生成重复基因的提示文本
+def describe_dropped(dropped, limit=10):
+    if not dropped:
+        return ""
+    genes = sorted({gene for gene, _ in dropped})
+    shown = ", ".join(genes[:limit])
+    if len(genes) > limit:
+        shown += f" 等{len(genes)}个基因"
+    return f"映射文件中有 {len(dropped)} 条重复基因记录被忽略（每个基因保留Meta排序最前的一条）: {shown}"
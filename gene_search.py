@@ -0,0 +1,113 @@
+import bisect
+from collections import defaultdict
+
+NGRAM_SIZES = (1, 2, 3)
+DEFAULT_LIMIT = 100
+
+
+def ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+# 文本本身及删除一个字符后的全部变体（SymSpell风格的拼写容错键）
+def deletion_variants(text):
+    return {text} | {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+# 有上限的编辑距离，超过 max_distance 时提前返回 max_distance + 1
+def bounded_levenshtein(a, b, max_distance):
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(cost)
+            row_min = min(row_min, cost)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+# 基因搜索索引（每个基因目录版本构建一次）
+#
+# - 前缀查询：小写基因名的有序数组 + 二分查找
+# - 子串查询：1/2/3-gram 倒排表求交集后再校验
+# - 拼写容错：删除一个字符的变体索引取候选（可覆盖替换、换位等），按编辑距离排序
+# 返回按 完全匹配 > 前缀 > 子串 > 近似 排序的前 limit 个结果。
+class GeneSearchIndex:
+    def __init__(self, genes):
+        self.genes = list(genes)
+        self._lower = [g.lower() for g in self.genes]
+        self._sorted = sorted((low, i) for i, low in enumerate(self._lower))
+        self._sorted_keys = [low for low, _ in self._sorted]
+        self._postings = defaultdict(set)
+        self._deletes = defaultdict(set)
+        for i, low in enumerate(self._lower):
+            for n in NGRAM_SIZES:
+                for gram in ngrams(low, n):
+                    self._postings[gram].add(i)
+            for variant in deletion_variants(low):
+                self._deletes[variant].add(i)
+
+    def __len__(self):
+        return len(self.genes)
+
+    # 以 prefix 开头的基因下标（按字母顺序）
+    def _prefix_ids(self, prefix):
+        lo = bisect.bisect_left(self._sorted_keys, prefix)
+        hi = bisect.bisect_left(self._sorted_keys, prefix + "\uffff")
+        return [i for _, i in self._sorted[lo:hi]]
+
+    # 包含 query 的基因下标
+    def _substring_ids(self, query):
+        n = min(len(query), max(NGRAM_SIZES))
+        grams = sorted(ngrams(query, n), key=lambda g: len(self._postings.get(g, ())))
+        if not grams:
+            return set()
+        candidates = set(self._postings.get(grams[0], ()))
+        for gram in grams[1:]:
+            candidates &= self._postings.get(gram, set())
+            if not candidates:
+                return candidates
+        if len(query) > n:
+            candidates = {i for i in candidates if query in self._lower[i]}
+        return candidates
+
+    # 拼写容错候选：与查询共享删除变体的基因，按编辑距离排序
+    def _fuzzy_ids(self, query, exclude, limit, max_distance):
+        candidates = set()
+        for variant in deletion_variants(query):
+            candidates |= self._deletes.get(variant, set())
+        scored = []
+        for i in candidates - exclude:
+            distance = bounded_levenshtein(query, self._lower[i], max_distance)
+            if distance <= max_distance:
+                scored.append((distance, len(self._lower[i]), self._lower[i], i))
+        scored.sort()
+        return [i for *_, i in scored[:limit]]
+
+    # 搜索，返回排好序的基因名列表；空查询返回全部基因（按字母顺序）
+    def search(self, query, limit=DEFAULT_LIMIT, fuzzy=True, max_distance=2):
+        query = query.strip().lower()
+        if not query:
+            return [self.genes[i] for _, i in self._sorted]
+
+        prefix = self._prefix_ids(query)
+        seen = set(prefix)
+        # 前缀匹配：完全匹配在前，其余按长度、字母顺序
+        ranked = sorted(prefix, key=lambda i: (self._lower[i] != query, len(self._lower[i]), self._lower[i]))
+
+        if len(ranked) < limit:
+            substring = self._substring_ids(query) - seen
+            ranked += sorted(substring, key=lambda i: (self._lower[i].find(query), len(self._lower[i]),
+                                                       self._lower[i]))
+            seen |= substring
+
+        if fuzzy and len(ranked) < limit:
+            ranked += self._fuzzy_ids(query, seen, limit - len(ranked), max_distance)
+
+        return [self.genes[i] for i in ranked[:limit]]
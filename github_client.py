@@ -0,0 +1,170 @@
+import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GITHUB_API_BASE = "https://api.github.com"
+GITHUB_RAW_BASE = "https://raw.githubusercontent.com"
+DEFAULT_RATE_RESET = 60  # 限流响应没有 X-RateLimit-Reset 时假定的重置等待（秒）
+
+
+# 限流耗尽、且距离重置超过 max_rate_wait 秒时抛出，调用线程不阻塞等待
+class RateLimitExceeded(requests.exceptions.RequestException):
+    def __init__(self, reset):
+        self.reset = reset
+        super().__init__(f"GitHub API 已达到限流上限，约 {max(0, int(reset - time.time()))} 秒后恢复")
+
+
+# 共享的GitHub客户端
+#
+# - requests.Session + 连接池，复用TCP/TLS连接（keep-alive）
+# - 对 429/5xx 自动重试并指数退避，遵守 Retry-After
+# - 根据 X-RateLimit-Remaining / X-RateLimit-Reset 在限流时等待重置（最多 max_rate_wait 秒，
+#   更久时抛出 RateLimitExceeded；Streamlit页面传入0，不在脚本线程中等待）
+# - 有界线程池，用于并发预取
+class GitHubClient:
+    def __init__(self, owner, repo, branch="main", token=None,
+                 api_base=GITHUB_API_BASE, raw_base=GITHUB_RAW_BASE,
+                 pool_size=16, max_workers=8, retries=3, backoff=0.5,
+                 timeout=30, max_rate_wait=60):
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.token = token
+        self.api_base = api_base.rstrip("/")
+        self.raw_base = raw_base.rstrip("/")
+        self.timeout = timeout
+        self.max_rate_wait = max_rate_wait
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="github")
+        self._rate_lock = threading.Lock()
+        self._rate_reset = None  # 限流耗尽时的重置时间（epoch秒）
+
+    # API请求头
+    def headers(self):
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if self.token:
+            headers["Authorization"] = f"token {self.token}"
+        return headers
+
+    # 限流耗尽时等待到重置时间；需要等待超过 max_rate_wait 秒时抛出 RateLimitExceeded
+    def _wait_for_rate_limit(self):
+        with self._rate_lock:
+            reset = self._rate_reset
+        if reset is None:
+            return
+        delay = reset - time.time()
+        if delay > self.max_rate_wait:
+            raise RateLimitExceeded(reset)
+        if delay > 0:
+            time.sleep(delay)
+        with self._rate_lock:
+            if self._rate_reset == reset:
+                self._rate_reset = None
+
+    def _record_rate_limit(self, response):
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                reset = float(response.headers.get("X-RateLimit-Reset", ""))
+            except ValueError:
+                reset = time.time() + DEFAULT_RATE_RESET
+            with self._rate_lock:
+                self._rate_reset = reset
+            return True
+        return False
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        headers = self.headers()
+        headers.update(kwargs.pop("headers", None) or {})
+
+        self._wait_for_rate_limit()
+        response = self.session.request(method, url, headers=headers, **kwargs)
+        # 主限流（403 + Remaining: 0）不在urllib3重试范围内，等待重置后重试一次
+        if self._record_rate_limit(response) and response.status_code in (403, 429):
+            response.close()
+            self._wait_for_rate_limit()
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            self._record_rate_limit(response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    # contents API地址
+    def contents_url(self, path):
+        return f"{self.api_base}/repos/{self.owner}/{self.repo}/contents/{path}?ref={self.branch}"
+
+    # 原始文件地址
+    def raw_url(self, path):
+        return f"{self.raw_base}/{self.owner}/{self.repo}/{self.branch}/{path}"
+
+    # 通过contents API读取文件字节，失败时抛出 requests 异常
+    def get_file_bytes(self, path):
+        response = self.get(self.contents_url(path))
+        response.raise_for_status()
+        return base64.b64decode(response.json().get("content", ""))
+
+    # 通过contents API列出目录
+    def get_directory(self, path):
+        response = self.get(self.contents_url(path))
+        response.raise_for_status()
+        return response.json()
+
+    # 提交API地址（ref 可以是分支名或SHA）
+    def commit_url(self, ref):
+        return f"{self.api_base}/repos/{self.owner}/{self.repo}/commits/{ref}"
+
+    # git trees API地址（tree_ish 可以是分支名或树/提交SHA）
+    def tree_url(self, tree_ish):
+        return f"{self.api_base}/repos/{self.owner}/{self.repo}/git/trees/{tree_ish}"
+
+    # 通过git trees API读取目录树，recursive时一次请求返回全部条目（过大时 truncated 为真）
+    def get_tree(self, tree_ish=None, recursive=True):
+        response = self.get(self.tree_url(tree_ish or self.branch), params={"recursive": "1"} if recursive else None)
+        response.raise_for_status()
+        return response.json()
+
+    # HEAD检查原始文件是否存在
+    def exists(self, path):
+        response = self.head(self.raw_url(path), allow_redirects=True)
+        return response.status_code == 200
+
+    # 在线程池中执行，返回Future
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    # 并发执行 fn(item)，返回 {item: 结果或异常}
+    def map(self, fn, items):
+        futures = {item: self.submit(fn, item) for item in items}
+        results = {}
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                results[item] = e
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
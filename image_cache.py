@@ -0,0 +1,187 @@
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+DEFAULT_CACHE_DIR = os.environ.get("MAGE_IMAGE_CACHE_DIR", ".image_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("MAGE_IMAGE_CACHE_BYTES", 512 * 1024 * 1024))
+DEFAULT_MAX_AGE = int(os.environ.get("MAGE_IMAGE_CACHE_MAX_AGE", 300))
+DEFAULT_SAVE_INTERVAL = float(os.environ.get("MAGE_IMAGE_CACHE_SAVE_INTERVAL", 30))
+CHUNK_SIZE = 64 * 1024
+
+
+# 本地内容寻址图片缓存
+#
+# 索引: key（owner/repo/branch/path）-> {sha256, etag, size, last_access, validated}
+# 数据: blobs/<sha256前两位>/<sha256>，相同内容的文件只存一份
+#
+# 在 max_age 秒内直接返回本地文件；超过后带 If-None-Match 重新验证，
+# 304 时只花一次往返。总大小超过 max_bytes 时按最近最少使用淘汰。
+# 命中和304只更新内存中的访问/验证时间，最多每 save_interval 秒写一次索引（退出时写入剩余的）；
+# 新增和淘汰条目时立即写入。
+class ImageCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age=DEFAULT_MAX_AGE, session=None, timeout=30, save_interval=DEFAULT_SAVE_INTERVAL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.session = session or requests
+        self.timeout = timeout
+        self.save_interval = save_interval
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        self._index = self._load_index()
+        self._dirty = False
+        self._saved = time.monotonic()
+        atexit.register(self._flush_at_exit)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    # 原子写入索引文件（调用方需持有锁）
+    def _save_index(self):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path)
+        self._dirty = False
+        self._saved = time.monotonic()
+
+    # 写入尚未保存的访问/验证时间
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except OSError:
+            pass  # 缓存目录已被删除
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest)
+
+    def _read_blob(self, entry):
+        try:
+            with open(self._blob_path(entry["sha256"]), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    # 边下载边计算哈希写入临时文件，不在内存中拼接整个响应
+    def _store_response(self, key, response):
+        hasher = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        digest = hasher.hexdigest()
+        blob = self._blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(tmp, blob)
+        with open(blob, "rb") as f:
+            data = f.read()
+
+        now = time.time()
+        with self._lock:
+            self._index[key] = {
+                "sha256": digest,
+                "etag": response.headers.get("ETag"),
+                "size": size,
+                "last_access": now,
+                "validated": now,
+            }
+            self._evict()
+            self._save_index()
+        return data
+
+    # 按 last_access 淘汰，直到总大小不超过预算（调用方需持有锁）
+    def _evict(self):
+        sizes = {e["sha256"]: e["size"] for e in self._index.values()}
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(self._index.items(), key=lambda kv: kv[1]["last_access"])
+        for key, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            del self._index[key]
+            digest = entry["sha256"]
+            if any(e["sha256"] == digest for e in self._index.values()):
+                continue
+            total -= sizes[digest]
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, key, validated=False):
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return
+            entry["last_access"] = time.time()
+            if validated:
+                entry["validated"] = entry["last_access"]
+            self._dirty = True
+            if time.monotonic() - self._saved >= self.save_interval:
+                self._save_index()
+
+    # 获取 url 对应的内容；key 用于标识缓存条目（如 owner/repo/branch/path）
+    def fetch(self, key, url, headers=None):
+        entry = self._index.get(key)
+        data = self._read_blob(entry) if entry else None
+
+        if data is not None and time.time() - entry["validated"] < self.max_age:
+            self._touch(key)
+            return data
+
+        request_headers = dict(headers or {})
+        if data is not None and entry.get("etag"):
+            request_headers["If-None-Match"] = entry["etag"]
+
+        try:
+            response = self.session.get(url, headers=request_headers, stream=True, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            # 网络不可用时退回到本地副本
+            if data is not None:
+                return data
+            raise
+
+        with response:
+            if response.status_code == 304 and data is not None:
+                self._touch(key, validated=True)
+                return data
+            response.raise_for_status()
+            return self._store_response(key, response)
+
+    # 清空缓存
+    def clear(self):
+        with self._lock:
+            for entry in self._index.values():
+                try:
+                    os.remove(self._blob_path(entry["sha256"]))
+                except FileNotFoundError:
+                    pass
+            self._index = {}
+            self._save_index()
+
+    def total_bytes(self):
+        return sum({e["sha256"]: e["size"] for e in self._index.values()}.values())
+
+    def __len__(self):
+        return len(self._index)
@@ -0,0 +1,308 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageCms
+
+# 图片无损重新压缩与格式转换
+#
+# 每张PNG在子进程中：去掉全不透明的透明通道、颜色不超过256种时转为调色板（精确映射，不做抖动）、
+# 去掉EXIF/文本/dpi等元数据（非sRGB的ICC配置保留，否则颜色会变），以最高zlib级别重新压缩；
+# 可选生成无损WebP和（有损的）AVIF。每个结果都解码后与原图逐像素比较，不一致的无损结果丢弃；
+# 比原图大的结果也丢弃。
+# 输出与清单放在 VARIANT_DIR 下，清单记录每个变体的路径、字节数、MIME类型、是否无损和解码耗时，
+# 服务端按客户端接受的格式选择最小的无损变体（有损的AVIF需 MAGE_SERVE_LOSSY=1 才会发送）。
+# --in-place 时用优化后的PNG替换原图。
+VARIANT_DIR = ".optimized"
+MANIFEST_NAME = "manifest.json"
+IMAGE_EXTENSIONS = (".png",)
+MIMETYPES = {"png": "image/png", "webp": "image/webp", "avif": "image/avif"}
+WEBP_METHOD = int(os.environ.get("MAGE_WEBP_METHOD", "6"))  # 0-6，越大越慢、越小
+AVIF_QUALITY = int(os.environ.get("MAGE_AVIF_QUALITY", "80"))
+SERVE_LOSSY = os.environ.get("MAGE_SERVE_LOSSY", "").lower() in ("1", "true", "yes")
+DECODE_RUNS = 3
+
+
+def manifest_path(root):
+    return os.path.join(root, VARIANT_DIR, MANIFEST_NAME)
+
+
+# 变体文件路径：<root>/.optimized/<相对路径去后缀>.<格式>
+def variant_path(root, rel_path, fmt):
+    stem = os.path.splitext(rel_path)[0]
+    return os.path.join(root, VARIANT_DIR, f"{stem}.{fmt}")
+
+
+# 解码耗时（毫秒，多次取最小值）
+def decode_ms(data):
+    best = None
+    for _ in range(DECODE_RUNS):
+        start = time.perf_counter()
+        with Image.open(io.BytesIO(data)) as im:
+            im.load()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2)
+
+
+def pixels(image):
+    return np.asarray(image.convert("RGBA"))
+
+
+# 不改变任何像素的最小模式：去掉全不透明的透明通道，灰度图转L，颜色不超过256种时转调色板
+def reduce_mode(image):
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        return image
+    if image.mode in ("RGBA", "LA") and image.getchannel("A").getextrema() == (255, 255):
+        image = image.convert(image.mode[:-1])
+    if image.mode == "RGB":
+        r, g, b = image.split()
+        if r.tobytes() == g.tobytes() == b.tobytes():
+            image = r
+    if image.mode in ("L", "LA"):
+        return image
+
+    array = np.asarray(image)
+    channels = array.shape[2]
+    packed = np.zeros(array.shape[:2], dtype=np.uint32)
+    for channel in range(channels):
+        packed = (packed << 8) | array[:, :, channel]
+    colors, index = np.unique(packed, return_inverse=True)
+    if len(colors) > 256:
+        return image
+    palette = [(int(color) >> (8 * (channels - 1 - channel))) & 0xFF
+               for color in colors for channel in range(channels)]
+    reduced = Image.fromarray(index.reshape(array.shape[:2]).astype(np.uint8), "P")
+    reduced.putpalette(bytes(palette), rawmode="RGBA" if channels == 4 else "RGB")
+    return reduced
+
+
+# 需要保留的ICC配置：sRGB可以去掉（浏览器默认按sRGB显示），其他色彩空间保留
+def kept_icc_profile(image):
+    icc = image.info.get("icc_profile")
+    if not icc:
+        return None
+    try:
+        description = ImageCms.getProfileDescription(ImageCms.ImageCmsProfile(io.BytesIO(icc)))
+    except (OSError, ImageCms.PyCMSError):
+        return icc
+    return None if "sRGB" in description else icc
+
+
+def encode(image, fmt, icc_profile=None):
+    buffer = io.BytesIO()
+    options = {"icc_profile": icc_profile} if icc_profile else {}
+    if fmt == "png":
+        image.save(buffer, "PNG", optimize=True, **options)
+    elif fmt == "webp":
+        image.save(buffer, "WEBP", lossless=True, quality=100, method=WEBP_METHOD, **options)
+    elif fmt == "avif":
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        image.save(buffer, "AVIF", quality=AVIF_QUALITY, **options)
+    return buffer.getvalue()
+
+
+# 优化单张图片（在子进程中运行）
+def build_entry(root, rel_path, formats, in_place=False):
+    src = os.path.join(root, rel_path)
+    source_mtime = os.stat(src).st_mtime_ns
+    with open(src, "rb") as f:
+        original = f.read()
+    with Image.open(io.BytesIO(original)) as im:
+        im.load()
+        icc_profile = kept_icc_profile(im)
+        reference = pixels(im)
+        reduced = reduce_mode(im)
+    entry = {
+        "width": reduced.width,
+        "height": reduced.height,
+        "formats": sorted(formats),
+        "variants": {"original": {"path": rel_path, "bytes": len(original), "mimetype": "image/png",
+                                  "lossless": True, "decode_ms": decode_ms(original)}},
+    }
+    entry["source"] = dict(entry["variants"]["original"], mtime=source_mtime)
+
+    for fmt in ("png",) + tuple(f for f in ("webp", "avif") if f in formats):
+        data = encode(reduced, fmt, icc_profile)
+        lossless = fmt != "avif"
+        if len(data) >= len(original):
+            continue
+        if lossless:
+            with Image.open(io.BytesIO(data)) as check:
+                if not np.array_equal(pixels(check), reference):
+                    continue
+        if fmt == "png" and in_place:
+            tmp = src + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, src)
+            entry["variants"]["original"].update(bytes=len(data), decode_ms=decode_ms(data))
+            original = data
+            continue
+        out = variant_path(root, rel_path, fmt)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "wb") as f:
+            f.write(data)
+        entry["variants"][fmt] = {"path": os.path.relpath(out, root), "bytes": len(data),
+                                  "mimetype": MIMETYPES[fmt], "lossless": lossless, "decode_ms": decode_ms(data)}
+
+    stat = os.stat(src)
+    entry["mtime"], entry["bytes"] = stat.st_mtime_ns, stat.st_size
+    return rel_path, entry
+
+
+# 列出目录下的全部PNG（跳过隐藏目录，包括输出目录）
+def list_images(root):
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(dirpath, file), root)
+
+
+def load_manifest(root):
+    try:
+        with open(manifest_path(root), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def remove_variants(root, entry):
+    for variant in entry["variants"].values():
+        if os.path.dirname(variant["path"]).split(os.sep)[0] == VARIANT_DIR:
+            try:
+                os.remove(os.path.join(root, variant["path"]))
+            except FileNotFoundError:
+                pass
+
+
+# 增量处理：只处理新增、修改过或需要新格式的图片，并删除已消失图片的变体
+def optimize_images(root, formats=(), in_place=False, workers=None):
+    formats = sorted(set(formats))
+    manifest = load_manifest(root)
+    todo = []
+    current = set()
+    for rel_path in list_images(root):
+        current.add(rel_path)
+        entry = manifest.get(rel_path)
+        stat = os.stat(os.path.join(root, rel_path))
+        if (not entry or entry["mtime"] != stat.st_mtime_ns or entry["bytes"] != stat.st_size
+                or not set(formats) <= set(entry["formats"])):
+            todo.append(rel_path)
+
+    for rel_path in set(manifest) - current:
+        remove_variants(root, manifest.pop(rel_path))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel_path, entry in pool.map(build_entry, [root] * len(todo), todo,
+                                            [formats] * len(todo), [in_place] * len(todo)):
+                old = manifest.get(rel_path)
+                if old is not None:
+                    # 原图未变（只是补充新格式）时保留最初的原图大小，--in-place 替换过的也能对比
+                    if old["mtime"] == entry["source"]["mtime"]:
+                        entry["source"] = old["source"]
+                    stale = {name: v for name, v in old["variants"].items() if name not in entry["variants"]}
+                    remove_variants(root, {"variants": stale})
+                manifest[rel_path] = entry
+
+    out = manifest_path(root)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, out)
+    return manifest, todo
+
+
+# 解析 Accept 请求头中明确列出的图片类型（image/*、*/* 这类通配不算，q=0 表示不接受）
+def accepted_types(accept):
+    types = {"image/png"}
+    for part in (accept or "").split(","):
+        mimetype, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if mimetype.startswith("image/") and not mimetype.endswith("*"):
+            types.add(mimetype.strip())
+    return types
+
+
+# 运行时使用的清单视图，清单文件变化时自动重新读取；allow_lossy 为假时只选择无损变体
+class VariantIndex:
+    def __init__(self, root, allow_lossy=SERVE_LOSSY):
+        self.root = root
+        self.allow_lossy = allow_lossy
+        self._mtime = None
+        self._manifest = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(manifest_path(self.root)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._manifest = load_manifest(self.root) if mtime else {}
+            self._mtime = mtime
+
+    # 原图的全部有效变体；原图不在清单中或已修改时返回空列表
+    def variants(self, image_path):
+        self._refresh()
+        entry = self._manifest.get(os.path.relpath(image_path, self.root))
+        if entry is None:
+            return []
+        try:
+            if os.stat(image_path).st_mtime_ns != entry["mtime"]:
+                return []
+        except FileNotFoundError:
+            return []
+        return list(entry["variants"].values())
+
+    # 客户端接受的最小变体（默认只在无损的PNG、WebP中选择），返回 (路径, MIME类型)；
+    # 没有可用变体时返回 (原图路径, None)
+    def smallest(self, image_path, accepted=("image/png",)):
+        candidates = [v for v in self.variants(image_path)
+                      if v["mimetype"] in accepted and (v["lossless"] or self.allow_lossy)]
+        if not candidates:
+            return image_path, None
+        best = min(candidates, key=lambda v: v["bytes"])
+        return os.path.join(self.root, best["path"]), best["mimetype"]
+
+    # 解码最快的无损变体（本地解码后再显示时使用）
+    def fastest(self, image_path):
+        candidates = [v for v in self.variants(image_path) if v["lossless"]]
+        if not candidates:
+            return image_path
+        return os.path.join(self.root, min(candidates, key=lambda v: v["decode_ms"])["path"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无损重新压缩PNG图片，并可生成WebP/AVIF变体")
+    parser.add_argument("root", nargs="?", default="images", help="图片根目录")
+    parser.add_argument("--webp", action="store_true", help="生成无损WebP变体")
+    parser.add_argument("--avif", action="store_true", help=f"生成AVIF变体（有损，质量 {AVIF_QUALITY}）")
+    parser.add_argument("--in-place", action="store_true", help="用优化后的PNG替换原图")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数")
+    args = parser.parse_args(argv)
+
+    formats = [fmt for fmt in ("webp", "avif") if getattr(args, fmt)]
+    manifest, built = optimize_images(args.root, formats, args.in_place, args.workers)
+    before = sum(e["source"]["bytes"] for e in manifest.values())
+    print(f"已处理 {len(built)} 张，清单共 {len(manifest)} 张，原图共 {before / 1e6:.1f} MB")
+    for name in ("original", "png", "webp", "avif"):
+        after = sum(e["variants"].get(name, e["variants"]["original"])["bytes"] for e in manifest.values())
+        decode = sum(e["variants"].get(name, e["variants"]["original"])["decode_ms"] for e in manifest.values())
+        count = sum(name in e["variants"] for e in manifest.values())
+        if count:
+            print(f"  {name:8s} {count:4d} 张  {after / 1e6:6.1f} MB  解码共 {decode:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# 多分辨率图片金字塔
+#
+# 每张原图生成若干WebP分级（缩略图、中等、屏幕），原图本身作为 full 分级按需加载。
+# 输出与清单都放在 PYRAMID_DIR 下，清单记录每个分级的路径和尺寸，
+# 显示时按显示宽度选择能覆盖该宽度的最小分级。
+PYRAMID_DIR = ".pyramid"
+MANIFEST_NAME = "manifest.json"
+TIERS = (
+    ("thumb", 320),
+    ("medium", 640),
+    ("screen", 1280),
+)
+WEBP_QUALITY = 85
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def manifest_path(root):
+    return os.path.join(root, PYRAMID_DIR, MANIFEST_NAME)
+
+
+# 分级文件路径：<root>/.pyramid/<相对路径去后缀>.<tier>.webp
+def tier_path(root, rel_path, tier):
+    stem = os.path.splitext(rel_path)[0]
+    return os.path.join(root, PYRAMID_DIR, f"{stem}.{tier}.webp")
+
+
+# 为单张图片生成全部分级（在子进程中运行）
+def build_entry(root, rel_path):
+    src = os.path.join(root, rel_path)
+    stat = os.stat(src)
+    entry = {"mtime": stat.st_mtime_ns, "bytes": stat.st_size, "tiers": {}}
+    with Image.open(src) as im:
+        entry["width"], entry["height"] = im.size
+        im.load()
+        for tier, max_width in TIERS:
+            # 原图比该分级窄时只生成一个原尺寸的WebP，更大的分级不再生成
+            width = min(max_width, im.width)
+            if any(t["width"] == width for t in entry["tiers"].values()):
+                break
+            scaled = im.copy()
+            scaled.thumbnail((width, max(1, width * im.height // im.width)), Image.LANCZOS)
+            out = tier_path(root, rel_path, tier)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            scaled.save(out, "WEBP", quality=WEBP_QUALITY, method=6)
+            entry["tiers"][tier] = {
+                "path": os.path.relpath(out, root),
+                "width": scaled.width,
+                "height": scaled.height,
+                "bytes": os.path.getsize(out),
+            }
+    entry["tiers"]["full"] = {
+        "path": rel_path,
+        "width": entry["width"],
+        "height": entry["height"],
+        "bytes": entry["bytes"],
+    }
+    return rel_path, entry
+
+
+# 列出目录下的全部原图（跳过金字塔输出目录）
+def list_images(root):
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(dirpath, file), root)
+
+
+def load_manifest(root):
+    try:
+        with open(manifest_path(root), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+# 增量构建：只处理新增或修改过的图片，并删除已消失图片的条目
+def build_pyramid(root, workers=None):
+    manifest = load_manifest(root)
+    todo = []
+    current = set()
+    for rel_path in list_images(root):
+        current.add(rel_path)
+        entry = manifest.get(rel_path)
+        stat = os.stat(os.path.join(root, rel_path))
+        if not entry or entry["mtime"] != stat.st_mtime_ns or entry["bytes"] != stat.st_size:
+            todo.append(rel_path)
+
+    for rel_path in set(manifest) - current:
+        for tier in manifest.pop(rel_path)["tiers"].values():
+            if tier["path"] != rel_path:
+                try:
+                    os.remove(os.path.join(root, tier["path"]))
+                except FileNotFoundError:
+                    pass
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel_path, entry in pool.map(build_entry, [root] * len(todo), todo):
+                manifest[rel_path] = entry
+
+    out = manifest_path(root)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, out)
+    return manifest, todo
+
+
+# 选择宽度不小于显示宽度的最小分级；都不够宽时返回最宽分级中字节数最小的
+def select_tier(entry, display_width, pixel_ratio=1.0):
+    needed = display_width * pixel_ratio
+    tiers = sorted(entry["tiers"].values(), key=lambda t: (t["width"], t["bytes"]))
+    for tier in tiers:
+        if tier["width"] >= needed:
+            return tier
+    widest = tiers[-1]["width"]
+    return next(t for t in tiers if t["width"] == widest)
+
+
+# 运行时使用的清单视图，清单文件变化时自动重新读取
+class PyramidIndex:
+    def __init__(self, root):
+        self.root = root
+        self._mtime = None
+        self._manifest = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(manifest_path(self.root)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._manifest = load_manifest(self.root) if mtime else {}
+            self._mtime = mtime
+
+    # 返回适合显示宽度的文件路径；原图不在清单中或已修改时返回原图路径
+    def best_path(self, image_path, display_width, pixel_ratio=1.0):
+        self._refresh()
+        rel_path = os.path.relpath(image_path, self.root)
+        entry = self._manifest.get(rel_path)
+        if entry is None:
+            return image_path
+        try:
+            if os.stat(image_path).st_mtime_ns != entry["mtime"]:
+                return image_path
+        except FileNotFoundError:
+            return image_path
+        return os.path.join(self.root, select_tier(entry, display_width, pixel_ratio)["path"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="为UMAP图片生成多分辨率WebP金字塔")
+    parser.add_argument("root", nargs="?", default="images", help="图片根目录")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数")
+    args = parser.parse_args(argv)
+
+    manifest, built = build_pyramid(args.root, args.workers)
+    original = sum(e["bytes"] for e in manifest.values())
+    screen = sum(select_tier(e, TIERS[-1][1])["bytes"] for e in manifest.values())
+    print(f"已处理 {len(built)} 张，清单共 {len(manifest)} 张；"
+          f"原图 {original / 1e6:.1f} MB -> 屏幕分级 {screen / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import io
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import streamlit as st
+from PIL import Image
+
+from file_hash import hash_bytes
+
+# 多基因对比网格的图块加载，以及单图预览的显示缓存
+#
+# 每个图块在线程池中读取并解码，解码后立即缩小到网格单元宽度，只有小图的编码字节进入缓存和发往浏览器。
+# JPEG用 draft() 让解码器直接按 1/2、1/4、1/8 缩小解码；其他格式用带 reducing_gap 的 thumbnail()。
+# 缓存按字节数限制（LRU），键包含文件的 mtime/大小或内容哈希，源文件变化后自动失效。
+#
+# st.image 收到的图片不是 有透明通道->PNG / 否则->JPEG、或宽于 MAX_DISPLAY_WIDTH 时，
+# 每次调用（即每次重跑）都会完整解码并重新编码；传入PIL图片也会每次重新编码。
+# DisplayCache 把图片一次性转换为 st.image 可原样发送的字节并缓存。
+DEFAULT_TILE_CACHE_BYTES = int(os.environ.get("MAGE_TILE_CACHE_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_DISPLAY_CACHE_BYTES = int(os.environ.get("MAGE_DISPLAY_CACHE_BYTES", str(128 * 1024 * 1024)))
+MAX_DISPLAY_WIDTH = 2 * 730  # 与 streamlit 的 MAXIMUM_CONTENT_WIDTH 一致
+DISPLAY_JPEG_QUALITY = 90
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+GRID_WIDTH = 1200  # 网格区域宽度（像素），图块宽度 = GRID_WIDTH // 列数
+
+# label: 显示标题；key: 缓存键（None 时在读取后按内容哈希生成）；fetch: 返回文件路径或图片字节
+GridItem = namedtuple("GridItem", "label key fetch")
+
+
+# 文件图块的缓存键：路径 + mtime + 大小 + 宽度
+def file_tile_key(path, width):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, width)
+
+
+# 解码图片（路径或字节）并缩小到不超过 width 像素宽
+def decode_tile(source, width):
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if width and image.width > width:
+        height = max(1, image.height * width // image.width)
+        image.draft(None, (width, height))
+        image.thumbnail((width, height), Image.LANCZOS, reducing_gap=2.0)
+    image.load()
+    return image
+
+
+# 编码为 st.image 不再转换的格式：有透明通道用PNG，否则用JPEG
+def encode_for_display(image):
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(buffer, "PNG")
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=DISPLAY_JPEG_QUALITY)
+    return buffer.getvalue()
+
+
+# 字节串的LRU缓存，按总字节数限制，线程安全
+class TileCache:
+    def __init__(self, max_bytes=DEFAULT_TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        size = len(data)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self._entries[key] = data
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+
+# 单图预览的显示缓存：按 路径+mtime+大小 缓存缩小并编码好的字节，重跑时不再解码
+class DisplayCache:
+    def __init__(self, max_bytes=DEFAULT_DISPLAY_CACHE_BYTES):
+        self.cache = TileCache(max_bytes)
+
+    def get(self, path, width=MAX_DISPLAY_WIDTH):
+        key = file_tile_key(path, width)
+        data = self.cache.get(key)
+        if data is None:
+            data = encode_for_display(decode_tile(path, min(width, MAX_DISPLAY_WIDTH)))
+            self.cache.put(key, data)
+        return data
+
+
+# 在线程池中并行读取、解码、缩小并编码图块；命中缓存的图块不进线程池
+class TileLoader:
+    def __init__(self, cache=None, max_workers=DEFAULT_WORKERS):
+        self.cache = cache or TileCache()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tile")
+
+    def load(self, item, width):
+        if item.key is not None:
+            data = self.cache.get(item.key)
+            if data is not None:
+                return data
+        source = item.fetch()
+        if source is None:
+            raise FileNotFoundError(item.label)
+        key = item.key
+        if key is None:
+            if not isinstance(source, bytes):
+                with open(source, "rb") as f:
+                    source = f.read()
+            key = (hash_bytes(source), width)
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+        data = encode_for_display(decode_tile(source, width))
+        self.cache.put(key, data)
+        return data
+
+    # 提交全部图块，返回与 items 顺序一致的 Future 列表
+    def submit(self, items, width):
+        futures = []
+        for item in items:
+            data = self.cache.get(item.key) if item.key is not None else None
+            if data is not None:
+                future = Future()
+                future.set_result(data)
+            else:
+                future = self._pool.submit(self.load, item, width)
+            futures.append(future)
+        return futures
+
+
+def tile_width(columns, grid_width=GRID_WIDTH):
+    return grid_width // max(1, columns)
+
+
+# 按列数排出网格占位，图块完成一个填一个（先完成的先显示）
+def render_tile_grid(items, loader, columns=4, width=None):
+    width = width or tile_width(columns)
+    columns = max(1, min(columns, len(items)))
+    slots = []
+    for start in range(0, len(items), columns):
+        for col, item in zip(st.columns(columns), items[start:start + columns]):
+            with col:
+                slot = st.empty()
+                slot.caption(f"⏳ {item.label}")
+                slots.append(slot)
+
+    futures = dict(zip(loader.submit(items, width), zip(items, slots)))
+    for future in as_completed(futures):
+        item, slot = futures[future]
+        try:
+            slot.image(future.result(), caption=item.label, use_container_width=True)
+        except Exception as e:
+            slot.warning(f"{item.label}: 无法加载图片（{e}）")
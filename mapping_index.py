@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+from mapping_store import MappingStore, compiled_path, fresh_compiled_path, read_mapping_rows
+
+NOT_FOUND = "未找到匹配的数据"
+
+
+# 进程级映射索引：(plotType, Gene, Meta information) -> image_path
+# 启动时加载一次，CSV文件mtime变化时自动重新加载，查询路径上不使用pandas
+# 若CSV旁有不旧于它的 .midx 编译文件，则直接在内存映射上查询，不再解析CSV
+class MappingIndex:
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._sources = {}   # plot_type -> csv文件路径
+        self._mtimes = {}    # plot_type -> 上次加载时的(CSV, .midx) mtime_ns
+        self._table = {}     # (plot_type, gene, meta) -> image_path
+        self._stores = {}    # plot_type -> MappingStore（编译文件）
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    # 注册一个plotType对应的CSV文件并立即加载
+    def register(self, plot_type, csv_file):
+        with self._lock:
+            self._sources[plot_type] = csv_file
+            self._reload(plot_type)
+
+    # plotType -> CSV文件路径
+    def sources(self):
+        return dict(self._sources)
+
+    # 读取CSV，生成该plotType的全部键值；列识别与 .midx 编译相同（mapping_store.detect_columns）
+    def _read_rows(self, plot_type, csv_file):
+        with open(csv_file, newline="", encoding="utf-8-sig") as f:
+            rows = read_mapping_rows(f.read())
+        entries = {}
+        for gene, meta, path in rows:
+            # 与原先的 result.values[0] 一致：重复键保留第一条
+            entries.setdefault((plot_type, gene, meta), path)
+        return entries
+
+    # CSV及其编译文件的mtime，任一变化都触发重新加载
+    @staticmethod
+    def _source_version(csv_file):
+        version = []
+        for path in (csv_file, compiled_path(csv_file)):
+            try:
+                version.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    # 重新加载某个plotType（调用方需持有锁）
+    def _reload(self, plot_type):
+        csv_file = self._sources[plot_type]
+        mtime = self._source_version(csv_file)
+        midx = fresh_compiled_path(csv_file)
+        store = MappingStore.open(midx) if midx else None
+        try:
+            entries = {} if store else self._read_rows(plot_type, csv_file)
+        except FileNotFoundError:
+            entries = {}
+
+        # 旧的内存映射不立即关闭，正在进行的查询可能仍在使用
+        if store:
+            self._stores[plot_type] = store
+        else:
+            self._stores.pop(plot_type, None)
+
+        # 构建新表后整体替换，读线程始终看到完整的字典
+        table = {k: v for k, v in self._table.items() if k[0] != plot_type}
+        table.update(entries)
+        self._table = table
+        self._mtimes[plot_type] = mtime
+
+    # 检查CSV文件的mtime，必要时重新加载
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            for plot_type, csv_file in self._sources.items():
+                if self._source_version(csv_file) != self._mtimes.get(plot_type):
+                    self._reload(plot_type)
+
+    # O(1) 查询；没有Meta列的映射（如UMAP）按空meta存储，作为回退
+    def lookup(self, plot_type, gene, meta):
+        self.reload_if_changed()
+        store = self._stores.get(plot_type)
+        if store is not None:
+            path = store.lookup(gene, meta) if gene else None
+            if path is None and gene:
+                path = store.lookup(gene, "")
+            return path
+
+        table = self._table
+        path = table.get((plot_type, gene, meta))
+        if path is None:
+            path = table.get((plot_type, gene, ""))
+        return path
+
+    def __len__(self):
+        return len(self._table) + sum(len(s) for s in self._stores.values())
@@ -0,0 +1,275 @@
+import argparse
+import array
+import csv
+import io
+import mmap
+import os
+import struct
+import sys
+
+# 紧凑的二进制映射文件（.midx）
+#
+# 布局（小端）:
+#   头部    MAGIC, VERSION, 字符串数量, 记录数量
+#   字符串表  (n+1) 个 u32 偏移 + UTF-8 拼接数据，按字节序排序并去重
+#   记录表    n 条 (gene_id, meta_id, path_id)，每项 u32，按 (gene, meta) 排序
+#
+# 字符串按字节序排序后，字符串ID的大小顺序与字符串本身一致，
+# 因此记录可以直接按整数元组做二分查找。
+# 读取时把u32区段直接cast为memoryview，要求小端主机（x86/ARM均满足）。
+MAGIC = b"MIDX"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+RECORD_WIDTH = 3
+COMPILED_SUFFIX = ".midx"
+
+
+# 根据CSV表头识别基因/meta/路径列（大小写不敏感）
+def detect_columns(header):
+    lowered = [h.strip().lower() for h in header]
+    gene_idx = lowered.index("gene") if "gene" in lowered else 0
+    meta_idx = lowered.index("meta information") if "meta information" in lowered else None
+    path_idx = None
+    for i, name in enumerate(lowered):
+        if name == "image_path" or (path_idx is None and name.endswith("path")):
+            path_idx = i
+    if path_idx is None:
+        path_idx = len(header) - 1
+    return gene_idx, meta_idx, path_idx
+
+
+# 从CSV文本中读取 (gene, meta, path) 三元组
+def read_mapping_rows(csv_text, delimiter=","):
+    reader = csv.reader(io.StringIO(csv_text), delimiter=delimiter)
+    header = next(reader, None)
+    if not header:
+        return []
+    gene_idx, meta_idx, path_idx = detect_columns(header)
+    rows = []
+    for row in reader:
+        if len(row) <= max(gene_idx, path_idx):
+            continue
+        gene = row[gene_idx].strip()
+        path = row[path_idx].strip()
+        meta = row[meta_idx].strip() if meta_idx is not None and meta_idx < len(row) else ""
+        if gene and path:
+            rows.append((gene, meta, path))
+    return rows
+
+
+# 把三元组编译成 .midx 字节串
+def compile_rows(rows):
+    first = {}
+    for gene, meta, path in rows:
+        # 与CSV查询一致：重复的 (gene, meta) 保留第一条
+        first.setdefault((gene, meta), path)
+
+    strings = sorted({s.encode("utf-8") for key, path in first.items() for s in (*key, path)})
+    ids = {s: i for i, s in enumerate(strings)}
+
+    offsets = [0]
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+    blob = b"".join(strings)
+    blob += b"\0" * (-len(blob) % 4)
+
+    records = sorted(
+        (ids[g.encode("utf-8")], ids[m.encode("utf-8")], ids[p.encode("utf-8")])
+        for (g, m), p in first.items()
+    )
+    flat = [v for record in records for v in record]
+
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, len(strings), len(records)),
+        _u32_bytes(offsets),
+        blob,
+        _u32_bytes(flat),
+    ])
+
+
+# 整数列表转小端u32字节串
+def _u32_bytes(values):
+    arr = array.array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+# 编译单个CSV文件，默认输出到同目录下的 <stem>.midx
+def compile_csv(csv_file, output=None, delimiter=","):
+    if output is None:
+        output = compiled_path(csv_file)
+    with open(csv_file, newline="", encoding="utf-8-sig") as f:
+        data = compile_rows(read_mapping_rows(f.read(), delimiter))
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, output)
+    return output
+
+
+# CSV文件对应的编译文件路径
+def compiled_path(csv_file):
+    return os.path.splitext(csv_file)[0] + COMPILED_SUFFIX
+
+
+# 编译文件存在且不旧于CSV时返回其路径，否则返回None
+def fresh_compiled_path(csv_file):
+    midx = compiled_path(csv_file)
+    try:
+        midx_mtime = os.stat(midx).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    try:
+        if os.stat(csv_file).st_mtime_ns > midx_mtime:
+            return None
+    except FileNotFoundError:
+        pass
+    return midx
+
+
+# 直接在内存映射上查询的只读映射表，不依赖pandas
+class MappingStore:
+    def __init__(self, buffer, mm=None):
+        self._mm = mm
+        view = memoryview(buffer)
+        magic, version, n_strings, n_records = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION or sys.byteorder != "little":
+            raise ValueError("不是有效的 .midx 映射文件")
+
+        pos = HEADER.size
+        self._offsets = view[pos:pos + 4 * (n_strings + 1)].cast("I")
+        pos += 4 * (n_strings + 1)
+        blob_len = self._offsets[n_strings]
+        self._blob = view[pos:pos + blob_len]
+        pos += blob_len + (-blob_len % 4)
+        self._records = view[pos:pos + 4 * RECORD_WIDTH * n_records].cast("I")
+        self.n_strings = n_strings
+        self.n_records = n_records
+
+    # 以mmap方式打开编译文件
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, mm)
+
+    # 从字节串加载（例如从GitHub下载的文件）
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(bytes(data))
+
+    def close(self):
+        self._offsets.release()
+        self._blob.release()
+        self._records.release()
+        if self._mm is not None:
+            self._mm.close()
+
+    def _string_bytes(self, i):
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]])
+
+    def string(self, i):
+        return self._string_bytes(i).decode("utf-8")
+
+    # 在字符串表中二分查找，返回ID或None
+    def string_id(self, value):
+        target = value.encode("utf-8")
+        lo, hi = 0, self.n_strings
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_strings and self._string_bytes(lo) == target:
+            return lo
+        return None
+
+    def _record(self, i):
+        base = i * RECORD_WIDTH
+        return self._records[base], self._records[base + 1], self._records[base + 2]
+
+    # 第一条 (gene_id, meta_id) >= key 的记录下标
+    def _lower_bound(self, key):
+        lo, hi = 0, self.n_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[:len(key)] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # 查询 (gene, meta) 对应的路径；meta为None时取该基因的第一条
+    def lookup(self, gene, meta=None):
+        gene_id = self.string_id(gene) if gene else None
+        if gene_id is None:
+            return None
+        if meta is not None:
+            meta_id = self.string_id(meta)
+            if meta_id is None:
+                return None
+            key = (gene_id, meta_id)
+        else:
+            key = (gene_id,)
+        i = self._lower_bound(key)
+        if i < self.n_records and self._record(i)[:len(key)] == key:
+            return self.string(self._record(i)[2])
+        return None
+
+    # 按字母顺序枚举基因（可按meta过滤）
+    def genes(self, meta=None):
+        meta_id = self.string_id(meta) if meta else None
+        if meta and meta_id is None:
+            return
+        last = None
+        for i in range(self.n_records):
+            gene_id, record_meta, _ = self._record(i)
+            if gene_id == last or (meta_id is not None and record_meta != meta_id):
+                continue
+            last = gene_id
+            yield self.string(gene_id)
+
+    # 枚举meta类别
+    def metas(self):
+        return sorted({self.string(self._record(i)[1]) for i in range(self.n_records)})
+
+    # 生成 {gene: path} 字典，供按基因选择图片的前端使用
+    # 不指定meta时每个基因取 (gene, meta) 排序最前的一条（同一 (gene, meta) 编译时已保留CSV中的第一条），
+    # gene_path_parser.parse_gene_paths 按相同规则解析CSV
+    def gene_paths(self, meta=None):
+        meta_id = self.string_id(meta) if meta else None
+        result = {}
+        if meta and meta_id is None:
+            return result
+        for i in range(self.n_records):
+            gene_id, record_meta, path_id = self._record(i)
+            if meta_id is not None and record_meta != meta_id:
+                continue
+            gene = self.string(gene_id)
+            if gene not in result:
+                result[gene] = self.string(path_id)
+        return result
+
+    def __len__(self):
+        return self.n_records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把映射CSV编译为紧凑的 .midx 二进制索引")
+    parser.add_argument("csv_files", nargs="+", help="映射CSV文件")
+    parser.add_argument("--delimiter", default=",", help="CSV分隔符")
+    args = parser.parse_args(argv)
+
+    for csv_file in args.csv_files:
+        output = compile_csv(csv_file, delimiter=args.delimiter)
+        store = MappingStore.open(output)
+        print(f"{csv_file} -> {output}: {len(store)} 条记录, "
+              f"{store.n_strings} 个字符串, {os.path.getsize(output)} 字节")
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
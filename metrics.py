@@ -0,0 +1,173 @@
+import atexit
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# 进程内指标（Prometheus文本格式），无需额外依赖
+#
+# 计数器和直方图按标签值分组，线程安全；REGISTRY.render() 生成 /metrics 的响应内容。
+# 多worker（如 asgi_app 多进程）时每个进程各自计数，由Prometheus按实例汇总。
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LOG_SAMPLE_RATE = float(os.environ.get("MAGE_LOG_SAMPLE_RATE", "0.01"))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[n] for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值 -> [各桶计数..., 总和, 总数]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield (f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} "
+                       f"{cumulative}")
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}"
+
+
+# 图片查询服务的指标（app.py 与 asgi_app.py 共用）
+STAGE_SECONDS = Histogram("mage_request_stage_seconds", "Time spent in each stage of a /pdfs request",
+                          ["stage"])
+LOOKUP_SECONDS = Histogram("mage_lookup_seconds", "Mapping lookup latency", ["plot_type"])
+LOOKUP_RESULTS = Counter("mage_lookup_results_total",
+                         "Lookup results: hit, rendered (drawn on demand from summary/expression data), "
+                         "miss (mapped file missing on disk) or not_found (no mapping row)",
+                         ["plot_type", "result"])
+FIGURE_BYTES = Counter("mage_figure_bytes_total", "Figure bytes served", ["route"])
+FIGURE_REQUESTS = Counter("mage_figure_requests_total", "Figure requests by status", ["route", "status"])
+
+
+# 单个请求的分阶段计时
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = elapsed
+            STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def milliseconds(self):
+        return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+
+
+# 采样的结构化日志：每条按 sample_rate 的概率输出一行JSON，
+# 由后台线程写出（QueueHandler），请求线程不在stdout/stderr上排队
+class SampledLogger:
+    def __init__(self, name, sample_rate=LOG_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            records = queue.SimpleQueue()
+            self.logger.addHandler(logging.handlers.QueueHandler(records))
+            listener = logging.handlers.QueueListener(records, logging.StreamHandler())
+            listener.start()
+            atexit.register(listener.stop)
+
+    def log(self, event, **fields):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.logger.info(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, ensure_ascii=False))
@@ -1,17 +1,26 @@
 import streamlit as st
 from PIL import Image
 import os
-import base64
 import requests
-from io import BytesIO, StringIO
-import pandas as pd
-import numpy as np
+from io import BytesIO
+from mapping_store import COMPILED_SUFFIX, MappingStore
+from gene_path_parser import describe_dropped, parse_gene_paths
+from image_cache import ImageCache
+from gene_search import GeneSearchIndex
+from github_client import GitHubClient, RateLimitExceeded
+from pdf_raster import RasterCache, is_pdf
+from image_tiles import GridItem, TileLoader, render_tile_grid, tile_width
+from storage import DEFAULT_STORAGE, GitHubStorage, open_storage
+from rerun_profiler import fragment_profile, profiled_cache, stage, start_rerun
 
 st.set_page_config(layout="wide", page_title="GitHub 基因图片智能定位系统")
+# 重跑分析（MAGE_PROFILE=1 或地址带 ?profile=1 时启用，见 rerun_profiler.py）
+PROFILE = start_rerun("newnew")
 st.title("🧬 GitHub 基因图片智能定位系统")
 
 # 自定义CSS样式
-st.markdown("""
+with PROFILE.stage("css"):
+    st.markdown("""
 <style>
     .github-card {
         border-radius: 10px;
@@ -99,41 +108,68 @@ st.markdown("""
 REPO_OWNER = "ff-yifei"                # GitHub用户名或组织名
 REPO_NAME = "mage-selector-app"        # 仓库名称
 BRANCH = "main"                        # 分支名称
-UMAP_CONFIG_PATH = "images-mapping.csv"  # UMAP CSV文件路径
-VIOLIN_CONFIG_PATH = "mapping-violin.csv"  # Violin CSV文件路径
+UMAP_CONFIG_PATH = "images-mapping.csv"  # UMAP CSV文件路径（也可指向编译后的 .midx 文件）
+VIOLIN_CONFIG_PATH = "mapping-violin.csv"  # Violin CSV文件路径（也可指向编译后的 .midx 文件）
 CSV_DELIMITER = "/"                    # CSV分隔符
 GITHUB_TOKEN = st.secrets.get("GITHUB_TOKEN", "your-github-token")  # 从secrets获取token
+GITHUB_API_BASE = os.environ.get("GITHUB_API_BASE", "https://api.github.com")  # 可指向本地HTTP替身用于测试
+GITHUB_RAW_BASE = os.environ.get("GITHUB_RAW_BASE", "https://raw.githubusercontent.com")  # 可指向本地HTTP替身用于测试
+STORAGE = DEFAULT_STORAGE  # 数据源：github、local:<目录> 或 git:<仓库目录>[@<ref>]（见 storage.py，环境变量 MAGE_STORAGE）
+
+# 共享的GitHub客户端（连接池、重试、线程池），跨重跑复用；
+# 限流耗尽时不在脚本线程中等待（max_rate_wait=0），直接显示限流提示
+@st.cache_resource
+def get_github_client():
+    token = GITHUB_TOKEN if GITHUB_TOKEN and GITHUB_TOKEN != "your-github-token" else None
+    return GitHubClient(REPO_OWNER, REPO_NAME, BRANCH, token=token,
+                        api_base=GITHUB_API_BASE, raw_base=GITHUB_RAW_BASE, max_rate_wait=0)
+
+# 把请求异常转换为提示信息
+def describe_github_error(e, prefix):
+    if isinstance(e, RateLimitExceeded):
+        return str(e)
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return f"{prefix} ({e.response.status_code}): {e.response.text}"
+    return f"{prefix}: {str(e)}"
+
+# 数据源（GitHub、本地目录或本地git仓库），跨重跑和会话共享
+@st.cache_resource
+def get_storage():
+    return open_storage(STORAGE, make_github=lambda: GitHubStorage(get_github_client(), get_image_cache()))
+
+# 并发获取多个文件，返回 {path: (字节, 错误信息)}
+@profiled_cache(st.cache_data(ttl=600, show_spinner="正在加载数据..."))
+def fetch_github_files(paths):
+    storage = get_storage()
+    files = {}
+    for path, result in storage.map(storage.read, paths).items():
+        if isinstance(result, Exception):
+            files[path] = (b"", describe_github_error(result, "无法从GitHub获取文件"))
+        else:
+            files[path] = (result, None)
+    return files
 
-# 获取GitHub API头信息
-def get_github_headers():
-    headers = {"Accept": "application/vnd.github.v3+json"}
-    if GITHUB_TOKEN and GITHUB_TOKEN != "your-github-token":
-        headers["Authorization"] = f"token {GITHUB_TOKEN}"
-    return headers
+# 获取GitHub文件的原始字节（可传入已预取的文件）
+def get_github_file_bytes(path, files=None):
+    if not files or path not in files:
+        files = fetch_github_files((path,))
+    data, error = files[path]
+    if error:
+        st.error(error)
+    return data
 
 # 获取GitHub文件内容
-@st.cache_data(ttl=600, show_spinner="正在从GitHub加载数据...")
-def get_github_file_content(path):
-    api_url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/contents/{path}?ref={BRANCH}"
-    try:
-        response = requests.get(api_url, headers=get_github_headers())
-        response.raise_for_status()
-        content = response.json().get("content", "")
-        return base64.b64decode(content).decode("utf-8")
-    except requests.exceptions.HTTPError as e:
-        st.error(f"GitHub API错误 ({e.response.status_code}): {e.response.text}")
-    except Exception as e:
-        st.error(f"无法从GitHub获取文件: {str(e)}")
-    return ""
+def get_github_file_content(path, files=None):
+    return get_github_file_bytes(path, files).decode("utf-8")
 
-# 获取GitHub目录结构
-@st.cache_data(ttl=600)
+# 文件是否存在（GitHub后端来自仓库快照，不再逐个HEAD请求）
+def github_file_exists(path):
+    return get_storage().exists(path)
+
+# 获取目录结构（GitHub后端来自仓库快照）
 def get_github_directory_structure(path):
-    api_url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/contents/{path}?ref={BRANCH}"
     try:
-        response = requests.get(api_url, headers=get_github_headers())
-        response.raise_for_status()
-        return response.json()
+        return get_storage().listdir(path)
     except requests.exceptions.HTTPError as e:
         st.error(f"无法获取目录结构: {e.response.status_code} - {e.response.text}")
     except Exception as e:
@@ -142,39 +178,33 @@ def get_github_directory_structure(path):
 
 # 从CSV内容解析基因路径信息
 def parse_gene_paths_from_csv(csv_content, gene_col="gene", path_col="image_path"):
-    gene_paths = {}
-    
     try:
-        # 使用pandas解析CSV
-        df = pd.read_csv(StringIO(csv_content), sep=CSV_DELIMITER)
-        
-        # 识别列
-        if gene_col in df.columns:
-            gene_col_name = gene_col
-        else:
-            gene_col_name = df.columns[0]
-            
-        if path_col in df.columns:
-            path_col_name = path_col
-        else:
-            path_col_name = df.columns[1] if len(df.columns) > 1 else df.columns[0]
-        
-        # 创建基因路径字典
-        for _, row in df.iterrows():
-            gene = str(row[gene_col_name]).strip()
-            path = str(row[path_col_name]).strip()
-            if gene and path:
-                gene_paths[gene] = path
-                
+        gene_paths, dropped = parse_gene_paths(csv_content, gene_col, path_col, sep=CSV_DELIMITER)
+        if dropped:
+            st.warning(describe_dropped(dropped))
         return gene_paths
     
     except Exception as e:
         st.error(f"解析CSV文件时出错: {str(e)}")
         return {}
 
+# 从编译好的 .midx 映射文件读取基因路径信息（见 mapping_store.py）
+def parse_gene_paths_from_store(data):
+    try:
+        return MappingStore.from_bytes(data).gene_paths()
+    except Exception as e:
+        st.error(f"解析映射文件时出错: {str(e)}")
+        return {}
+
 # 从GitHub获取基因路径信息
-def get_gene_paths_from_github(config_path, gene_col="gene", path_col="image_path"):
-    content = get_github_file_content(config_path)
+def get_gene_paths_from_github(config_path, gene_col="gene", path_col="image_path", files=None):
+    if config_path.endswith(COMPILED_SUFFIX):
+        gene_paths = parse_gene_paths_from_store(get_github_file_bytes(config_path, files))
+        if not gene_paths:
+            st.error(f"无法从路径 '{config_path}' 加载基因路径文件")
+        return gene_paths
+
+    content = get_github_file_content(config_path, files)
     if content:
         gene_paths = parse_gene_paths_from_csv(content, gene_col, path_col)
         if gene_paths:
@@ -185,14 +215,25 @@ def get_gene_paths_from_github(config_path, gene_col="gene", path_col="image_pat
         st.error(f"无法从路径 '{config_path}' 加载基因路径文件")
     return {}
 
-# 获取GitHub原始文件URL
+# 文件地址（GitHub原始文件URL，本地后端为文件位置）
 def get_github_raw_url(path):
-    return f"https://raw.githubusercontent.com/{REPO_OWNER}/{REPO_NAME}/{BRANCH}/{path}"
+    return get_storage().url(path)
 
 # 获取基因列表
 def get_gene_list(gene_paths):
     return sorted(gene_paths.keys())
 
+# 基因搜索索引，每个基因目录版本只构建一次（_genes 不参与缓存键）
+@profiled_cache(st.cache_resource(max_entries=8))
+def get_gene_search_index(catalog_version, _genes):
+    return GeneSearchIndex(_genes)
+
+# 搜索基因：空查询返回全部，否则返回排序后的前若干个匹配（含拼写容错）
+def search_genes(genes, search_term):
+    if not search_term:
+        return genes
+    return get_gene_search_index(hash(tuple(genes)), genes).search(search_term)
+
 # 显示基因列表
 def display_gene_list(genes, selected_gene, section_id):
     st.markdown(f'<div class="gene-grid" style="display: grid; grid-template-columns: repeat(5, 1fr); gap: 8px;">', unsafe_allow_html=True)
@@ -206,19 +247,34 @@ def display_gene_list(genes, selected_gene, section_id):
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-# 获取GitHub图片
-def get_github_image(gene_path):
+# 本地图片缓存（跨重跑共享），按 仓库/分支/路径 + ETag 重新验证
+@st.cache_resource
+def get_image_cache():
+    return ImageCache(session=get_github_client())
+
+# 在线程池中预取图片字节，返回Future
+def prefetch_github_image(gene_path):
+    storage = get_storage()
+    return storage.submit(storage.read, gene_path)
+
+# PDF栅格化缓存（按PDF内容哈希），跨重跑共享
+@st.cache_resource
+def get_raster_cache():
+    return RasterCache()
+
+# 获取GitHub图片（可传入预取的Future），PDF会先栅格化为PNG
+def get_github_image(gene_path, image_future=None):
     try:
-        img_url = get_github_raw_url(gene_path)
-        response = requests.get(img_url, headers=get_github_headers(), stream=True)
-        response.raise_for_status()
-        
-        img_data = BytesIO()
-        for chunk in response.iter_content(chunk_size=8192):
-            img_data.write(chunk)
-        img_data.seek(0)
-        
-        return Image.open(img_data)
+        with stage("image_fetch"):
+            if image_future is None:
+                image_future = prefetch_github_image(gene_path)
+            img_data = image_future.result()
+        with stage("decode"):
+            if is_pdf(gene_path):
+                img_data = get_raster_cache().rasterize_bytes(img_data)
+            image = Image.open(BytesIO(img_data))
+            image.load()
+        return image
     except requests.exceptions.HTTPError as e:
         st.error(f"图片加载错误 ({e.response.status_code}): {e.response.text}")
     except Exception as e:
@@ -226,8 +282,27 @@ def get_github_image(gene_path):
     
     return None
 
+# 对比网格的图块加载器（线程池 + 已解码图块缓存），跨重跑共享
+@st.cache_resource
+def get_tile_loader():
+    return TileLoader()
+
+# 对比网格：图片字节由数据源读取（GitHub后端经本地缓存按ETag重新验证），按内容哈希作为图块缓存键
+def display_compare_grid(genes, gene_paths, columns):
+    storage, raster_cache = get_storage(), get_raster_cache()
+
+    def fetch(path):
+        data = storage.read(path)
+        return raster_cache.rasterize_bytes(data, 72) if is_pdf(path) else data
+
+    items = []
+    for gene in genes:
+        path = gene_paths.get(gene)
+        items.append(GridItem(gene, None, (lambda path=path: fetch(path)) if path else (lambda: None)))
+    render_tile_grid(items, get_tile_loader(), columns, tile_width(columns))
+
 # 显示图片预览
-def display_image_preview(gene, gene_path, image_type):
+def display_image_preview(gene, gene_path, image_type, image_future=None):
     with st.container():
         st.markdown(f"""
         <div class='github-card'>
@@ -237,33 +312,48 @@ def display_image_preview(gene, gene_path, image_type):
         </div>
         """, unsafe_allow_html=True)
     
+    # 快照中不存在的文件不再发起注定失败的下载
+    if image_future is None and not github_file_exists(gene_path):
+        st.warning(f"{image_type}图片在仓库中不存在，请检查基因路径配置")
+        display_missing_file(gene_path)
+        return
+    
     try:
         with st.spinner(f"正在加载{image_type}图片..."):
-            image = get_github_image(gene_path)
+            image = get_github_image(gene_path, image_future)
         
         if image:
             st.image(image, caption=f"{gene} {image_type}图片", use_column_width=True)
         else:
             st.warning(f"无法加载{image_type}图片，请检查路径是否正确")
-            
-            # 尝试显示目录内容
-            dir_path = os.path.dirname(gene_path)
-            if dir_path:
-                st.info(f"尝试显示目录内容: {dir_path}")
-                try:
-                    dir_content = get_github_directory_structure(dir_path)
-                    
-                    if dir_content and isinstance(dir_content, list):
-                        st.write("目录内容:")
-                        for item in dir_content:
-                            st.write(f"- {item['name']} ({item['type']})")
-                    else:
-                        st.write("无法获取目录内容")
-                except:
-                    st.write("获取目录内容时出错")
+            display_missing_file(gene_path)
     except Exception as e:
         st.error(f"加载{image_type}图片时出错: {str(e)}")
 
+# 文件缺失时显示可能的正确路径和所在目录的内容
+def display_missing_file(gene_path):
+    suggestion, candidates = get_storage().suggest(gene_path)
+    if suggestion:
+        st.info(f"可能的正确路径: {suggestion}")
+    elif candidates:
+        st.info("同名文件: " + ", ".join(candidates[:10]))
+    
+    # 尝试显示目录内容
+    dir_path = os.path.dirname(gene_path)
+    if dir_path:
+        st.info(f"尝试显示目录内容: {dir_path}")
+        try:
+            dir_content = get_github_directory_structure(dir_path)
+            
+            if dir_content and isinstance(dir_content, list):
+                st.write("目录内容:")
+                for item in dir_content:
+                    st.write(f"- {item['name']} ({item['type']})")
+            else:
+                st.write("无法获取目录内容")
+        except:
+            st.write("获取目录内容时出错")
+
 # 显示路径分析信息
 def display_path_analysis(gene_path, genes, image_type):
     st.subheader(f"{image_type}图片详细信息")
@@ -278,8 +368,7 @@ def display_path_analysis(gene_path, genes, image_type):
         
         # 检查文件是否存在
         try:
-            response = requests.head(get_github_raw_url(gene_path), headers=get_github_headers())
-            exists = response.status_code == 200
+            exists = github_file_exists(gene_path)
             st.code(f"文件状态: {'✅ 存在' if exists else '❌ 不存在'}")
             if not exists:
                 st.warning("文件在指定路径不存在，请检查基因路径配置")
@@ -287,69 +376,79 @@ def display_path_analysis(gene_path, genes, image_type):
             st.code("文件状态: ❓未知")
     
     with col2:
-        st.markdown("### GitHub API信息")
-        st.code(f"仓库: {REPO_OWNER}/{REPO_NAME}")
-        st.code(f"分支: {BRANCH}")
+        st.markdown("### 数据源信息")
+        st.code(f"数据源: {get_storage().describe()}")
         st.code(f"配置文件: {UMAP_CONFIG_PATH if image_type == 'UMAP' else VIOLIN_CONFIG_PATH}")
         st.code(f"基因数量: {len(genes)}")
 
 # 主应用程序逻辑
-def main():
-    # 加载基因路径信息
-    with st.spinner("正在加载基因数据..."):
-        umap_gene_paths = get_gene_paths_from_github(UMAP_CONFIG_PATH, gene_col="gene", path_col="umap_path")
-        violin_gene_paths = get_gene_paths_from_github(VIOLIN_CONFIG_PATH, gene_col="gene", path_col="violin_path")
-    
-    umap_genes = get_gene_list(umap_gene_paths) if umap_gene_paths else []
-    violin_genes = get_gene_list(violin_gene_paths) if violin_gene_paths else []
-    
-    # 侧边栏 - 分为上下两部分
-    with st.sidebar:
-        # 上半部分：UMAP搜索
-        st.markdown("## 🔍 UMAP 图片搜索")
-        st.markdown("根据基因名称搜索UMAP图片")
-        
-        # UMAP基因搜索
-        umap_search_term = st.text_input("搜索基因 (UMAP)", "", key="umap_gene_search")
+# 面板当前选中的基因：已有选择时取会话状态，首次运行时为默认的第一个
+def current_selection(genes, section_id):
+    return st.session_state.get(f"{section_id}_gene_selector", genes[0] if genes else None)
+
+# 预览面板（片段）：基因搜索、选择、图片预览和路径分析。面板内的交互只重跑这个片段，
+# 不会重新加载映射，也不会重新读取、解码另一个面板的图片。
+# image_futures 为整页重跑时预取的 {路径: Future}，只重跑片段时传入的是上次整页重跑的值，
+# 路径不同则由本面板自己读取
+@st.fragment
+def image_pane(image_type, genes, gene_paths, show_details, image_futures):
+    section_id = image_type.lower()
+    with fragment_profile(f"newnew/{section_id}"):
+        st.subheader(f"{image_type} 图片预览")
+        search_term = st.text_input(f"搜索基因 ({image_type})", "", key=f"{section_id}_gene_search")
         
-        # 过滤UMAP基因列表
-        filtered_umap_genes = [g for g in umap_genes if not umap_search_term or umap_search_term.lower() in g.lower()]
+        # 过滤基因列表
+        with stage("gene_filter"):
+            filtered_genes = search_genes(genes, search_term)
         
-        # 选择UMAP基因
-        if filtered_umap_genes:
-            selected_umap_gene = st.selectbox(
-                "选择基因 (UMAP)",
-                filtered_umap_genes,
+        if filtered_genes:
+            selected_gene = st.selectbox(
+                f"选择基因 ({image_type})",
+                filtered_genes,
                 index=0,
-                key="umap_gene_selector"
+                key=f"{section_id}_gene_selector"
             )
         else:
-            selected_umap_gene = None
+            selected_gene = None
             st.warning("没有匹配的基因")
         
-        st.markdown("---")
-        
-        # 下半部分：Violin搜索
-        st.markdown("## 📊 Violin 图片搜索")
-        st.markdown("根据基因名称搜索Violin图片")
-        
-        # Violin基因搜索
-        violin_search_term = st.text_input("搜索基因 (Violin)", "", key="violin_gene_search")
-        
-        # 过滤Violin基因列表
-        filtered_violin_genes = [g for g in violin_genes if not violin_search_term or violin_search_term.lower() in g.lower()]
-        
-        # 选择Violin基因
-        if filtered_violin_genes:
-            selected_violin_gene = st.selectbox(
-                "选择基因 (Violin)",
-                filtered_violin_genes,
-                index=0,
-                key="violin_gene_selector"
-            )
+        if selected_gene and gene_paths:
+            gene_path = gene_paths.get(selected_gene)
+            if gene_path:
+                display_image_preview(selected_gene, gene_path, image_type, image_futures.get(gene_path))
+                
+                if show_details:
+                    with stage("path_analysis"):
+                        display_path_analysis(gene_path, genes, image_type)
+            else:
+                st.error(f"找不到 {selected_gene} 的{image_type}图片路径")
         else:
-            selected_violin_gene = None
-            st.warning("没有匹配的基因")
+            st.info(f"请在上方选择基因以显示{image_type}图片")
+            
+            # 显示基因列表
+            if genes:
+                st.subheader(f"可用{image_type}基因")
+                display_gene_list(genes, selected_gene, section_id)
+
+def main():
+    # 加载基因路径信息
+    with st.spinner("正在加载基因数据..."), PROFILE.stage("mapping_load"):
+        # 两个映射文件并发获取
+        config_files = fetch_github_files((UMAP_CONFIG_PATH, VIOLIN_CONFIG_PATH))
+        umap_gene_paths = get_gene_paths_from_github(UMAP_CONFIG_PATH, gene_col="gene", path_col="umap_path", files=config_files)
+        violin_gene_paths = get_gene_paths_from_github(VIOLIN_CONFIG_PATH, gene_col="gene", path_col="violin_path", files=config_files)
+    
+    umap_genes = get_gene_list(umap_gene_paths) if umap_gene_paths else []
+    violin_genes = get_gene_list(violin_gene_paths) if violin_gene_paths else []
+    
+    # 侧边栏：多基因对比和全局控制；两个预览面板的搜索和选择在各自的片段中
+    with st.sidebar:
+        # 多基因对比
+        st.markdown("## 🧩 多基因对比")
+        compare_type = st.radio("对比图类型", ["UMAP", "Violin"], horizontal=True, key="compare_type")
+        compare_genes = st.multiselect("选择基因 (对比)", umap_genes if compare_type == "UMAP" else violin_genes,
+                                       key="compare_genes")
+        compare_columns = st.slider("每行图片数", 2, 6, 4, key="compare_columns")
         
         st.markdown("---")
         
@@ -360,50 +459,34 @@ def main():
         # 刷新按钮
         if st.button("刷新数据", use_container_width=True):
             st.cache_data.clear()
+            get_storage().refresh()
             st.rerun()
     
+    # 整页重跑时并发预取两个面板当前选中的图片（仓库快照中不存在的文件不预取）；
+    # 只重跑某个面板时由该面板自己读取
+    selected_paths = {
+        "UMAP": umap_gene_paths.get(current_selection(umap_genes, "umap")) if umap_gene_paths else None,
+        "Violin": violin_gene_paths.get(current_selection(violin_genes, "violin")) if violin_gene_paths else None,
+    }
+    with PROFILE.stage("image_fetch"):
+        image_futures = {p: prefetch_github_image(p) for p in selected_paths.values() if p and github_file_exists(p)}
+    
     # 主内容区
     col1, col2 = st.columns(2)
     
-    # UMAP图片显示
     with col1:
-        st.subheader("UMAP 图片预览")
-        if selected_umap_gene and umap_gene_paths:
-            gene_path = umap_gene_paths.get(selected_umap_gene)
-            if gene_path:
-                display_image_preview(selected_umap_gene, gene_path, "UMAP")
-                
-                if show_details:
-                    display_path_analysis(gene_path, umap_genes, "UMAP")
-            else:
-                st.error(f"找不到 {selected_umap_gene} 的UMAP图片路径")
-        else:
-            st.info("请在左侧选择基因以显示UMAP图片")
-            
-            # 显示UMAP基因列表
-            if umap_genes:
-                st.subheader("可用UMAP基因")
-                display_gene_list(umap_genes, selected_umap_gene if 'selected_umap_gene' in locals() else None, "umap")
+        image_pane("UMAP", umap_genes, umap_gene_paths, show_details, image_futures)
     
-    # Violin图片显示
     with col2:
-        st.subheader("Violin 图片预览")
-        if selected_violin_gene and violin_gene_paths:
-            gene_path = violin_gene_paths.get(selected_violin_gene)
-            if gene_path:
-                display_image_preview(selected_violin_gene, gene_path, "Violin")
-                
-                if show_details:
-                    display_path_analysis(gene_path, violin_genes, "Violin")
-            else:
-                st.error(f"找不到 {selected_violin_gene} 的Violin图片路径")
-        else:
-            st.info("请在左侧选择基因以显示Violin图片")
-            
-            # 显示Violin基因列表
-            if violin_genes:
-                st.subheader("可用Violin基因")
-                display_gene_list(violin_genes, selected_violin_gene if 'selected_violin_gene' in locals() else None, "violin")
+        image_pane("Violin", violin_genes, violin_gene_paths, show_details, image_futures)
+    
+    # 多基因对比网格
+    if compare_genes:
+        st.markdown("---")
+        st.subheader(f"{compare_type} 多基因对比")
+        with PROFILE.stage("compare_grid"):
+            display_compare_grid(compare_genes, umap_gene_paths if compare_type == "UMAP" else violin_gene_paths,
+                                 compare_columns)
     
     # 添加JavaScript函数处理基因点击
     st.markdown("""
@@ -435,6 +518,8 @@ def main():
     }
     </script>
     """, unsafe_allow_html=True)
+    
+    PROFILE.finish()
 
 # 运行主应用程序
 if __name__ == "__main__":
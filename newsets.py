@@ -1,12 +1,14 @@
 import streamlit as st
 from PIL import Image
 import os
-import base64
 import requests
 from io import BytesIO, StringIO
-import re
 import csv
-import pandas as pd
+from gene_path_parser import describe_dropped, parse_gene_paths
+from image_cache import ImageCache
+from gene_search import GeneSearchIndex
+from github_client import GitHubClient
+from storage import DEFAULT_STORAGE, GitHubStorage, open_storage
 
 st.set_page_config(layout="wide", page_title="GitHub 基因图片智能定位系统")
 st.title("🧬 GitHub 基因图片智能定位系统")
@@ -95,37 +97,36 @@ HAS_HEADER = "true"                      # CSV是否有标题行
 GENE_COLUMN = "gene"                     # 基因列名
 PATH_COLUMN = "image_path"                     # 路径列名
 GITHUB_TOKEN = "your-github-token"  
+GITHUB_API_BASE = os.environ.get("GITHUB_API_BASE", "https://api.github.com")  # 可指向本地HTTP替身用于测试
+GITHUB_RAW_BASE = os.environ.get("GITHUB_RAW_BASE", "https://raw.githubusercontent.com")  # 可指向本地HTTP替身用于测试
+STORAGE = DEFAULT_STORAGE                # 数据源：github、local:<目录> 或 git:<仓库目录>[@<ref>]（环境变量 MAGE_STORAGE）
 
-# 获取GitHub API头信息
-def get_github_headers():
-    headers = {"Accept": "application/vnd.github.v3+json"}
-    if github_token:
-        headers["Authorization"] = f"token {github_token}"
-    return headers
+# 数据源（GitHub、本地目录或本地git仓库），跨重跑和会话共享
+@st.cache_resource
+def get_storage():
+    def make_github():
+        token = GITHUB_TOKEN if GITHUB_TOKEN and GITHUB_TOKEN != "your-github-token" else None
+        # 限流耗尽时不在脚本线程中等待，直接显示限流提示
+        client = GitHubClient(REPO_OWNER, REPO_NAME, BRANCH, token=token,
+                              api_base=GITHUB_API_BASE, raw_base=GITHUB_RAW_BASE, max_rate_wait=0)
+        return GitHubStorage(client, ImageCache(session=client))
+    return open_storage(STORAGE, make_github=make_github)
 
-# 获取GitHub文件内容
-@st.cache_data(ttl=600, show_spinner="正在从GitHub加载数据...")
+# 获取文件内容
+@st.cache_data(ttl=600, show_spinner="正在加载数据...")
 def get_github_file_content(path):
-    api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{path}?ref={branch}"
     try:
-        response = requests.get(api_url, headers=get_github_headers())
-        response.raise_for_status()
-        content = response.json().get("content", "")
-        return base64.b64decode(content).decode("utf-8")
+        return get_storage().read(path).decode("utf-8")
     except requests.exceptions.HTTPError as e:
         st.error(f"GitHub API错误 ({e.response.status_code}): {e.response.text}")
     except Exception as e:
         st.error(f"无法从GitHub获取文件: {str(e)}")
     return ""
 
-# 获取GitHub目录结构
-@st.cache_data(ttl=600)
+# 获取目录结构（GitHub后端来自仓库快照）
 def get_github_directory_structure(path):
-    api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{path}?ref={branch}"
     try:
-        response = requests.get(api_url, headers=get_github_headers())
-        response.raise_for_status()
-        return response.json()
+        return get_storage().listdir(path)
     except requests.exceptions.HTTPError as e:
         st.error(f"无法获取目录结构: {e.response.status_code} - {e.response.text}")
     except Exception as e:
@@ -139,37 +140,24 @@ def parse_gene_paths_from_csv(csv_content):
     # 使用StringIO将字符串转换为类文件对象
     csv_data = StringIO(csv_content)
     
+    # 读取CSV配置
+    csv_delimiter = CSV_DELIMITER
+    has_header = HAS_HEADER == "true"
+    gene_column = GENE_COLUMN
+    path_column = PATH_COLUMN
+    
     try:
-        # 尝试使用pandas解析CSV
+        # 尝试使用pandas整列解析CSV
         try:
-            df = pd.read_csv(
-                csv_content, 
+            gene_paths, dropped = parse_gene_paths(
+                csv_content,
+                gene_column,
+                path_column,
                 sep=csv_delimiter,
-                header=0 if has_header else None
+                has_header=has_header
             )
-            
-            # 尝试通过列名或索引识别列
-            if isinstance(gene_column, str) and gene_column in df.columns:
-                gene_col = gene_column
-            elif isinstance(gene_column, int) and gene_column < len(df.columns):
-                gene_col = df.columns[gene_column]
-            else:
-                gene_col = df.columns[0]  # 默认第一列
-                
-            if isinstance(path_column, str) and path_column in df.columns:
-                path_col = path_column
-            elif isinstance(path_column, int) and path_column < len(df.columns):
-                path_col = df.columns[path_column]
-            else:
-                path_col = df.columns[1] if len(df.columns) > 1 else df.columns[0]  # 默认第二列
-            
-            # 创建基因路径字典
-            for _, row in df.iterrows():
-                gene = str(row[gene_col]).strip()
-                path = str(row[path_col]).strip()
-                if gene and path:
-                    gene_paths[gene] = path
-                    
+            if dropped:
+                st.warning(describe_dropped(dropped))
             return gene_paths
         except Exception as e:
             st.warning(f"Pandas解析失败: {str(e)}，尝试使用CSV模块")
@@ -216,7 +204,7 @@ def parse_gene_paths_from_csv(csv_content):
 
 # 从GitHub获取基因路径信息
 def get_gene_paths_from_github():
-    content = get_github_file_content(config_path)
+    content = get_github_file_content(CONFIG_PATH)
     if content:
         gene_paths = parse_gene_paths_from_csv(content)
         if gene_paths:
@@ -224,17 +212,28 @@ def get_gene_paths_from_github():
         else:
             st.error("基因路径文件格式不正确或未找到有效数据。")
     else:
-        st.error(f"无法从路径 '{config_path}' 加载基因路径文件")
+        st.error(f"无法从路径 '{CONFIG_PATH}' 加载基因路径文件")
     return {}
 
-# 获取GitHub原始文件URL
+# 文件地址（GitHub原始文件URL，本地后端为文件位置）
 def get_github_raw_url(path):
-    return f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{branch}/{path}"
+    return get_storage().url(path)
 
 # 获取基因列表
 def get_gene_list(gene_paths):
     return sorted(gene_paths.keys())
 
+# 基因搜索索引，每个基因目录版本只构建一次（_genes 不参与缓存键）
+@st.cache_resource(max_entries=8)
+def get_gene_search_index(catalog_version, _genes):
+    return GeneSearchIndex(_genes)
+
+# 搜索基因：空查询返回全部，否则返回排序后的前若干个匹配（含拼写容错）
+def search_genes(genes, search_term):
+    if not search_term:
+        return genes
+    return get_gene_search_index(hash(tuple(genes)), genes).search(search_term)
+
 # 显示基因列表
 def display_gene_list(genes, selected_gene):
     st.markdown(f'<div class="gene-grid" style="display: grid; grid-template-columns: repeat(5, 1fr); gap: 8px;">', unsafe_allow_html=True)
@@ -248,21 +247,12 @@ def display_gene_list(genes, selected_gene):
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-# 获取GitHub图片
+# 获取图片（GitHub后端经本地缓存按ETag重新验证）
 def get_github_image(gene_path):
     try:
-        # 尝试直接获取图片
-        img_url = get_github_raw_url(gene_path)
-        response = requests.get(img_url, headers=get_github_headers(), stream=True)
-        response.raise_for_status()
-        
-        # 对于大文件，使用分块读取
-        img_data = BytesIO()
-        for chunk in response.iter_content(chunk_size=8192):
-            img_data.write(chunk)
-        img_data.seek(0)
+        img_data = get_storage().read(gene_path)
         
-        return Image.open(img_data)
+        return Image.open(BytesIO(img_data))
     except requests.exceptions.HTTPError as e:
         st.error(f"图片加载错误 ({e.response.status_code}): {e.response.text}")
     except Exception as e:
@@ -270,9 +260,8 @@ def get_github_image(gene_path):
     
     return None
 
-
-
-    
+# 主应用程序
+def main():
     # 加载基因路径信息
     with st.spinner("正在加载基因数据..."):
         gene_paths = get_gene_paths_from_github()
@@ -292,7 +281,7 @@ def get_github_image(gene_path):
         search_term = st.text_input("搜索基因", "", key="gene_search")
         
         # 过滤基因列表
-        filtered_genes = [g for g in genes if not search_term or search_term.lower() in g.lower()]
+        filtered_genes = search_genes(genes, search_term)
         
         # 选择基因
         if filtered_genes:
@@ -316,6 +305,7 @@ def get_github_image(gene_path):
         # 刷新按钮
         if st.button("刷新数据", use_container_width=True):
             st.cache_data.clear()
+            get_storage().refresh()
             st.rerun()
 
     # 主内容区
@@ -380,10 +370,9 @@ def get_github_image(gene_path):
                 st.code(f"目录: {os.path.dirname(gene_path)}")
                 st.code(f"扩展名: {os.path.splitext(gene_path)[1]}")
                 
-                # 检查文件是否存在
+                # 检查文件是否存在（GitHub后端来自仓库快照）
                 try:
-                    response = requests.head(get_github_raw_url(gene_path), headers=get_github_headers())
-                    exists = response.status_code == 200
+                    exists = get_storage().exists(gene_path)
                     st.code(f"文件状态: {'✅ 存在' if exists else '❌ 不存在'}")
                     if not exists:
                         st.warning("文件在指定路径不存在，请检查基因路径配置")
@@ -391,13 +380,12 @@ def get_github_image(gene_path):
                     st.code("文件状态: ❓未知")
             
             with col2:
-                st.markdown("### GitHub API信息")
-                st.code(f"仓库: {repo_owner}/{repo_name}")
-                st.code(f"分支: {branch}")
-                st.code(f"配置文件: {config_path}")
+                st.markdown("### 数据源信息")
+                st.code(f"数据源: {get_storage().describe()}")
+                st.code(f"配置文件: {CONFIG_PATH}")
                 st.code(f"基因数量: {len(genes)}")
-                st.code(f"CSV分隔符: '{csv_delimiter}'")
-                st.code(f"标题行: {'是' if has_header else '否'}")
+                st.code(f"CSV分隔符: '{CSV_DELIMITER}'")
+                st.code(f"标题行: {'是' if HAS_HEADER == 'true' else '否'}")
     
     # 所有基因列表
     st.subheader(f"所有可用基因 ({len(genes)})")
@@ -421,8 +409,6 @@ def get_github_image(gene_path):
     </script>
     """, unsafe_allow_html=True)
 
-
-
-
-    
-  
+# 运行主应用程序
+if __name__ == "__main__":
+    main()
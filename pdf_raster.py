@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from file_hash import FileHashes, hash_bytes
+
+# PDF小提琴图栅格化缓存
+#
+# 每个PDF按源文件内容的SHA-256作为键，在固定DPI下渲染为PNG一次：
+#   <cache_dir>/<sha256前两位>/<sha256>/<dpi>.png
+# 渲染器优先使用PyMuPDF（可选依赖），否则调用poppler的pdftoppm。
+# 查看时只需读取一个静态PNG，不再由浏览器解析PDF。
+DEFAULT_CACHE_DIR = os.environ.get("MAGE_RASTER_CACHE_DIR", ".raster_cache")
+DEFAULT_DPIS = (72, 150, 300)
+DEFAULT_DPI = 150
+FULL_RES_DPI = 300  # bigsets.py "加载原图"
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+
+# 渲染PDF第一页为PNG字节
+def render_pdf_page(pdf_bytes, dpi):
+    if pymupdf is not None:
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return doc[0].get_pixmap(dpi=dpi).tobytes("png")
+
+    if shutil.which("pdftoppm") is None:
+        raise RuntimeError("没有可用的PDF渲染器，请安装 pymupdf 或 poppler-utils")
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "in.pdf")
+        with open(src, "wb") as f:
+            f.write(pdf_bytes)
+        subprocess.run(
+            ["pdftoppm", "-png", "-r", str(dpi), "-f", "1", "-l", "1", "-singlefile", src, os.path.join(tmp, "out")],
+            check=True, capture_output=True,
+        )
+        with open(os.path.join(tmp, "out.png"), "rb") as f:
+            return f.read()
+
+
+# 栅格缓存
+class RasterCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, hashes=None):
+        self.cache_dir = cache_dir
+        self._hashes = hashes or FileHashes()  # 避免每次查看都重新计算哈希
+
+    def output_path(self, digest, dpi):
+        return os.path.join(self.cache_dir, digest[:2], digest, f"{dpi}.png")
+
+    # 源文件内容哈希（按路径+mtime+大小记忆）
+    def source_hash(self, pdf_path):
+        return self._hashes(pdf_path)
+
+    def _write(self, out, png):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out), suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(png)
+        os.replace(tmp, out)
+
+    # 已缓存的PNG路径，不存在时返回None（不触发渲染）
+    def cached_path(self, pdf_path, dpi=DEFAULT_DPI):
+        out = self.output_path(self.source_hash(pdf_path), dpi)
+        return out if os.path.exists(out) else None
+
+    # 返回PDF在指定DPI下的PNG路径，必要时渲染
+    def rasterize(self, pdf_path, dpi=DEFAULT_DPI):
+        out = self.output_path(self.source_hash(pdf_path), dpi)
+        if not os.path.exists(out):
+            with open(pdf_path, "rb") as f:
+                self._write(out, render_pdf_page(f.read(), dpi))
+        return out
+
+    # 对已在内存中的PDF字节（如从GitHub下载）栅格化，返回PNG字节
+    def rasterize_bytes(self, pdf_bytes, dpi=DEFAULT_DPI):
+        out = self.output_path(hash_bytes(pdf_bytes), dpi)
+        try:
+            with open(out, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            png = render_pdf_page(pdf_bytes, dpi)
+            self._write(out, png)
+            return png
+
+
+def is_pdf(path):
+    return path.lower().endswith(".pdf")
+
+
+# 子进程任务：渲染单个PDF的全部DPI
+def _rasterize_job(cache_dir, pdf_path, dpis):
+    cache = RasterCache(cache_dir)
+    return pdf_path, [cache.rasterize(pdf_path, dpi) for dpi in dpis]
+
+
+# 批量栅格化：用进程池在多核上并行
+def rasterize_all(pdf_paths, dpis=DEFAULT_DPIS, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    results, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_rasterize_job, cache_dir, path, tuple(dpis)): path for path in pdf_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()[1]
+            except Exception as e:
+                failures[path] = str(e)
+    return results, failures
+
+
+def find_pdfs(roots):
+    for root in roots:
+        if os.path.isfile(root):
+            yield root
+            continue
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for file in files:
+                if is_pdf(file):
+                    yield os.path.join(dirpath, file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把小提琴图PDF批量栅格化为PNG缓存")
+    parser.add_argument("roots", nargs="*", default=["VlnPlot"], help="PDF文件或目录")
+    parser.add_argument("--dpi", type=int, nargs="+", default=list(DEFAULT_DPIS))
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数")
+    args = parser.parse_args(argv)
+
+    pdfs = sorted(set(find_pdfs(args.roots)))
+    results, failures = rasterize_all(pdfs, args.dpi, args.cache_dir, args.workers)
+    print(json.dumps({"rendered": len(results), "failed": failures}, ensure_ascii=False, indent=1))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import posixpath
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# GitHub仓库快照
+#
+# 用一次递归 git trees 请求取得某个提交的全部路径，保存为内存中的路径索引；
+# 文件是否存在、目录列表和路径修正建议都由索引回答，不再逐个调用 contents API 或 HEAD 原始文件。
+# 分支头SHA最多每 check_interval 秒检查一次（带 If-None-Match，未变化时GitHub返回304，不计入限流），
+# SHA变化时才重新拉取目录树；快照按提交SHA缓存。
+DEFAULT_CHECK_INTERVAL = float(os.environ.get("MAGE_SNAPSHOT_CHECK_INTERVAL", "60"))
+SHA_MEDIA_TYPE = "application/vnd.github.sha"
+FIGURE_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".webp", ".svg")
+
+
+# 映射路径规范化：统一为 / 分隔、去掉开头的 ./ 和 /（validate_mapping.py 与存储后端共用）
+def normalize_path(path):
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+def is_figure(path):
+    return path.lower().endswith(FIGURE_EXTENSIONS)
+
+
+# 文件名索引：不计扩展名的文件名（小写） -> 图片路径
+class BasenameIndex:
+    def __init__(self, files):
+        self._by_stem = defaultdict(list)
+        for path in files:
+            if is_figure(path):
+                self._by_stem[os.path.splitext(path.rsplit("/", 1)[-1])[0].lower()].append(path)
+
+    # 返回 (建议路径或None, 最优候选列表)
+    def suggest(self, path):
+        directory, _, name = path.rpartition("/")
+        stem, ext = os.path.splitext(name)
+        dir_parts = directory.split("/") if directory else []
+
+        def score(candidate):
+            parts = candidate.split("/")[:-1]
+            shared = 0
+            for a, b in zip(parts, dir_parts):
+                if a != b:
+                    break
+                shared += 1
+            cand_stem, cand_ext = os.path.splitext(candidate.rsplit("/", 1)[-1])
+            return shared, cand_ext.lower() == ext.lower(), cand_stem == stem
+
+        candidates = self._by_stem.get(stem.lower(), [])
+        if not candidates:
+            return None, []
+        scored = sorted(((score(c), c) for c in candidates), reverse=True)
+        best = [c for s, c in scored if s == scored[0][0]]
+        return (best[0] if len(best) == 1 else None), sorted(best)
+
+
+class RepoSnapshot:
+    def __init__(self, sha, entries):
+        self.sha = sha
+        self.files = {}  # 路径 -> 字节数
+        dirs = {""}
+        for entry in entries:
+            if entry["type"] == "blob":
+                self.files[entry["path"]] = entry.get("size", 0)
+            elif entry["type"] == "tree":
+                dirs.add(entry["path"])
+        # 补齐上级目录（截断后补齐的子树中可能缺少）
+        for path in list(self.files) + list(dirs):
+            parent = posixpath.dirname(path)
+            while parent not in dirs:
+                dirs.add(parent)
+                parent = posixpath.dirname(parent)
+
+        self.dirs = {path: [] for path in dirs}  # 目录 -> [(名称, "dir"/"file")]，目录在前
+        for path in sorted(dirs - {""}):
+            self.dirs[posixpath.dirname(path)].append((posixpath.basename(path), "dir"))
+        for path in sorted(self.files):
+            self.dirs[posixpath.dirname(path)].append((posixpath.basename(path), "file"))
+        self._basenames = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def exists(self, path):
+        return path.strip("/") in self.files
+
+    def is_dir(self, path):
+        return path.strip("/") in self.dirs
+
+    # 目录列表，格式与 contents API 一致：[{"name", "path", "type"}]
+    def listdir(self, path):
+        path = path.strip("/")
+        return [{"name": name, "path": posixpath.join(path, name), "type": kind}
+                for name, kind in self.dirs.get(path, [])]
+
+    # 路径不存在时按文件名索引给出 (建议路径或None, 候选列表)
+    def suggest(self, path):
+        if self._basenames is None:
+            self._basenames = BasenameIndex(self.files)
+        return self._basenames.suggest(path.strip("/"))
+
+
+# 读取整棵树；递归结果被截断时，逐级对子树并行补齐
+def fetch_tree_entries(client, sha):
+    tree = client.get_tree(sha)
+    if not tree.get("truncated"):
+        return tree.get("tree", [])
+
+    entries = []
+    pending = [("", tree.get("sha", sha))]
+    while pending:
+        results = client.map(lambda item: client.get_tree(item[1], recursive=False), pending)
+        pending = []
+        for (prefix, _), result in results.items():
+            if isinstance(result, Exception):
+                raise result
+            for entry in result.get("tree", []):
+                entry = dict(entry, path=posixpath.join(prefix, entry["path"]))
+                entries.append(entry)
+                if entry["type"] == "tree":
+                    pending.append((entry["path"], entry["sha"]))
+    return entries
+
+
+# 按分支头SHA刷新的快照，线程安全，供整个进程共享
+class RepoSnapshots:
+    def __init__(self, client, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.client = client
+        self.check_interval = check_interval
+        self._snapshots = {}   # 提交SHA -> RepoSnapshot
+        self._head = None      # (sha, etag)
+        self._checked = None   # 上次检查分支头的时间（monotonic）
+        self._lock = threading.Lock()
+
+    # 分支头SHA；未变化时GitHub返回304
+    def _head_sha(self):
+        headers = {"Accept": SHA_MEDIA_TYPE}
+        if self._head and self._head[1]:
+            headers["If-None-Match"] = self._head[1]
+        response = self.client.get(self.client.commit_url(self.client.branch), headers=headers)
+        if response.status_code == 304 and self._head:
+            return self._head[0]
+        response.raise_for_status()
+        self._head = (response.text.strip(), response.headers.get("ETag"))
+        return self._head[0]
+
+    # 下次 current() 时立即检查分支头（如用户点击刷新）
+    def expire(self):
+        with self._lock:
+            self._checked = None
+
+    # 当前分支的快照；check_interval 内直接返回，不发请求
+    # 快照生成成功后才记录检查时间，拉取目录树失败时下次调用会重试
+    def current(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is not None and now - self._checked < self.check_interval:
+                snapshot = self._snapshots.get(self._head[0]) if self._head else None
+                if snapshot is not None:
+                    return snapshot
+            sha = self._head_sha()
+            snapshot = self._snapshots.get(sha)
+            if snapshot is None:
+                snapshot = RepoSnapshot(sha, fetch_tree_entries(self.client, sha))
+                self._snapshots = {sha: snapshot}  # 只保留当前提交
+            self._checked = now
+            return snapshot
+
+
+def main(argv=None):
+    from github_client import GitHubClient
+
+    parser = argparse.ArgumentParser(description="列出GitHub仓库某分支的全部文件（一次递归树请求）")
+    parser.add_argument("repo", metavar="OWNER/REPO")
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--check", nargs="*", default=[], help="检查这些路径是否存在")
+    parser.add_argument("--json", help="把文件列表写入JSON文件")
+    args = parser.parse_args(argv)
+
+    owner, _, repo = args.repo.partition("/")
+    client = GitHubClient(owner, repo, args.branch, token=os.environ.get("GITHUB_TOKEN"),
+                          api_base=os.environ.get("GITHUB_API_BASE", "https://api.github.com"))
+    try:
+        snapshot = RepoSnapshots(client).current()
+    finally:
+        client.close()
+    print(f"{args.repo}@{args.branch} {snapshot.sha}: {len(snapshot)} 个文件，{len(snapshot.dirs)} 个目录")
+    missing = 0
+    for path in args.check:
+        if snapshot.exists(path):
+            print(f"  存在    {path}")
+        else:
+            missing += 1
+            suggestion, candidates = snapshot.suggest(path)
+            print(f"  不存在  {path}" + (f" -> {suggestion}" if suggestion else
+                                       f"（候选：{', '.join(candidates[:5])}）" if candidates else ""))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"sha": snapshot.sha, "files": snapshot.files}, f, ensure_ascii=False, indent=1)
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
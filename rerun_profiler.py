@@ -0,0 +1,254 @@
+import argparse
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from metrics import LATENCY_BUCKETS
+
+# Streamlit 重跑分析（可选启用）
+#
+# 环境变量 MAGE_PROFILE=1 或页面地址带 ?profile=1 时启用。每次重跑：
+#   start_rerun() 开始计时，profile.stage(name) 累计各阶段耗时（同名阶段多次进入时相加），
+#   profiled_cache(...) 包装的缓存函数统计调用次数和未命中次数（只有未命中时函数体才会执行），
+#   profile.finish() 在页面底部显示可折叠的本次耗时明细，并把汇总（次数、总和、最大值、直方图）
+#   写入 MAGE_PROFILE_FILE（默认 .rerun_profile.json），可用 `python rerun_profiler.py` 离线查看。
+# st.fragment 中用 fragment_profile(page) 包住片段主体：整页重跑时计入当前重跑，
+# 只重跑片段时单独计时，记为 page（如 "newnew/umap"）；片段可能调用的函数用 stage(name) 计入当前的那个。
+# 未启用时 stage() 为空上下文，缓存包装只多一次函数调用。
+PROFILE_ENABLED = os.environ.get("MAGE_PROFILE", "").lower() in ("1", "true", "yes")
+PROFILE_FILE = os.environ.get("MAGE_PROFILE_FILE", ".rerun_profile.json")
+OTHER_STAGE = "other"
+
+_current = threading.local()  # 每个会话的脚本线程各自的当前重跑
+
+
+# 进程内汇总，写入JSON文件（原子替换），启动时从文件继续累计
+class ProfileAggregates:
+    def __init__(self, path=PROFILE_FILE, buckets=LATENCY_BUCKETS):
+        self.path = path
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.data = {}
+
+    def _observe(self, series, seconds):
+        if not series:
+            series.update(count=0, sum=0.0, max=0.0, buckets=[0] * (len(self.buckets) + 1))
+        series["count"] += 1
+        series["sum"] += seconds
+        series["max"] = max(series["max"], seconds)
+        series["buckets"][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def record(self, page, total, stages, caches):
+        with self._lock:
+            entry = self.data.setdefault(page, {"bucket_bounds": list(self.buckets), "total": {},
+                                                "stages": {}, "caches": {}})
+            self._observe(entry["total"], total)
+            for name, (seconds, _) in stages.items():
+                self._observe(entry["stages"].setdefault(name, {}), seconds)
+            for name, (calls, misses) in caches.items():
+                counts = entry["caches"].setdefault(name, {"calls": 0, "misses": 0})
+                counts["calls"] += calls
+                counts["misses"] += misses
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+
+_aggregates = None
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregates():
+    global _aggregates
+    with _aggregates_lock:
+        if _aggregates is None:
+            _aggregates = ProfileAggregates()
+        return _aggregates
+
+
+# 一次重跑的计时与缓存统计
+class RerunProfile:
+    def __init__(self, page, enabled):
+        self.page = page
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.stages = {}  # 阶段 -> [秒, 次数]
+        self.caches = {}  # 函数 -> [命中, 未命中]
+        self.finished = False
+
+    def stage(self, name):
+        return self._stage(name) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += time.perf_counter() - start
+            stage[1] += 1
+
+    def count_cache(self, name, miss):
+        counts = self.caches.setdefault(name, [0, 0])
+        counts[1 if miss else 0] += 1
+
+    # 显示本次重跑的明细并写入汇总
+    def finish(self):
+        self.finished = True
+        if not self.enabled:
+            return
+        import pandas as pd
+        import streamlit as st
+
+        total = time.perf_counter() - self.started
+        stages = dict(self.stages)
+        stages[OTHER_STAGE] = [max(0.0, total - sum(s for s, _ in stages.values())), 1]
+        caches = {name: (hits + misses, misses) for name, (hits, misses) in self.caches.items()}
+        get_aggregates().record(self.page, total, stages, caches)
+
+        with st.expander(f"⏱ 本次重跑 {total * 1000:.0f} ms", expanded=False):
+            st.dataframe(pd.DataFrame(
+                [{"阶段": name, "耗时 (ms)": round(seconds * 1000, 1), "次数": count,
+                  "占比": f"{seconds / total:.0%}" if total else "-"}
+                 for name, (seconds, count) in sorted(stages.items(), key=lambda item: -item[1][0])]),
+                hide_index=True, use_container_width=True)
+            if caches:
+                st.dataframe(pd.DataFrame(
+                    [{"缓存函数": name, "调用": calls, "命中": calls - misses, "未命中": misses}
+                     for name, (calls, misses) in sorted(caches.items())]),
+                    hide_index=True, use_container_width=True)
+            st.caption(f"汇总写入 {os.path.abspath(PROFILE_FILE)}，`python rerun_profiler.py` 查看")
+
+
+def profiling_requested():
+    if PROFILE_ENABLED:
+        return True
+    import streamlit as st
+    try:
+        return st.query_params.get("profile") in ("1", "true")
+    except Exception:
+        return False
+
+
+# 每次重跑开始时调用（脚本顶部），返回本次重跑的 RerunProfile
+def start_rerun(page):
+    profile = RerunProfile(page, profiling_requested())
+    _current.profile = profile
+    return profile
+
+
+def current_profile():
+    return getattr(_current, "profile", None)
+
+
+# 计入当前重跑的阶段（没有进行中的重跑时为空上下文）
+def stage(name):
+    profile = current_profile()
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+# 片段主体：整页重跑中（当前重跑还没有 finish）直接计入；只重跑片段时脚本顶部不会执行，
+# 这时为片段开始一次单独的重跑，结束时在片段内显示明细
+@contextmanager
+def fragment_profile(page):
+    profile = current_profile()
+    if profile is not None and not profile.finished:
+        yield profile
+        return
+    profile = start_rerun(page)
+    try:
+        yield profile
+    finally:
+        profile.finish()
+
+
+# 包装 st.cache_data / st.cache_resource，统计调用和未命中次数：
+#   @profiled_cache(st.cache_data(ttl=600))
+#   def fetch(...): ...
+# 缓存的键和原函数一致（functools.wraps 保留名称，取源码时会解包到原函数）
+def profiled_cache(cache_decorator, name=None):
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def compute(*args, **kwargs):
+            profile = current_profile()
+            if profile is not None and profile.enabled:
+                profile.count_cache(label, miss=True)
+            return fn(*args, **kwargs)
+
+        cached = cache_decorator(compute)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            profile = current_profile()
+            if profile is None or not profile.enabled:
+                return cached(*args, **kwargs)
+            misses = profile.caches.get(label, [0, 0])[1]
+            result = cached(*args, **kwargs)
+            # 未命中已由 compute 计入；没有新增未命中即为命中
+            if profile.caches.get(label, [0, 0])[1] == misses:
+                profile.count_cache(label, miss=False)
+            return result
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+
+# 按直方图估计分位数（桶上界）
+def bucket_quantile(series, bounds, q):
+    target = q * series["count"]
+    cumulative = 0
+    for bound, count in zip(list(bounds) + [float("inf")], series["buckets"]):
+        cumulative += count
+        if cumulative >= target:
+            return min(bound, series["max"])
+    return series["max"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看Streamlit重跑分析的汇总")
+    parser.add_argument("path", nargs="?", default=PROFILE_FILE)
+    parser.add_argument("--json", action="store_true", help="输出原始JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        print(f"{args.path} 不存在；以 MAGE_PROFILE=1 运行页面或在地址后加 ?profile=1 以记录")
+        return 1
+    if args.json:
+        print(json.dumps(data, ensure_ascii=False, indent=1))
+        return 0
+
+    for page, entry in data.items():
+        bounds = entry["bucket_bounds"]
+        total = entry["total"]
+        print(f"== {page}: {total['count']} 次重跑，平均 {total['sum'] / total['count'] * 1000:.1f} ms")
+        print(f"  {'阶段':24s} {'平均ms':>9s} {'p50≤ms':>9s} {'p95≤ms':>9s} {'最大ms':>9s} {'占比':>6s}")
+        for name, series in sorted(entry["stages"].items(), key=lambda item: -item[1]["sum"]):
+            print(f"  {name:24s} {series['sum'] / series['count'] * 1000:9.1f}"
+                  f" {bucket_quantile(series, bounds, 0.5) * 1000:9.1f}"
+                  f" {bucket_quantile(series, bounds, 0.95) * 1000:9.1f}"
+                  f" {series['max'] * 1000:9.1f} {series['sum'] / total['sum']:6.0%}")
+        for name, counts in sorted(entry["caches"].items()):
+            hits = counts["calls"] - counts["misses"]
+            print(f"  缓存 {name}: {counts['calls']} 次调用，命中 {hits}（{hits / max(1, counts['calls']):.0%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,58 +1,160 @@
 import streamlit as st
-from PIL import Image
 import os
+from image_optimize import VariantIndex
+from image_pyramid import PyramidIndex
+from image_tiles import DisplayCache, GridItem, TileLoader, file_tile_key, render_tile_grid, tile_width
+from umap_render import UmapRenderer, has_dataset
+from violin_store import ViolinRenderer
+
+# 结果区显示宽度（像素），用于选择图片分级
+RESULT_DISPLAY_WIDTH = 1100
+
+# 图片金字塔清单（由 image_pyramid.py 生成），跨重跑共享
+@st.cache_resource
+def get_pyramid_index():
+    return PyramidIndex("images")
+
+# 无损重新压缩的变体清单（由 image_optimize.py 生成），原图按解码最快的变体读取
+@st.cache_resource
+def get_variant_index():
+    return VariantIndex("images")
+
+# 预渲染UMAP图片对应的基因（images/<基因>.png）
+IMAGE_GENES = ["ACTA2","CD3D", "CD3E","CD4","CD8A", "CD14","CD68","CD79A",
+               "CLEC10A","COL1A1","CSF3R","DCN","FAP","FOXP3","IGHG1",
+               "IGKC","JCHAIN","KRT8","KRT18","KRT19","NKG7","TPSB2","VWF","EPCAM"]
+
+# UMAP即时渲染器（umap_data/ 下有坐标和表达矩阵时启用，可显示数据中的全部基因）
+@st.cache_resource
+def get_umap_renderer():
+    return UmapRenderer() if has_dataset() else None
+
+# 小提琴图渲染器（violin_store.py build 生成的摘要，按需渲染并缓存PNG）
+@st.cache_resource
+def get_violin_renderer():
+    return ViolinRenderer()
+
+# 摘要不存在时的默认选项
+VIOLIN_GENES = ["ACTA2", "CD3D", "CD8A", "CD68", "EPCAM", "VWF"]
+VIOLIN_METAS = ["Cell type", "Patient ID", "Treatment"]
+
+# 显示缓存（解码、缩小、编码后的字节，按路径+mtime失效），跨重跑共享
+@st.cache_resource
+def get_display_cache():
+    return DisplayCache()
+
+# 对比网格的图块加载器（线程池 + 已解码图块缓存），跨重跑共享
+@st.cache_resource
+def get_tile_loader():
+    return TileLoader()
+
+# 对比网格中一个基因的图块：优先即时渲染，否则用预渲染图片中适合图块宽度的分级
+def umap_grid_item(gene, width):
+    umap_renderer = get_umap_renderer()
+    if umap_renderer is not None and gene in umap_renderer:
+        return GridItem(gene, ("umap", umap_renderer.version, gene, width), lambda: umap_renderer.render(gene))
+    image_path = f"images/{gene}.png"
+    if os.path.exists(image_path):
+        pyramid, variants = get_pyramid_index(), get_variant_index()
+        return GridItem(gene, file_tile_key(image_path, width),
+                        lambda: variants.fastest(pyramid.best_path(image_path, width)))
+    return GridItem(gene, None, lambda: None)
 
 # 设置页面布局
 st.set_page_config(layout="wide")
 st.title("图片选择展示网站")
 
-# 创建左右两列布局
-left_col, right_col = st.columns([1, 3])
-
-with left_col:
-    # 左侧区域分为上下两部分
-    st.header("🛠️ 控制面板")
-    
-    # UMAP部分
-    st.subheader("UMAP Plot")
-    col1, col2 = st.columns(2)
-    with col1:
-        # 移除sidebar，使用普通控件
+# 控制面板在左、结果在右；每个面板（UMAP、Violin、多基因对比）是一个片段（st.fragment），
+# 面板内的控件只重跑该面板，不会重新执行其它面板的查找、读取和解码
+header_left, header_right = st.columns([1, 3])
+header_left.header("🛠️ 控制面板")
+header_right.header("📊 结果展示")
+
+@st.fragment
+def umap_pane():
+    left_col, right_col = st.columns([1, 3])
+    umap_renderer = get_umap_renderer()
+    with left_col:
+        st.subheader("UMAP Plot")
         feature1 = st.selectbox("Gene", 
-                               ["ACTA2","CD3D", "CD3E","CD4","CD8A", "CD14","CD68","CD79A",
-                                "CLEC10A","COL1A1","CSF3R","DCN","FAP","FOXP3","IGHG1",
-                                "IGKC","JCHAIN","KRT8","KRT18","KRT19","NKG7","TPSB2","VWF","EPCAM"],
+                               umap_renderer.genes if umap_renderer else IMAGE_GENES,
                                key="gene1")
-    with col2:
-        feature2 = st.selectbox("Major cell type",
-                               ["T cells", "B cells", "Macrophages", "Fibroblasts", "Endothelial"],
-                               key="celltype1")
-    
-    # 提交按钮应该在左侧列内
-    submit_umap = st.button("显示UMAP图", key="submit_umap")
-    
-    st.markdown("---")
-    
-    # 下部：分析选项
-    st.subheader("Violin Plot")
-    col3, col4 = st.columns(2)
-    with col3:
-        feature3 = st.selectbox("Gene", 
-                               ["ACTA2", "CD3D", "CD8A", "CD68", "EPCAM", "VWF"],
-                               key="gene2")
-    with col4:
-        feature4 = st.selectbox("meta information", 
-                               ["Cell type", "Patient ID", "Treatment"],
-                               key="meta1")
-    submit_violin = st.button("显示Violin图", key="submit_violin")
- with right_col:
-    st.header("📊 结果展示")
-    
-     
-    if submit:
-       image_path = f"images/{feature1}.png" or f"images/{feature2}.png"
-
-       if os.path.exists(image_path):
-           st.image(Image.open(image_path), caption=f"{feature1}" or f"{feature2}", use_container_width=True)
-       else:
-           st.warning("找不到对应的图片，请确认参数组合和文件名是否一致。")
+        submit_umap = st.button("显示UMAP图", key="submit_umap")
+        st.markdown("---")
+
+    with right_col:
+        # 记住已提交的基因，切换"加载原图"时不丢失结果
+        if submit_umap:
+            st.session_state["shown_umap_gene"] = feature1
+        shown_gene = st.session_state.get("shown_umap_gene")
+        if not shown_gene:
+            return
+        image_path = f"images/{shown_gene}.png"
+
+        if umap_renderer is not None and shown_gene in umap_renderer:
+            # 渲染结果已是PNG，指定格式后 st.image 不再转码
+            st.image(umap_renderer.render(shown_gene), caption=f"{shown_gene}", use_container_width=True,
+                     output_format="PNG")
+        elif os.path.exists(image_path):
+            # 默认显示适合栏宽的分级图片，原图按需加载
+            if st.toggle("加载原图", key="umap_full_res"):
+                display_path = get_variant_index().fastest(image_path)
+            else:
+                display_path = get_variant_index().fastest(get_pyramid_index().best_path(image_path, RESULT_DISPLAY_WIDTH))
+            st.image(get_display_cache().get(display_path), caption=f"{shown_gene}", use_container_width=True)
+        else:
+            st.warning("找不到对应的图片，请确认参数组合和文件名是否一致。")
+
+@st.fragment
+def violin_pane():
+    left_col, right_col = st.columns([1, 3])
+    violin_renderer = get_violin_renderer()
+    store = violin_renderer.store
+    with left_col:
+        st.subheader("Violin Plot")
+        col3, col4 = st.columns(2)
+        with col4:
+            feature4 = st.selectbox("meta information", 
+                                   store.metas() or VIOLIN_METAS,
+                                   key="meta1")
+        with col3:
+            summary = store.summary(feature4)
+            feature3 = st.selectbox("Gene", 
+                                   summary.genes if summary is not None else VIOLIN_GENES,
+                                   key="gene2")
+        submit_violin = st.button("显示Violin图", key="submit_violin")
+        st.markdown("---")
+
+    with right_col:
+        if submit_violin:
+            st.session_state["shown_violin"] = (feature4, feature3)
+        shown = st.session_state.get("shown_violin")
+        if not shown:
+            return
+        meta, gene = shown
+        png = violin_renderer.render(meta, gene)
+        if png is None:
+            st.warning("找不到对应的小提琴图摘要，请先运行 violin_store.py build。")
+        else:
+            st.image(png, caption=f"{gene} / {meta}", use_container_width=True, output_format="PNG")
+
+@st.fragment
+def compare_pane():
+    left_col, right_col = st.columns([1, 3])
+    umap_renderer = get_umap_renderer()
+    with left_col:
+        st.subheader("多基因对比")
+        compare_genes = st.multiselect("Genes",
+                                       umap_renderer.genes if umap_renderer else IMAGE_GENES,
+                                       key="compare_genes")
+        compare_columns = st.slider("每行图片数", 2, 6, 4, key="compare_columns")
+    with right_col:
+        if compare_genes:
+            st.subheader("多基因对比")
+            width = tile_width(compare_columns)
+            render_tile_grid([umap_grid_item(gene, width) for gene in compare_genes],
+                             get_tile_loader(), compare_columns, width)
+
+umap_pane()
+violin_pane()
+compare_pane()
@@ -0,0 +1,259 @@
+import os
+import posixpath
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from repo_snapshot import BasenameIndex, RepoSnapshot, RepoSnapshots
+
+# 映射和图片的存储后端（newnew.py / newsets.py 共用）
+#
+# MAGE_STORAGE 选择后端：
+#   github                  GitHub API + raw（默认），图片经本地 ImageCache 按 ETag 重新验证
+#   local:<目录>            本地工作副本（如本仓库的 checkout）
+#   git:<仓库目录>[@<ref>]  本地git仓库（普通clone的工作区目录，或 `git clone --mirror` 得到的裸仓库），
+#                           用常驻的 `git cat-file --batch` 读取对象，`git ls-tree` 生成路径索引；
+#                           由定时 `git fetch` 同步，ref 指向的提交变化时自动刷新
+# 各后端提供相同的方法：read / exists / listdir / suggest / url / describe，以及 submit / map 并发读取。
+DEFAULT_STORAGE = os.environ.get("MAGE_STORAGE", "github")
+DEFAULT_CHECK_INTERVAL = float(os.environ.get("MAGE_STORAGE_CHECK_INTERVAL", "60"))
+
+
+class Storage:
+    name = "storage"
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.name)
+
+    # 在线程池中执行，返回Future
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    # 并发执行 fn(item)，返回 {item: 结果或异常}
+    def map(self, fn, items):
+        futures = {item: self.submit(fn, item) for item in items}
+        results = {}
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                results[item] = e
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class GitHubStorage(Storage):
+    name = "github"
+
+    def __init__(self, client, image_cache, snapshots=None):
+        super().__init__()
+        self.client = client
+        self.image_cache = image_cache
+        self.snapshots = snapshots or RepoSnapshots(client)
+
+    def _snapshot(self):
+        try:
+            return self.snapshots.current()
+        except Exception:
+            return None
+
+    def read(self, path):
+        key = f"{self.client.owner}/{self.client.repo}/{self.client.branch}/{path}"
+        return self.image_cache.fetch(key, self.client.raw_url(path))
+
+    # 存在检查和目录列表来自仓库快照，快照不可用时退回逐个请求
+    def exists(self, path):
+        snapshot = self._snapshot()
+        return snapshot.exists(path) if snapshot is not None else self.client.exists(path)
+
+    def listdir(self, path):
+        snapshot = self._snapshot()
+        return snapshot.listdir(path) if snapshot is not None else self.client.get_directory(path)
+
+    def suggest(self, path):
+        snapshot = self._snapshot()
+        return snapshot.suggest(path) if snapshot is not None else (None, [])
+
+    def url(self, path):
+        return self.client.raw_url(path)
+
+    def describe(self):
+        return f"GitHub {self.client.owner}/{self.client.repo}@{self.client.branch}"
+
+    def refresh(self):
+        self.snapshots.expire()
+
+    def close(self):
+        super().close()
+        self.client.close()
+
+
+class LocalStorage(Storage):
+    name = "local"
+
+    def __init__(self, root, check_interval=DEFAULT_CHECK_INTERVAL):
+        super().__init__()
+        self.root = os.path.abspath(root)
+        self.check_interval = check_interval
+        self._basenames = None
+        self._indexed = None
+        self._lock = threading.Lock()
+
+    def _full_path(self, path):
+        full = os.path.normpath(os.path.join(self.root, path.strip("/")))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise FileNotFoundError(path)
+        return full
+
+    def read(self, path):
+        with open(self._full_path(path), "rb") as f:
+            return f.read()
+
+    def exists(self, path):
+        try:
+            return os.path.isfile(self._full_path(path))
+        except FileNotFoundError:
+            return False
+
+    def listdir(self, path):
+        path = path.strip("/")
+        try:
+            with os.scandir(self._full_path(path)) as entries:
+                items = [{"name": e.name, "path": posixpath.join(path, e.name), "type": "dir" if e.is_dir() else "file"}
+                         for e in entries if not e.name.startswith(".")]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        return sorted(items, key=lambda item: (item["type"] != "dir", item["name"]))
+
+    # 文件名索引每 check_interval 秒最多重建一次
+    def suggest(self, path):
+        with self._lock:
+            now = time.monotonic()
+            if self._indexed is None or now - self._indexed >= self.check_interval:
+                files = []
+                for dirpath, dirs, names in os.walk(self.root):
+                    dirs[:] = [d for d in dirs if not d.startswith(".")]
+                    rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+                    files.extend(name if rel == "." else f"{rel}/{name}" for name in names)
+                self._basenames, self._indexed = BasenameIndex(files), now
+            basenames = self._basenames
+        return basenames.suggest(path.strip("/"))
+
+    def url(self, path):
+        return self._full_path(path)
+
+    def describe(self):
+        return f"本地目录 {self.root}"
+
+    def refresh(self):
+        with self._lock:
+            self._indexed = None
+
+
+# 从本地git仓库读取某个ref的文件，不需要工作区
+class GitStorage(Storage):
+    name = "git"
+
+    def __init__(self, repo, ref="HEAD", check_interval=DEFAULT_CHECK_INTERVAL):
+        super().__init__()
+        self.repo = repo
+        self.ref = ref
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked = None
+        self._lock = threading.Lock()
+        self._batch = None
+        self._batch_lock = threading.Lock()
+
+    def _git(self, *args):
+        return subprocess.run(["git", "-C", self.repo, *args], check=True, capture_output=True).stdout
+
+    # ref 对应的提交；最多每 check_interval 秒解析一次，提交变化时重新生成路径索引
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is not None and now - self._checked < self.check_interval:
+                return self._snapshot
+            sha = self._git("rev-parse", "--verify", f"{self.ref}^{{commit}}").decode().strip()
+            self._checked = now
+            if self._snapshot is None or self._snapshot.sha != sha:
+                self._snapshot = RepoSnapshot(sha, self._ls_tree(sha))
+            return self._snapshot
+
+    def _ls_tree(self, sha):
+        entries = []
+        for record in self._git("ls-tree", "-r", "-t", "-l", "-z", sha).split(b"\0"):
+            if not record:
+                continue
+            meta, path = record.split(b"\t", 1)
+            _, kind, _, size = meta.split()
+            entries.append({"path": path.decode("utf-8", "surrogateescape"), "type": kind.decode(),
+                            "size": int(size) if size != b"-" else 0})
+        return entries
+
+    # 常驻的 `git cat-file --batch` 进程，按请求顺序逐个读取对象
+    def _cat_file(self, spec):
+        with self._batch_lock:
+            if self._batch is None or self._batch.poll() is not None:
+                self._batch = subprocess.Popen(["git", "-C", self.repo, "cat-file", "--batch"],
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._batch.stdin.write(spec.encode("utf-8", "surrogateescape") + b"\n")
+            self._batch.stdin.flush()
+            line = self._batch.stdout.readline()
+            if line.rstrip().endswith((b" missing", b" ambiguous")) or not line:
+                raise FileNotFoundError(spec)
+            header = line.split()
+            size = int(header[2])
+            data = self._batch.stdout.read(size + 1)[:size]
+        if header[1] != b"blob":
+            raise IsADirectoryError(spec)
+        return data
+
+    def read(self, path):
+        return self._cat_file(f"{self.snapshot().sha}:{path.strip('/')}")
+
+    def exists(self, path):
+        return self.snapshot().exists(path)
+
+    def listdir(self, path):
+        return self.snapshot().listdir(path)
+
+    def suggest(self, path):
+        return self.snapshot().suggest(path)
+
+    def url(self, path):
+        return f"{self.repo}@{self.ref}:{path.strip('/')}"
+
+    def describe(self):
+        snapshot = self.snapshot()
+        return f"git {self.repo}@{self.ref} ({snapshot.sha[:10]})"
+
+    def refresh(self):
+        with self._lock:
+            self._checked = None
+
+    def close(self):
+        super().close()
+        with self._batch_lock:
+            if self._batch is not None:
+                self._batch.stdin.close()
+                self._batch.wait()
+                self._batch = None
+
+
+# 按配置创建后端；github 后端需要的客户端和缓存由调用方按需创建（make_github）
+def open_storage(spec=DEFAULT_STORAGE, make_github=None):
+    kind, _, target = spec.partition(":")
+    if kind == "github":
+        if make_github is None:
+            raise ValueError("github 存储需要提供 make_github")
+        return make_github()
+    if kind == "local":
+        return LocalStorage(target or ".")
+    if kind == "git":
+        repo, _, ref = target.rpartition("@") if "@" in target else (target, "", "HEAD")
+        return GitStorage(repo or ".", ref or "HEAD")
+    raise ValueError(f"未知的存储后端: {spec}（可选 github、local:<目录>、git:<仓库目录>[@<ref>]）")
@@ -0,0 +1,142 @@
+import importlib
+import io
+import json
+import sys
+import zipfile
+
+import pytest
+
+from mapping_index import NOT_FOUND
+
+PNG = bytes(range(256)) * 4
+
+
+# app.py 在导入时按当前目录注册映射CSV和图片根目录，因此在临时目录中导入
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    root = tmp_path_factory.mktemp("site")
+    (root / "mapping.csv").write_text("Gene,image_path\nCD4,images/CD4.png\nGHOST,images/GHOST.png\n",
+                                      encoding="utf-8")
+    (root / "mapping-violin.csv").write_text("Gene,Meta information,image_path\n"
+                                             "CD4,T,VlnPlot/T/CD4.png\nVWF,T,VlnPlot/T/VWF.png\n",
+                                             encoding="utf-8")
+    for path in ("images/CD4.png", "VlnPlot/T/CD4.png", "VlnPlot/T/VWF.png"):
+        (root / "static" / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / "static" / path).write_bytes(PNG)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(root)
+        sys.modules.pop("app", None)
+        module = importlib.import_module("app")
+        yield module
+        sys.modules.pop("app", None)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def lookup(client, **form):
+    response = client.post("/pdfs", data=form)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_pdfs_returns_versioned_url(client, app_module):
+    result = lookup(client, plotType="umap", gene="CD4")
+    version = app_module.FILE_HASHES(app_module.figure_file("images/CD4.png"))[:app_module.VERSION_LENGTH]
+    assert result["pdfUrl"] == f"figures/images/CD4.png?v={version}"
+    assert result["type"] == "umap"
+
+
+def test_pdfs_defaults_to_violin_and_reports_misses(client):
+    assert lookup(client, gene="VWF", cellType="T")["pdfUrl"].startswith("figures/VlnPlot/T/VWF.png?v=")
+    assert lookup(client, plotType="umap", gene="GHOST")["pdfUrl"] == "static/images/GHOST.png"
+    assert lookup(client, plotType="umap", gene="NOPE")["pdfUrl"] == "static/" + NOT_FOUND
+
+
+def test_figure_with_current_version_is_immutable(client):
+    url = lookup(client, plotType="umap", gene="CD4")["pdfUrl"]
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == PNG
+    assert response.headers["ETag"]
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_figure_without_version_must_revalidate(client):
+    response = client.get("/figures/images/CD4.png")
+    assert response.status_code == 200
+    assert "no-cache" in response.headers["Cache-Control"]
+    assert "immutable" not in response.headers["Cache-Control"]
+
+
+def test_matching_etag_returns_304(client):
+    etag = client.get("/figures/images/CD4.png").headers["ETag"]
+    response = client.get("/figures/images/CD4.png", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    response = client.get("/figures/images/CD4.png", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_range_request_returns_206(client):
+    response = client.get("/figures/images/CD4.png", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.data == PNG[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(PNG)}"
+
+
+def test_figure_outside_root_or_missing_is_404(client):
+    assert client.get("/figures/../mapping.csv").status_code == 404
+    assert client.get("/figures/images/GHOST.png").status_code == 404
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.data.decode("utf-8").splitlines()]
+
+
+def test_batch_ndjson_marks_each_combination(client):
+    response = client.post("/pdfs/batch", json={"genes": ["CD4", "GHOST", "NOPE"], "plotTypes": ["umap"],
+                                                 "format": "ndjson"})
+    assert response.status_code == 200
+    records = ndjson(response)
+    assert [(r["gene"], r["status"]) for r in records] == [("CD4", "ok"), ("GHOST", "file_missing"),
+                                                          ("NOPE", "not_found")]
+    assert records[0]["pdfUrl"].startswith("figures/images/CD4.png?v=")
+
+
+def test_batch_defaults_to_violin_and_accepts_form_lists(client):
+    response = client.post("/pdfs/batch", data={"genes": "CD4, VWF", "cellTypes": "T", "format": "ndjson"})
+    records = ndjson(response)
+    assert [(r["plotType"], r["gene"], r["status"]) for r in records] == [("violin", "CD4", "ok"),
+                                                                         ("violin", "VWF", "ok")]
+
+
+def test_batch_zip_contains_files_and_manifest(client):
+    response = client.post("/pdfs/batch", json={"genes": ["CD4", "VWF", "NOPE"], "cellTypes": ["T"]})
+    assert response.status_code == 200
+    assert response.mimetype == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert sorted(zf.namelist()) == ["VlnPlot/T/CD4.png", "VlnPlot/T/VWF.png", "manifest.ndjson"]
+        assert zf.read("VlnPlot/T/CD4.png") == PNG
+        manifest = [json.loads(line) for line in zf.read("manifest.ndjson").decode("utf-8").splitlines()]
+    assert [r["status"] for r in manifest] == ["ok", "ok", "not_found"]
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"json": ["CD4"]},
+    {"json": "CD4"},
+    {"json": {"genes": {"CD4": 1}}},
+    {"json": {"genes": []}},
+    {"json": {"genes": ["CD4"], "format": "tar"}},
+    {"data": b"{not json", "content_type": "application/json"},
+])
+def test_batch_rejects_invalid_requests(client, kwargs):
+    assert client.post("/pdfs/batch", **kwargs).status_code == 400
+
+
+def test_batch_rejects_too_many_items(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_EXPORT_ITEMS", 2)
+    response = client.post("/pdfs/batch", json={"genes": ["CD4", "VWF"], "plotTypes": ["umap", "violin"]})
+    assert response.status_code == 413
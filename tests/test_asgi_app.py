@@ -0,0 +1,104 @@
+import importlib
+import io
+import sys
+
+import pytest
+import sniffio
+from PIL import Image
+from starlette.testclient import TestClient
+
+from image_optimize import optimize_images
+
+
+# 简单的PNG（无损WebP变体明显更小）
+def make_png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PNG = make_png()
+
+
+def pixels(data):
+    return Image.open(io.BytesIO(data)).convert("RGB").tobytes()
+
+
+# asgi_app.py 从 app.py 导入按当前目录注册的映射和图片根目录，因此在临时目录中导入
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    root = tmp_path_factory.mktemp("site")
+    (root / "mapping.csv").write_text("Gene,image_path\nCD4,images/CD4.png\n", encoding="utf-8")
+    (root / "mapping-violin.csv").write_text("Gene,Meta information,image_path\n", encoding="utf-8")
+    (root / "static" / "images").mkdir(parents=True)
+    (root / "static" / "images" / "CD4.png").write_bytes(PNG)
+    (root / "static" / "images" / "notes.txt").write_bytes(b"not a pdf")
+    (root / "static" / "images" / "CD4.pdf").write_bytes(b"%PDF-1.4\n")
+    optimize_images(str(root / "static"), formats=("webp",), workers=1)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(root)
+        for name in ("app", "asgi_app"):
+            sys.modules.pop(name, None)
+        module = importlib.import_module("asgi_app")
+        with TestClient(module.app) as test_client:
+            yield test_client
+        for name in ("app", "asgi_app"):
+            sys.modules.pop(name, None)
+
+
+def test_figure_url_from_pdfs_is_immutable(client):
+    url = client.post("/pdfs", data={"plotType": "umap", "gene": "CD4"}).json()["pdfUrl"]
+    response = client.get("/" + url)
+    assert response.status_code == 200
+    assert pixels(response.content) == pixels(PNG)
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_figure_etag_304_and_range(client):
+    response = client.get("/figures/images/CD4.png")
+    assert "no-cache" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    assert client.get("/figures/images/CD4.png", headers={"If-None-Match": etag}).status_code == 304
+    response = client.get("/figures/images/CD4.png", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["content-range"].startswith("bytes 0-9/")
+    assert len(response.content) == 10
+
+
+def test_figure_variant_follows_accept(client):
+    url = client.post("/pdfs", data={"plotType": "umap", "gene": "CD4"}).json()["pdfUrl"]
+    response = client.get("/" + url, headers={"Accept": "image/webp,*/*"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    assert pixels(response.content) == pixels(PNG)
+    # 变体的URL版本号来自原图
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["etag"] != client.get("/" + url).headers["etag"]
+
+
+def test_missing_or_escaping_figures_are_404(client):
+    assert client.get("/figures/images/CD8A.png").status_code == 404
+    assert client.get("/figures/%2e%2e/mapping.csv").status_code == 404
+    assert client.get("/raster/images/notes.txt").status_code == 404
+    assert client.get("/raster/images/CD8A.pdf", params={"dpi": "96"}).status_code == 404
+    assert client.get("/raster/images/CD4.pdf", params={"dpi": "96"}).status_code == 400
+    assert client.get("/raster/images/CD4.pdf", params={"dpi": "x"}).status_code == 400
+
+
+# 路径检查、变体选择和哈希不在事件循环线程中执行
+def test_figure_resolution_runs_off_the_event_loop(client, monkeypatch):
+    module = sys.modules["asgi_app"]
+    smallest = module.FIGURE_VARIANTS.smallest
+    calls = []
+
+    def record(*args):
+        try:
+            calls.append(sniffio.current_async_library())
+        except sniffio.AsyncLibraryNotFoundError:
+            calls.append("thread")
+        return smallest(*args)
+
+    monkeypatch.setattr(module.FIGURE_VARIANTS, "smallest", record)
+    assert client.get("/figures/images/CD4.png").status_code == 200
+    assert calls == ["thread"]
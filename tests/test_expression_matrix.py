@@ -0,0 +1,32 @@
+import numpy as np
+
+from expression_matrix import ExpressionMatrix, read_mtx, write_matrix
+
+GENES = ["CD3D", "CD4", "EMPTY"]
+CELLS = ["c0", "c1", "c2", "c3"]
+
+
+def test_write_matrix_sorts_sums_duplicates_and_drops_zeros(tmp_path):
+    # 坐标乱序、(CD4, c1) 重复、一个显式零值
+    rows = [1, 0, 1, 0, 1]
+    cols = [3, 2, 1, 0, 1]
+    values = [4.0, 2.0, 1.5, 0.0, 0.5]
+    matrix = ExpressionMatrix(write_matrix(str(tmp_path / "m"), GENES, CELLS, rows, cols, values))
+    assert matrix.meta["nnz"] == 3
+    assert list(matrix.indptr) == [0, 1, 3, 3]
+    cols, values = matrix.row("CD4")
+    assert cols.tolist() == [1, 3] and values.tolist() == [2.0, 4.0]
+    assert matrix.dense_row("CD3D").tolist() == [0.0, 0.0, 2.0, 0.0]
+    assert matrix.dense_row("EMPTY").tolist() == [0.0] * 4
+    assert "CD4" in matrix and "VWF" not in matrix and len(matrix) == 3
+    assert matrix.cells == CELLS
+
+
+def test_read_mtx_converts_to_zero_based(tmp_path):
+    mtx = tmp_path / "matrix.mtx"
+    mtx.write_text("%%MatrixMarket matrix coordinate real general\n% comment\n3 4 2\n1 3 2.5\n2 4 1\n",
+                   encoding="utf-8")
+    shape, rows, cols, values = read_mtx(str(mtx))
+    assert shape == (3, 4)
+    assert rows.tolist() == [0, 1] and cols.tolist() == [2, 3]
+    assert np.allclose(values, [2.5, 1.0])
@@ -0,0 +1,49 @@
+import hashlib
+import os
+
+import file_hash
+from file_hash import FileHashes
+
+
+def set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_unchanged_file_is_hashed_once(tmp_path, monkeypatch):
+    path = tmp_path / "a.png"
+    path.write_bytes(b"one")
+    calls = []
+    hash_file = file_hash.hash_file
+
+    def counting_hash_file(p):
+        calls.append(p)
+        return hash_file(p)
+
+    monkeypatch.setattr(file_hash, "hash_file", counting_hash_file)
+    hashes = FileHashes()
+    assert hashes(str(path)) == hashlib.sha256(b"one").hexdigest()
+    # 相对路径与绝对路径共用一条记录
+    monkeypatch.chdir(tmp_path)
+    assert hashes("a.png") == hashes(str(path))
+    assert len(calls) == 1
+
+
+def test_changed_file_replaces_its_entry(tmp_path):
+    path = tmp_path / "a.png"
+    hashes = FileHashes()
+    for i, data in enumerate((b"one", b"two", b"three")):
+        path.write_bytes(data)
+        set_mtime(path, (i + 1) * 1_000_000_000)
+        assert hashes(str(path)) == hashlib.sha256(data).hexdigest()
+    assert len(hashes) == 1
+
+
+def test_same_size_rewrite_is_detected_by_mtime(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(b"one")
+    set_mtime(path, 1_000_000_000)
+    hashes = FileHashes()
+    hashes(str(path))
+    path.write_bytes(b"two")
+    set_mtime(path, 2_000_000_000)
+    assert hashes(str(path)) == hashlib.sha256(b"two").hexdigest()
@@ -0,0 +1,92 @@
+import os
+import shutil
+
+import pytest
+
+from file_index import FileIndex
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x")
+
+
+# 目录mtime设为固定值，保证“变化”由测试显式控制而不依赖文件系统时间精度
+def set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "images"
+    touch(root / "CD3D.png")
+    touch(root / "CD4_v1.png")
+    touch(root / "Sub" / "CD4_v2.png")
+    touch(root / "Sub" / "Deep" / "VWF.pdf")
+    touch(root / ".pyramid" / "CD3D.screen.webp")
+    for i, d in enumerate([root / "Sub" / "Deep", root / "Sub", root]):
+        set_mtime(d, 1_000_000_000 + i)
+    index = FileIndex(str(tmp_path / "index.sqlite"))
+    yield root, index
+    index.close()
+
+
+def test_initial_refresh_lists_everything_but_hidden_dirs(tree):
+    root, index = tree
+    assert index.refresh(str(root)) == {"dirs": 3, "changed": 3}
+    assert [os.path.relpath(p, root) for p in index.files(str(root))] == [
+        "CD3D.png", "CD4_v1.png", os.path.join("Sub", "CD4_v2.png"), os.path.join("Sub", "Deep", "VWF.pdf")]
+    assert {gene: len(paths) for gene, paths in index.gene_map(str(root)).items()} == {"CD3D": 1, "CD4": 2, "VWF": 1}
+    assert list(index.gene_map(str(root), (".pdf",))) == ["VWF"]
+
+
+def test_unchanged_tree_is_not_rescanned(tree):
+    root, index = tree
+    index.refresh(str(root))
+    assert index.refresh(str(root)) == {"dirs": 3, "changed": 0}
+
+
+def test_only_changed_directory_is_rescanned(tree):
+    root, index = tree
+    index.refresh(str(root))
+    touch(root / "Sub" / "ACTA2.png")
+    set_mtime(root / "Sub", 2_000_000_000)
+    assert index.refresh(str(root)) == {"dirs": 3, "changed": 1}
+    assert index.list_files(str(root / "Sub")) == ["ACTA2.png", "CD4_v2.png"]
+    assert index.count_files(str(root), recursive=True) == 5
+
+
+def test_removed_subtree_is_forgotten(tree):
+    root, index = tree
+    index.refresh(str(root))
+    shutil.rmtree(root / "Sub")
+    set_mtime(root, 2_000_000_000)
+    assert index.refresh(str(root)) == {"dirs": 1, "changed": 1}
+    assert index.subdirs(str(root)) == []
+    assert index.count_files(str(root), recursive=True) == 2
+
+
+def test_missing_root_clears_index(tree):
+    root, index = tree
+    index.refresh(str(root))
+    shutil.rmtree(root)
+    assert index.refresh(str(root)) == {"dirs": 0, "changed": 0}
+    assert index.files(str(root)) == []
+
+
+def test_paging_and_subdir_counts(tree):
+    root, index = tree
+    for i in range(5):
+        touch(root / f"G{i}.png")
+    index.refresh(str(root))
+    assert index.count_files(str(root)) == 7
+    assert index.list_files(str(root), offset=2, limit=3) == ["G0.png", "G1.png", "G2.png"]
+    assert index.subdirs(str(root)) == [(str(root / "Sub"), 2)]
+
+
+def test_sibling_with_common_prefix_is_not_in_subtree(tree):
+    root, index = tree
+    touch(root.parent / "images_other" / "X.png")
+    index.refresh(str(root))
+    index.refresh(str(root.parent / "images_other"))
+    assert index.count_files(str(root), recursive=True) == 4
@@ -0,0 +1,44 @@
+from gene_search import GeneSearchIndex, bounded_levenshtein
+
+GENES = ["CD3D", "CD3E", "CD3", "CD38", "ACD3X", "CD4", "CD8A", "CD8B", "VWF", "ACTA2", "MT-CD3"]
+
+
+def test_exact_then_prefix_by_length_then_substring_by_position():
+    index = GeneSearchIndex(GENES)
+    assert index.search("cd3", fuzzy=False) == ["CD3", "CD38", "CD3D", "CD3E", "ACD3X", "MT-CD3"]
+
+
+def test_query_is_case_insensitive_and_trimmed():
+    index = GeneSearchIndex(GENES)
+    assert index.search("  vwf ")[0] == "VWF"
+
+
+def test_empty_query_lists_all_genes_alphabetically():
+    index = GeneSearchIndex(GENES)
+    assert index.search("") == sorted(GENES, key=str.lower)
+
+
+def test_fuzzy_matches_come_after_exact_matches_ordered_by_distance():
+    index = GeneSearchIndex(GENES)
+    assert index.search("acta2")[0] == "ACTA2"
+    assert index.search("acat2") == ["ACTA2"]
+    results = index.search("cd8c")
+    assert results[:2] == ["CD8A", "CD8B"]
+    assert index.search("cd8c", fuzzy=False) == []
+
+
+def test_fuzzy_respects_max_distance():
+    index = GeneSearchIndex(GENES)
+    assert index.search("vxx", max_distance=1) == []
+    assert index.search("vwx", max_distance=1) == ["VWF"]
+
+
+def test_limit_applies_across_tiers():
+    index = GeneSearchIndex(GENES)
+    assert index.search("cd", limit=3) == ["CD3", "CD4", "CD38"]
+
+
+def test_bounded_levenshtein():
+    assert bounded_levenshtein("cd8a", "cd8a", 2) == 0
+    assert bounded_levenshtein("cd8a", "cd8b", 2) == 1
+    assert bounded_levenshtein("acta2", "vwf", 2) > 2
@@ -0,0 +1,60 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from github_client import GitHubClient, RateLimitExceeded
+
+
+# 前 limited 个请求返回主限流（403 + X-RateLimit-Remaining: 0），之后返回200
+class RateLimitHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.count += 1
+        if server.count <= server.limited:
+            self.send_response(403)
+            self.send_header("X-RateLimit-Remaining", "0")
+            self.send_header("X-RateLimit-Reset", str(time.time() + server.reset_in))
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def rate_limited_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitHandler)
+    server.daemon_threads = True
+    server.count, server.limited, server.reset_in = 0, 1, 120
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_long_rate_limit_raises_without_waiting(rate_limited_server):
+    server, base = rate_limited_server
+    client = GitHubClient("o", "r", api_base=base, raw_base=base, max_rate_wait=0)
+    start = time.monotonic()
+    with pytest.raises(RateLimitExceeded):
+        client.get(client.commit_url("main"))
+    # 重置之前的请求不再发出
+    with pytest.raises(RateLimitExceeded):
+        client.get(client.commit_url("main"))
+    assert time.monotonic() - start < 5
+    assert server.count == 1
+    client.close()
+
+
+def test_short_rate_limit_waits_and_retries(rate_limited_server):
+    server, base = rate_limited_server
+    server.reset_in = 0.2
+    client = GitHubClient("o", "r", api_base=base, raw_base=base, max_rate_wait=5)
+    assert client.get(client.commit_url("main")).status_code == 200
+    assert server.count == 2
+    client.close()
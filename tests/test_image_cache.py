@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from benchmarks.bench_suite import BRANCH, OWNER, REPO, fixture_client, start_fixture
+from image_cache import ImageCache
+
+FILES = {"a.png": b"a" * 100, "b.png": b"b" * 100, "c.png": b"c" * 100}
+
+
+@pytest.fixture
+def github():
+    server, base = start_fixture(dict(FILES))
+    client = fixture_client(base)
+    yield server, client
+    client.close()
+    server.shutdown()
+
+
+def fetch(cache, client, path):
+    return cache.fetch(f"{OWNER}/{REPO}/{BRANCH}/{path}", client.raw_url(path))
+
+
+def statuses(server):
+    return [status for _, status in server.requests]
+
+
+def test_download_then_fresh_hit_makes_no_request(github, tmp_path):
+    server, client = github
+    cache = ImageCache(str(tmp_path), session=client, max_age=300)
+    assert fetch(cache, client, "a.png") == FILES["a.png"]
+    assert fetch(cache, client, "a.png") == FILES["a.png"]
+    assert statuses(server) == [200]
+    assert cache.total_bytes() == 100
+
+
+def test_expired_entry_is_revalidated_with_304(github, tmp_path):
+    server, client = github
+    cache = ImageCache(str(tmp_path), session=client, max_age=0)
+    fetch(cache, client, "a.png")
+    assert fetch(cache, client, "a.png") == FILES["a.png"]
+    assert statuses(server) == [200, 304]
+
+
+def test_changed_upstream_is_downloaded_again(github, tmp_path):
+    server, client = github
+    cache = ImageCache(str(tmp_path), session=client, max_age=0)
+    fetch(cache, client, "a.png")
+    server.fixture["raw"]["a.png"] = b"new"
+    assert fetch(cache, client, "a.png") == b"new"
+    assert statuses(server) == [200, 200]
+
+
+def test_index_survives_restart(github, tmp_path):
+    server, client = github
+    fetch(ImageCache(str(tmp_path), session=client), client, "a.png")
+    assert fetch(ImageCache(str(tmp_path), session=client), client, "a.png") == FILES["a.png"]
+    assert statuses(server) == [200]
+
+
+def test_least_recently_used_entry_is_evicted(github, tmp_path):
+    server, client = github
+    cache = ImageCache(str(tmp_path), session=client, max_bytes=250)
+    fetch(cache, client, "a.png")
+    fetch(cache, client, "b.png")
+    fetch(cache, client, "a.png")  # a 比 b 更近被访问
+    fetch(cache, client, "c.png")
+    assert len(cache) == 2 and cache.total_bytes() == 200
+    blobs = [name for _, _, names in os.walk(tmp_path / "blobs") for name in names]
+    assert len(blobs) == 2
+    server.requests.clear()
+    fetch(cache, client, "a.png")
+    fetch(cache, client, "b.png")
+    assert statuses(server) == [200]  # 只有被淘汰的 b 重新下载
+
+
+def test_hits_do_not_rewrite_index(github, tmp_path):
+    server, client = github
+    cache = ImageCache(str(tmp_path), session=client, save_interval=3600)
+    fetch(cache, client, "a.png")
+    index_path = tmp_path / "index.json"
+    saved = index_path.read_bytes()
+    for _ in range(5):
+        fetch(cache, client, "a.png")
+    assert index_path.read_bytes() == saved
+    cache.flush()
+    assert index_path.read_bytes() != saved
+
+
+def test_network_failure_falls_back_to_local_copy(github, tmp_path):
+    server, client = github
+    cache = ImageCache(str(tmp_path), session=client, max_age=0)
+    fetch(cache, client, "a.png")
+    server.shutdown()
+    server.server_close()
+    assert fetch(cache, client, "a.png") == FILES["a.png"]
@@ -0,0 +1,69 @@
+import os
+
+from mapping_index import MappingIndex
+from mapping_store import compile_csv
+
+CSV = "Gene,Meta information,image_path\nCD3D,T,a.pdf\nCD3D,T,dup.pdf\nCD4,,b.pdf\n"
+
+
+def write_csv(path, text, mtime_ns):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_lookup_keeps_first_duplicate_and_falls_back_to_empty_meta(tmp_path):
+    csv_file = tmp_path / "mapping.csv"
+    write_csv(csv_file, CSV, 1_000_000_000)
+    index = MappingIndex(check_interval=0)
+    index.register("violin", str(csv_file))
+    assert index.lookup("violin", "CD3D", "T") == "a.pdf"
+    assert index.lookup("violin", "CD4", "B") == "b.pdf"
+    assert index.lookup("violin", "CD8A", "T") is None
+    assert index.lookup("umap", "CD3D", "T") is None
+
+
+def test_csv_change_is_reloaded(tmp_path):
+    csv_file = tmp_path / "mapping.csv"
+    write_csv(csv_file, CSV, 1_000_000_000)
+    index = MappingIndex(check_interval=0)
+    index.register("violin", str(csv_file))
+    write_csv(csv_file, "Gene,Meta information,image_path\nCD3D,T,new.pdf\n", 2_000_000_000)
+    assert index.lookup("violin", "CD3D", "T") == "new.pdf"
+    assert index.lookup("violin", "CD4", "") is None
+    assert len(index) == 1
+
+
+def test_reload_is_rate_limited_by_check_interval(tmp_path):
+    csv_file = tmp_path / "mapping.csv"
+    write_csv(csv_file, CSV, 1_000_000_000)
+    index = MappingIndex(check_interval=3600)
+    index.register("violin", str(csv_file))
+    index.lookup("violin", "CD3D", "T")
+    write_csv(csv_file, "Gene,Meta information,image_path\nCD3D,T,new.pdf\n", 2_000_000_000)
+    assert index.lookup("violin", "CD3D", "T") == "a.pdf"
+
+
+def test_compiled_file_is_picked_up_and_dropped_when_stale(tmp_path):
+    csv_file = tmp_path / "mapping.csv"
+    write_csv(csv_file, CSV, 1_000_000_000)
+    index = MappingIndex(check_interval=0)
+    index.register("violin", str(csv_file))
+
+    midx = compile_csv(str(csv_file))
+    os.utime(midx, ns=(1_500_000_000, 1_500_000_000))
+    assert index.lookup("violin", "CD3D", "T") == "a.pdf"
+    assert "violin" in index._stores
+
+    # CSV比 .midx 新：回到CSV
+    write_csv(csv_file, "Gene,Meta information,image_path\nCD3D,T,new.pdf\n", 2_000_000_000)
+    assert index.lookup("violin", "CD3D", "T") == "new.pdf"
+    assert "violin" not in index._stores
+
+
+def test_missing_csv_loads_empty_and_recovers(tmp_path):
+    csv_file = tmp_path / "mapping.csv"
+    index = MappingIndex(check_interval=0)
+    index.register("umap", str(csv_file))
+    assert index.lookup("umap", "CD4", None) is None
+    write_csv(csv_file, "Gene,image_path\nCD4,images/CD4.pdf\n", 1_000_000_000)
+    assert index.lookup("umap", "CD4", None) == "images/CD4.pdf"
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from gene_path_parser import parse_gene_paths
+from mapping_index import MappingIndex
+from mapping_store import MappingStore, compile_csv, compile_rows, read_mapping_rows
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_text(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return f.read()
+
+
+@pytest.fixture(params=["mapping-violin.csv", "mapping123.csv"])
+def mapping_csv(request, tmp_path):
+    csv_file = tmp_path / request.param
+    csv_file.write_text(read_text(os.path.join(ROOT, request.param)), encoding="utf-8")
+    return str(csv_file)
+
+
+def test_lookup_matches_every_csv_row(mapping_csv):
+    rows = read_mapping_rows(read_text(mapping_csv))
+    store = MappingStore.open(compile_csv(mapping_csv))
+    first = {}
+    for gene, meta, path in rows:
+        first.setdefault((gene, meta), path)
+    assert len(store) == len(first)
+    for (gene, meta), path in first.items():
+        assert store.lookup(gene, meta) == path
+    store.close()
+
+
+def test_compiled_and_csv_index_agree(mapping_csv):
+    rows = read_mapping_rows(read_text(mapping_csv))
+    csv_index = MappingIndex(check_interval=3600)
+    csv_index.register("violin", mapping_csv)
+    compile_csv(mapping_csv)
+    midx_index = MappingIndex(check_interval=3600)
+    midx_index.register("violin", mapping_csv)
+    assert "violin" in midx_index._stores and "violin" not in csv_index._stores
+    for gene, meta, _ in rows:
+        for query_meta in (meta, "missing"):
+            assert midx_index.lookup("violin", gene, query_meta) == csv_index.lookup("violin", gene, query_meta)
+
+
+def test_gene_paths_match_parser(mapping_csv):
+    text = read_text(mapping_csv)
+    store = MappingStore.open(compile_csv(mapping_csv))
+    parsed, _ = parse_gene_paths(text)
+    assert store.gene_paths() == parsed
+    store.close()
+
+
+def test_duplicate_genes_resolve_to_first_meta_then_first_row():
+    text = "Gene,Meta information,image_path\nCD3D,Tissue,t.pdf\nCD3D,Cell,c1.pdf\nCD3D,Cell,c2.pdf\n"
+    store = MappingStore.from_bytes(compile_rows(read_mapping_rows(text)))
+    parsed, dropped = parse_gene_paths(text)
+    assert store.gene_paths() == parsed == {"CD3D": "c1.pdf"}
+    assert sorted(dropped) == [("CD3D", "c2.pdf"), ("CD3D", "t.pdf")]
+    assert store.lookup("CD3D") == "c1.pdf"
+    assert store.gene_paths("Tissue") == {"CD3D": "t.pdf"}
+
+
+def test_enumeration_and_unknown_keys():
+    text = "Gene,Meta information,image_path\nVWF,B,v.pdf\nACTA2,A,a.pdf\nACTA2,B,b.pdf\n"
+    store = MappingStore.from_bytes(compile_rows(read_mapping_rows(text)))
+    assert list(store.genes()) == ["ACTA2", "VWF"]
+    assert list(store.genes("A")) == ["ACTA2"]
+    assert list(store.genes("C")) == []
+    assert store.metas() == ["A", "B"]
+    assert store.lookup("ACTA2", "C") is None
+    assert store.lookup("CD4", "A") is None
+    assert store.lookup("", "A") is None
+
+
+def test_header_detection_is_case_insensitive():
+    text = "GENE,image_path,Meta Information\nCD4,x.png,T\n"
+    assert read_mapping_rows(text) == [("CD4", "T", "x.png")]
@@ -0,0 +1,56 @@
+import pytest
+
+from benchmarks.bench_suite import fixture_client, start_fixture
+from repo_snapshot import RepoSnapshots
+
+ENTRIES = [
+    {"path": "images", "type": "tree", "sha": "images"},
+    {"path": "images/CD4.png", "type": "blob", "size": 10},
+    {"path": "VlnPlot/T/CD4.pdf", "type": "blob", "size": 20},
+]
+
+
+@pytest.fixture
+def github():
+    server, base = start_fixture({}, ENTRIES)
+    client = fixture_client(base)
+    yield server, client
+    client.close()
+    server.shutdown()
+
+
+def test_snapshot_answers_exists_and_listdir(github):
+    _, client = github
+    snapshot = RepoSnapshots(client).current()
+    assert snapshot.exists("images/CD4.png") and not snapshot.exists("images/CD8A.png")
+    assert snapshot.is_dir("VlnPlot/T")
+    assert snapshot.listdir("") == [{"name": "VlnPlot", "path": "VlnPlot", "type": "dir"},
+                                    {"name": "images", "path": "images", "type": "dir"}]
+    assert snapshot.suggest("VlnPlot/CD4.pdf")[0] == "VlnPlot/T/CD4.pdf"
+
+
+def test_head_is_checked_once_per_interval(github):
+    server, client = github
+    snapshots = RepoSnapshots(client, check_interval=3600)
+    assert snapshots.current() is snapshots.current()
+    assert [status for _, status in server.requests] == [200, 200]
+    snapshots.expire()
+    snapshots.current()
+    assert [status for _, status in server.requests] == [200, 200, 304]
+
+
+def test_failed_tree_fetch_is_retried(github):
+    server, client = github
+    tree = server.fixture["tree"]
+    server.fixture["tree"] = b"not json"
+    snapshots = RepoSnapshots(client, check_interval=3600)
+    with pytest.raises(ValueError):
+        snapshots.current()
+
+    server.fixture["tree"] = tree
+    snapshot = snapshots.current()
+    assert snapshot.exists("images/CD4.png")
+    # 分支头未变（304），目录树重新拉取
+    assert [status for _, status in server.requests] == [200, 200, 304, 200]
+    assert snapshots.current() is snapshot
+    assert len(server.requests) == 4
@@ -0,0 +1,112 @@
+import os
+import subprocess
+
+import pytest
+
+from storage import GitStorage, LocalStorage, open_storage
+
+FILES = {"mapping.csv": b"gene,image_path\nCD4,images/CD4.png\n", "images/CD4.png": b"png", "images/Sub/CD8A.png": b"x"}
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME="t", GIT_AUTHOR_EMAIL="t@example.com",
+               GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@example.com")
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, env=GIT_ENV).stdout
+
+
+def write_files(root, files):
+    for path, data in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(data)
+
+
+# 普通clone（带工作区）的仓库
+@pytest.fixture
+def work_repo(tmp_path):
+    repo = tmp_path / "work"
+    repo.mkdir()
+    git(repo, "init", "-q", "-b", "main")
+    write_files(repo, FILES)
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "init")
+    return repo
+
+
+def check_storage(storage):
+    assert storage.read("mapping.csv") == FILES["mapping.csv"]
+    assert storage.read("/images/CD4.png") == b"png"
+    assert storage.exists("images/Sub/CD8A.png") and not storage.exists("images/CD8A.png")
+    assert [item["name"] for item in storage.listdir("images")] == ["Sub", "CD4.png"]
+    assert storage.suggest("images/CD8A.png")[0] == "images/Sub/CD8A.png"
+    with pytest.raises(FileNotFoundError):
+        storage.read("images/missing.png")
+    with pytest.raises(IsADirectoryError):
+        storage.read("images")
+
+
+def test_git_storage_reads_a_working_clone(work_repo):
+    storage = GitStorage(str(work_repo))
+    try:
+        check_storage(storage)
+        assert storage.describe().startswith(f"git {work_repo}@HEAD (")
+    finally:
+        storage.close()
+
+
+def test_git_storage_reads_a_bare_mirror(work_repo, tmp_path):
+    mirror = tmp_path / "mirror.git"
+    subprocess.run(["git", "clone", "-q", "--mirror", str(work_repo), str(mirror)], check=True)
+    storage = GitStorage(str(mirror), "main")
+    try:
+        check_storage(storage)
+    finally:
+        storage.close()
+
+
+def test_default_git_spec_uses_the_current_checkout(work_repo, monkeypatch):
+    monkeypatch.chdir(work_repo)
+    storage = open_storage("git:")
+    try:
+        assert isinstance(storage, GitStorage) and storage.ref == "HEAD"
+        assert storage.exists("mapping.csv")
+    finally:
+        storage.close()
+
+
+def test_git_storage_follows_new_commits_after_refresh(work_repo):
+    storage = GitStorage(str(work_repo), check_interval=3600)
+    try:
+        first = storage.snapshot().sha
+        write_files(work_repo, {"images/VWF.png": b"v"})
+        git(work_repo, "add", ".")
+        git(work_repo, "commit", "-q", "-m", "add VWF")
+        assert not storage.exists("images/VWF.png")
+        storage.refresh()
+        assert storage.snapshot().sha != first
+        assert storage.read("images/VWF.png") == b"v"
+    finally:
+        storage.close()
+
+
+def test_local_storage_stays_inside_root(tmp_path):
+    root = tmp_path / "root"
+    write_files(root, FILES)
+    (tmp_path / "secret.txt").write_bytes(b"s")
+    storage = LocalStorage(str(root))
+    try:
+        check_storage(storage)
+        assert not storage.exists("../secret.txt")
+        with pytest.raises(FileNotFoundError):
+            storage.read("../secret.txt")
+    finally:
+        storage.close()
+
+
+def test_open_storage_parses_specs():
+    storage = open_storage("git:/srv/repo.git@release/v1")
+    assert (storage.repo, storage.ref) == ("/srv/repo.git", "release/v1")
+    storage.close()
+    with pytest.raises(ValueError):
+        open_storage("github")
+    with pytest.raises(ValueError):
+        open_storage("svn:/x")
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from expression_matrix import write_matrix
+from umap_render import BACKGROUND, HIGH_COLOR, LOW_COLOR, UmapRenderer
+
+GENES = ["CD3D", "CD4", "NONE"]
+# 细胞0、1在对角，细胞2与细胞1重合，细胞3坐标无效
+EMBEDDING = np.array([[0.0, 0.0], [1.0, 1.0], [1.0, 1.0], [np.nan, 0.5]], dtype=np.float32)
+EXPRESSION = np.array([[2.0, 1.0, 0.0, 5.0],
+                       [0.0, 1.0, 3.0, 0.0],
+                       [0.0, 0.0, 0.0, 0.0]], dtype=np.float32)
+SIZE = (200, 200)
+# MARGIN=(20, 40, 70, 20) 时绘图区 110×140，1×1 的坐标范围按 109 像素缩放，纵向居中
+LOWER_LEFT = (164, 20)   # (行, 列)
+UPPER_RIGHT = (55, 129)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    rows, cols = np.nonzero(EXPRESSION)
+    write_matrix(str(tmp_path / "expression"), GENES, [f"c{i}" for i in range(4)], rows, cols, EXPRESSION[rows, cols])
+    np.save(tmp_path / "embedding.npy", EMBEDDING)
+    return str(tmp_path)
+
+
+def color(array, pixel):
+    return array[pixel].tolist()
+
+
+def test_cells_are_binned_to_pixels_and_colored_by_expression(data_dir):
+    renderer = UmapRenderer(data_dir, point_radius=0)
+    array, vmax = renderer.render_array("CD3D", SIZE)
+    assert array.shape == (200, 200, 3) and vmax == 2.0
+    assert color(array, LOWER_LEFT) == HIGH_COLOR.tolist()
+    assert color(array, UPPER_RIGHT) == ((LOW_COLOR + HIGH_COLOR) / 2).astype(np.uint8).tolist()
+    assert color(array, (0, 0)) == BACKGROUND.tolist()
+    # 只有两个有效像素被占用，坐标无效的细胞不画
+    assert (array != BACKGROUND.astype(np.uint8)).any(axis=2).sum() == 2
+
+
+def test_shared_pixel_takes_the_highest_expression(data_dir):
+    renderer = UmapRenderer(data_dir, point_radius=0)
+    array, vmax = renderer.render_array("CD4", SIZE)
+    assert vmax == 3.0
+    assert color(array, UPPER_RIGHT) == HIGH_COLOR.tolist()
+    assert color(array, LOWER_LEFT) == LOW_COLOR.tolist()
+
+
+def test_point_radius_dilates_points(data_dir):
+    array, _ = UmapRenderer(data_dir, point_radius=1).render_array("CD3D", SIZE)
+    row, col = LOWER_LEFT
+    assert color(array, (row, col + 1)) == HIGH_COLOR.tolist()
+    assert color(array, (row + 1, col + 1)) == BACKGROUND.tolist()
+
+
+def test_unknown_gene_returns_none_and_unexpressed_gene_renders(data_dir):
+    renderer = UmapRenderer(data_dir)
+    assert renderer.render("VWF", SIZE) is None
+    assert "VWF" not in renderer and renderer.genes == GENES
+    assert renderer.render("NONE", SIZE).startswith(b"\x89PNG")
+
+
+def test_png_cache_is_bounded_by_bytes(data_dir):
+    renderer = UmapRenderer(data_dir, cache_bytes=10**9)
+    first = renderer.render("CD3D", SIZE)
+    renderer.render("CD4", SIZE)
+    assert renderer.render("CD3D", SIZE) is first
+    assert [key[0] for key in renderer._cache] == ["CD4", "CD3D"]
+
+    renderer.cache_bytes = 1
+    latest = renderer.render("NONE", SIZE)
+    # 超出上限时淘汰最旧的条目，但至少保留最新的一张
+    assert list(renderer._cache) == [("NONE", *SIZE)]
+    assert renderer._cached_bytes == len(latest)
+
+
+def test_embedding_must_match_cell_count(data_dir, tmp_path):
+    np.save(tmp_path / "embedding.npy", EMBEDDING[:3])
+    with pytest.raises(ValueError):
+        UmapRenderer(data_dir)
@@ -0,0 +1,107 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from expression_matrix import write_matrix
+from violin_store import GRID_SIZE, QUANTILES, ViolinRenderer, ViolinStore, build_summary
+
+GENES = ["CD3D", "CD4", "ZERO"]
+CELLS = [f"c{i}" for i in range(12)]
+GROUPS = ["T", "T", "T", "T", "T", "B", "B", "B", "B", "B", None, None]
+
+
+# 稠密表达矩阵（基因 × 细胞）；最后两个细胞没有注释
+def dense_values():
+    rng = np.random.default_rng(0)
+    values = np.round(rng.gamma(2.0, 1.0, (len(GENES), len(CELLS))), 2).astype(np.float32)
+    values[:, ::3] = 0
+    values[2] = 0
+    return values
+
+
+@pytest.fixture
+def store_root(tmp_path):
+    values = dense_values()
+    rows, cols = np.nonzero(values)
+    matrix = write_matrix(str(tmp_path / "matrix"), GENES, CELLS, rows, cols, values[rows, cols])
+    root = tmp_path / "store"
+    build_summary(matrix, GROUPS, str(root / "celltype"), workers=1, chunk_genes=2)
+    return root
+
+
+def test_summary_matches_numpy_statistics(store_root):
+    summary = ViolinStore(str(store_root)).summary("celltype")
+    values = dense_values()
+    assert summary.genes == GENES and summary.groups == ["B", "T"]
+    assert summary.n.tolist() == [5, 5]
+    for g, gene in enumerate(GENES):
+        for k, group in enumerate(summary.groups):
+            cells = [i for i, label in enumerate(GROUPS) if label == group]
+            expected = np.quantile(values[g, cells], QUANTILES)
+            assert np.allclose(summary.quantiles[g, k], expected, atol=1e-5), (gene, group)
+            assert summary.frac[g, k] == pytest.approx(np.mean(values[g, cells] > 0))
+        # 没有注释的细胞不计入
+        annotated = [i for i, label in enumerate(GROUPS) if label is not None]
+        assert summary.grid_max[g] == pytest.approx(values[g, annotated].max() or 1.0)
+
+
+def test_density_is_normalized_per_group(store_root):
+    summary = ViolinStore(str(store_root)).summary("celltype")
+    assert summary.density.shape == (len(GENES), 2, GRID_SIZE)
+    assert summary.density.dtype == np.float16
+    assert np.allclose(np.asarray(summary.density[:2]).max(axis=2), 1.0)
+    # 全为零的基因：密度集中在第一个网格点
+    assert np.argmax(summary.density[2], axis=1).tolist() == [0, 0]
+
+
+def test_store_rejects_unknown_and_unsafe_metas(store_root, tmp_path):
+    (store_root / "partial").mkdir()
+    store = ViolinStore(str(store_root))
+    assert store.metas() == ["celltype"]
+    for meta in ("missing", "partial", "", None, "../store/celltype", ".hidden", "celltype/../celltype"):
+        assert store.summary(meta) is None
+    assert store.has("celltype", "CD4") and not store.has("celltype", "VWF")
+    assert ViolinStore(str(tmp_path / "nowhere")).metas() == []
+
+
+def test_render_returns_png_and_none_for_unknown(store_root, tmp_path):
+    renderer = ViolinRenderer(ViolinStore(str(store_root)), cache_dir=str(tmp_path / "cache"))
+    png = renderer.render("celltype", "CD4", size=(400, 300))
+    assert Image.open(io.BytesIO(png)).size == (400, 300)
+    assert renderer.render("celltype", "ZERO") is not None
+    assert renderer.render("celltype", "VWF") is None
+    assert renderer.render("missing", "CD4") is None
+    assert renderer.render("../x", "CD4") is None
+    assert renderer.render_path("../store/celltype", "CD4") is None
+
+
+def test_disk_cache_is_keyed_by_build_id(store_root, tmp_path):
+    cache = tmp_path / "cache"
+    renderer = ViolinRenderer(ViolinStore(str(store_root)), cache_dir=str(cache))
+    build = renderer.version("celltype")
+    path = renderer.render_path("celltype", "CD4")
+    assert path.startswith(os.path.join(str(cache), "celltype", build) + os.sep)
+    mtime = os.stat(path).st_mtime_ns
+    assert renderer.render_path("celltype", "CD4") == path and os.stat(path).st_mtime_ns == mtime
+
+    # 重新构建（新的构建ID）后缓存路径随之改变
+    meta_file = store_root / "celltype" / "meta.json"
+    meta = json.loads(meta_file.read_text())
+    meta["build"] = "rebuilt"
+    meta_file.write_text(json.dumps(meta))
+    os.utime(meta_file, ns=(mtime + 10**9, mtime + 10**9))
+    assert renderer.version("celltype") == "rebuilt"
+    assert os.path.join("celltype", "rebuilt") in renderer.render_path("celltype", "CD4")
+
+
+def test_memory_cache_is_bounded(store_root, tmp_path):
+    renderer = ViolinRenderer(ViolinStore(str(store_root)), cache_dir=str(tmp_path / "cache"), memory_items=2)
+    for gene in GENES:
+        renderer.render("celltype", gene)
+    assert [key[2] for key in renderer._memory] == ["CD4", "ZERO"]
+    assert renderer.render("celltype", "CD3D") is not None
+    assert [key[2] for key in renderer._memory] == ["ZERO", "CD3D"]
@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from expression_matrix import ExpressionMatrix
+
+# UMAP 基因表达图的即时渲染
+#
+# 数据目录：
+#   embedding.npy  float32 (N, 2)  全部细胞的二维坐标（内存映射），行顺序与 expression/cells.txt 一致
+#   expression/    expression_matrix.py 生成的CSR表达矩阵
+# 每种输出尺寸只计算一次细胞的像素位置和灰色底图；渲染某个基因时只处理表达该基因的细胞：
+# 用 np.maximum.at 把表达值聚合到像素（同一像素取最大值，相当于高表达细胞画在上层），
+# 再做半径为 POINT_RADIUS 的最大值膨胀并按 浅灰 -> 蓝 着色（与Seurat FeaturePlot默认配色一致）。
+DEFAULT_DATA_DIR = os.environ.get("MAGE_UMAP_DATA", "umap_data")
+DEFAULT_SIZE = (800, 800)
+DEFAULT_CACHE_BYTES = int(os.environ.get("MAGE_UMAP_CACHE_BYTES", str(128 * 1024 * 1024)))
+POINT_RADIUS = 1
+MARGIN = (20, 40, 70, 20)  # 左、上、右、下
+BACKGROUND = np.array([255, 255, 255], dtype=np.float32)
+LOW_COLOR = np.array([211, 211, 211], dtype=np.float32)
+HIGH_COLOR = np.array([0, 0, 255], dtype=np.float32)
+
+
+def has_dataset(data_dir=DEFAULT_DATA_DIR):
+    return (os.path.exists(os.path.join(data_dir, "embedding.npy"))
+            and os.path.exists(os.path.join(data_dir, "expression", "meta.json")))
+
+
+# 二维数组的最大值膨胀（圆形邻域），按偏移量循环，不按点循环
+def dilate_max(grid, radius):
+    if radius <= 0:
+        return grid
+    height, width = grid.shape
+    out = grid.copy()
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            if (dx or dy) and dx * dx + dy * dy <= radius * radius:
+                dst = out[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+                src = grid[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+                np.maximum(dst, src, out=dst)
+    return out
+
+
+class UmapRenderer:
+    def __init__(self, data_dir=DEFAULT_DATA_DIR, cache_bytes=DEFAULT_CACHE_BYTES, point_radius=POINT_RADIUS):
+        self.data_dir = data_dir
+        self.point_radius = point_radius
+        self.embedding = np.load(os.path.join(data_dir, "embedding.npy"), mmap_mode="r")
+        self.matrix = ExpressionMatrix(os.path.join(data_dir, "expression"))
+        if self.embedding.shape != (self.matrix.n_cells, 2):
+            raise ValueError(f"embedding 形状 {self.embedding.shape} 与细胞数 {self.matrix.n_cells} 不一致")
+        self.version = self._version()
+        self.cache_bytes = cache_bytes
+        self._layouts = {}      # (宽, 高) -> (像素下标, 底图)
+        self._cache = OrderedDict()  # (基因, 宽, 高) -> PNG字节
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        finite = np.isfinite(self.embedding).all(axis=1)
+        self._bounds = (np.asarray(self.embedding[finite].min(axis=0)), np.asarray(self.embedding[finite].max(axis=0)))
+
+    # 数据版本：坐标和表达矩阵文件的 mtime/大小，用于URL版本号
+    def _version(self):
+        parts = []
+        for name in ("embedding.npy", os.path.join("expression", "meta.json"), os.path.join("expression", "data.npy")):
+            stat = os.stat(os.path.join(self.data_dir, name))
+            parts.append(f"{name}:{stat.st_mtime_ns}:{stat.st_size}")
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    @property
+    def genes(self):
+        return self.matrix.genes
+
+    def __contains__(self, gene):
+        return gene in self.matrix
+
+    # 某尺寸下每个细胞的像素下标（-1 表示坐标无效）和灰色底图
+    def _layout(self, size):
+        with self._lock:
+            layout = self._layouts.get(size)
+        if layout is not None:
+            return layout
+
+        width, height = size
+        left, top, right, bottom = MARGIN
+        plot_w, plot_h = width - left - right, height - top - bottom
+        lo, hi = self._bounds
+        span = np.where(hi > lo, hi - lo, 1.0)
+        # 保持纵横比，居中
+        scale = min((plot_w - 1) / span[0], (plot_h - 1) / span[1])
+        offset_x = left + (plot_w - 1 - span[0] * scale) / 2
+        offset_y = top + (plot_h - 1 - span[1] * scale) / 2
+
+        coords = np.asarray(self.embedding, dtype=np.float32)
+        valid = np.isfinite(coords).all(axis=1)
+        px = np.rint(offset_x + (coords[:, 0] - lo[0]) * scale)
+        py = np.rint(offset_y + (hi[1] - coords[:, 1]) * scale)
+        pixels = np.where(valid, py * width + px, -1).astype(np.int64)
+
+        occupied = np.zeros(width * height, dtype=np.uint8)
+        occupied[pixels[pixels >= 0]] = 1
+        occupied = dilate_max(occupied.reshape(height, width), self.point_radius).astype(bool)
+        base = np.empty((height, width, 3), dtype=np.float32)
+        base[:] = BACKGROUND
+        base[occupied] = LOW_COLOR
+
+        layout = (pixels, base)
+        with self._lock:
+            self._layouts[size] = layout
+        return layout
+
+    # 渲染为 (高, 宽, 3) uint8 数组
+    def render_array(self, gene, size=DEFAULT_SIZE):
+        size = tuple(size)
+        pixels, base = self._layout(size)
+        width, height = size
+        cols, values = self.matrix.row(gene)
+        target = pixels[cols]
+        keep = (target >= 0) & (values > 0)
+        target, values = target[keep], values[keep].astype(np.float32)
+
+        canvas = np.zeros(width * height, dtype=np.float32)
+        np.maximum.at(canvas, target, values)
+        canvas = dilate_max(canvas.reshape(height, width), self.point_radius)
+        vmax = float(values.max()) if len(values) else 1.0
+
+        image = base.copy()
+        expressed = canvas > 0
+        t = (canvas[expressed] / vmax)[:, None]
+        image[expressed] = LOW_COLOR * (1 - t) + HIGH_COLOR * t
+        return image.astype(np.uint8), vmax
+
+    def _draw_png(self, gene, size):
+        array, vmax = self.render_array(gene, size)
+        image = Image.fromarray(array)
+        draw = ImageDraw.Draw(image)
+        width, height = size
+        _, top, right, bottom = MARGIN
+        draw.text((width / 2, top / 2), gene, fill="black", anchor="mm", font=ImageFont.load_default(size=18))
+
+        # 颜色条
+        font = ImageFont.load_default(size=11)
+        bar_x, bar_top, bar_h = width - right + 16, top + 10, min(160, height - top - bottom - 20)
+        ramp = np.linspace(1, 0, bar_h)[:, None, None]
+        bar = (LOW_COLOR * (1 - ramp) + HIGH_COLOR * ramp).astype(np.uint8).repeat(12, axis=1)
+        image.paste(Image.fromarray(bar), (bar_x, bar_top))
+        draw.text((bar_x + 16, bar_top), f"{vmax:.3g}", fill="black", anchor="lm", font=font)
+        draw.text((bar_x + 16, bar_top + bar_h), "0", fill="black", anchor="lm", font=font)
+
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        return buffer.getvalue()
+
+    # 渲染为PNG字节，结果放入按字节数限制的LRU缓存；基因不存在时返回None
+    def render(self, gene, size=DEFAULT_SIZE):
+        if gene not in self:
+            return None
+        key = (gene, *size)
+        with self._lock:
+            png = self._cache.get(key)
+            if png is not None:
+                self._cache.move_to_end(key)
+                return png
+
+        png = self._draw_png(gene, tuple(size))
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = png
+                self._cached_bytes += len(png)
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._cached_bytes -= len(old)
+        return png
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="由UMAP坐标和表达矩阵渲染基因表达图")
+    parser.add_argument("genes", nargs="+")
+    parser.add_argument("--data", default=DEFAULT_DATA_DIR, help="含 embedding.npy 和 expression/ 的目录")
+    parser.add_argument("--size", type=int, nargs=2, default=list(DEFAULT_SIZE))
+    parser.add_argument("-o", "--output-dir", default=".")
+    args = parser.parse_args(argv)
+
+    renderer = UmapRenderer(args.data)
+    missing = [gene for gene in args.genes if gene not in renderer]
+    for gene in args.genes:
+        if gene in renderer:
+            with open(os.path.join(args.output_dir, f"{gene}.png"), "wb") as f:
+                f.write(renderer.render(gene, tuple(args.size)))
+    if missing:
+        print(f"数据中没有这些基因：{', '.join(missing)}", file=sys.stderr)
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from mapping_store import detect_columns
+from repo_snapshot import BasenameIndex, is_figure, normalize_path
+
+# 映射文件一致性检查与自动修复
+#
+# 把映射CSV的每一行与实际文件（本地目录，或GitHub仓库的git树）对照，报告：
+#   dangling   路径指向的文件不存在
+#   duplicate  同一 (基因, meta) 出现多次（exact：路径也相同；conflict：路径不同）
+#   orphan     映射引用的顶层目录下没有被任何行引用的图片
+# 悬空路径按文件名索引（repo_snapshot.BasenameIndex）寻找替代：同名（不计扩展名）的文件中，与原路径共享目录层级最多、
+# 扩展名相同者优先；只有唯一最优候选时才作为修复建议，否则列为有歧义。
+# 本地文件列表按目录并行扫描；GitHub只需一次递归树请求（树过大被截断时按顶层目录并行补齐）。
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+DEFAULT_LIMIT = 20
+
+
+# 映射路径的顶层目录（只扫描这些目录）
+def top_dirs(paths):
+    return {path.split("/", 1)[0] for path in paths if "/" in path}
+
+
+# 列出单个目录，返回 (子目录, 文件)，均为相对root、以'/'分隔的路径
+def _scan_dir(root, rel_dir):
+    subdirs, files = [], []
+    try:
+        entries = os.scandir(os.path.join(root, rel_dir) if rel_dir else root)
+    except (FileNotFoundError, NotADirectoryError):
+        return subdirs, files
+    with entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            (subdirs if entry.is_dir() else files).append(rel)
+    return subdirs, files
+
+
+# 并行扫描本地目录：root下的文件，以及 tops 中各目录的全部子树
+def list_local_files(root, tops, workers=DEFAULT_WORKERS):
+    subdirs, files = _scan_dir(root, "")
+    files = set(files)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(_scan_dir, root, d) for d in subdirs if d in tops]
+        while pending:
+            subdirs, found = pending.pop().result()
+            files.update(found)
+            pending.extend(pool.submit(_scan_dir, root, d) for d in subdirs)
+    return files
+
+
+# 通过git树列出GitHub仓库中的文件；prefix 为映射路径相对仓库根目录的前缀（如 "static"）
+def list_github_files(client, tops, prefix=""):
+    prefix = normalize_path(prefix).rstrip("/")
+    tree = client.get_tree()
+    entries = tree.get("tree", [])
+    if tree.get("truncated"):
+        # 递归结果被截断：逐级找到 prefix 对应的树，再按顶层目录并行取子树
+        sha = tree.get("sha")
+        for part in [p for p in prefix.split("/") if p]:
+            level = client.get_tree(sha, recursive=False).get("tree", [])
+            sha = next((e["sha"] for e in level if e["path"] == part and e["type"] == "tree"), None)
+            if sha is None:
+                return set()
+        level = client.get_tree(sha, recursive=False).get("tree", [])
+        subtrees = {e["path"]: e["sha"] for e in level if e["type"] == "tree" and e["path"] in tops}
+        files = {e["path"] for e in level if e["type"] == "blob"}
+        results = client.map(lambda name: client.get_tree(subtrees[name]), list(subtrees))
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                raise result
+            files.update(f"{name}/{e['path']}" for e in result.get("tree", []) if e["type"] == "blob")
+        return files
+
+    files = set()
+    start = len(prefix) + 1 if prefix else 0
+    for entry in entries:
+        if entry["type"] != "blob" or (prefix and not entry["path"].startswith(prefix + "/")):
+            continue
+        path = entry["path"][start:]
+        if "/" not in path or path.split("/", 1)[0] in tops:
+            files.add(path)
+    return files
+
+
+# 读取映射CSV，返回 (表头, 行列表, 列位置, 换行符)
+def read_mapping(csv_file):
+    with open(csv_file, newline="", encoding="utf-8-sig") as f:
+        text = f.read()
+    newline = "\r\n" if "\r\n" in text[:text.find("\n") + 1] else "\n"
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return [], [], (0, None, 0), newline
+    header = rows[0]
+    return header, rows[1:], detect_columns(header), newline
+
+
+# 检查一个映射文件，返回报告和修复后的行
+def check_mapping(csv_file, files, index, drop_dangling=False):
+    header, rows, (gene_idx, meta_idx, path_idx), newline = read_mapping(csv_file)
+    report = {"mapping": csv_file, "rows": len(rows), "dangling": [], "duplicates": []}
+    fixed_rows, referenced = [], set()
+    seen = {}  # (基因, meta) -> (行号, 路径, 文件是否存在, 在 fixed_rows 中的位置)
+
+    for line, row in enumerate(rows, start=2):
+        if len(row) <= max(gene_idx, path_idx) or not row[gene_idx].strip() or not row[path_idx].strip():
+            fixed_rows.append(row)
+            continue
+        gene = row[gene_idx].strip()
+        meta = row[meta_idx].strip() if meta_idx is not None and meta_idx < len(row) else ""
+        path = normalize_path(row[path_idx])
+        resolved = path if path in files else None
+
+        if resolved is None:
+            suggestion, candidates = index.suggest(path)
+            report["dangling"].append({"line": line, "gene": gene, "meta": meta, "path": path,
+                                       "suggestion": suggestion, "candidates": candidates})
+            resolved = suggestion
+        if resolved is not None:
+            referenced.add(resolved)
+            if resolved != path:
+                row = list(row)
+                row[path_idx] = resolved
+
+        key = (gene, meta)
+        if key in seen:
+            first_line, first_path, first_exists, position = seen[key]
+            report["duplicates"].append({"line": line, "gene": gene, "meta": meta, "path": path,
+                                         "first_line": first_line, "first_path": first_path,
+                                         "conflict": path != first_path})
+            # 与 /pdfs 查询一致保留第一条；第一条悬空而这一条有效时改用这一条
+            if not first_exists and resolved is not None:
+                fixed_rows[position] = row
+                seen[key] = (first_line, first_path, True, position)
+            continue
+        if resolved is None and drop_dangling:
+            continue
+        seen[key] = (line, path, resolved is not None, len(fixed_rows))
+        fixed_rows.append(row)
+
+    return report, (header, fixed_rows, newline), referenced
+
+
+def write_mapping(output, header, rows, newline):
+    tmp = output + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator=newline)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp, output)
+    return output
+
+
+def fixed_path(csv_file):
+    stem, ext = os.path.splitext(csv_file)
+    return f"{stem}.fixed{ext}"
+
+
+def print_report(report, limit):
+    dangling = report["dangling"]
+    fixable = sum(1 for d in dangling if d["suggestion"])
+    ambiguous = sum(1 for d in dangling if not d["suggestion"] and d["candidates"])
+    conflicts = sum(1 for d in report["duplicates"] if d["conflict"])
+    print(f"{report['mapping']}: {report['rows']} 行，悬空 {len(dangling)}"
+          f"（可修复 {fixable}，有歧义 {ambiguous}，无候选 {len(dangling) - fixable - ambiguous}），"
+          f"重复 {len(report['duplicates'])}（路径冲突 {conflicts}）")
+    for d in dangling[:limit]:
+        label = f"{d['gene']}/{d['meta']}" if d["meta"] else d["gene"]
+        if d["suggestion"]:
+            hint = f"-> {d['suggestion']}"
+        elif d["candidates"]:
+            hint = f"有歧义：{', '.join(d['candidates'][:5])}"
+        else:
+            hint = "找不到同名文件"
+        print(f"  第{d['line']}行 {label}: {d['path']} {hint}")
+    if len(dangling) > limit:
+        print(f"  …… 另有 {len(dangling) - limit} 条悬空路径")
+    for d in report["duplicates"][:limit]:
+        kind = "路径冲突" if d["conflict"] else "完全重复"
+        print(f"  第{d['line']}行与第{d['first_line']}行重复（{kind}）: {d['gene']} {d['meta']} {d['path']}")
+    if len(report["duplicates"]) > limit:
+        print(f"  …… 另有 {len(report['duplicates']) - limit} 条重复")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查映射CSV与图片文件是否一致，并生成修复后的映射")
+    parser.add_argument("mappings", nargs="+", help="映射CSV文件")
+    parser.add_argument("--root", default=".", help="映射路径相对的本地目录（如 static）")
+    parser.add_argument("--github", metavar="OWNER/REPO", help="改为对照GitHub仓库的文件树")
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--prefix", default="", help="映射路径在GitHub仓库中的前缀目录")
+    parser.add_argument("--fix", action="store_true", help="写出 <映射>.fixed.csv")
+    parser.add_argument("--in-place", action="store_true", help="直接覆盖原映射文件")
+    parser.add_argument("--drop-dangling", action="store_true", help="修复时删除无法修复的悬空行")
+    parser.add_argument("--json", help="把完整报告写入JSON文件")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="每类问题最多显示的条数")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    mapped_paths = set()
+    for csv_file in args.mappings:
+        _, rows, (_, _, path_idx), _ = read_mapping(csv_file)
+        mapped_paths.update(normalize_path(row[path_idx]) for row in rows if len(row) > path_idx)
+    tops = top_dirs(mapped_paths)
+
+    if args.github:
+        from github_client import GitHubClient
+        owner, _, repo = args.github.partition("/")
+        client = GitHubClient(owner, repo, args.branch, token=os.environ.get("GITHUB_TOKEN"),
+                              api_base=os.environ.get("GITHUB_API_BASE", "https://api.github.com"),
+                              max_workers=args.workers)
+        try:
+            files = list_github_files(client, tops, args.prefix)
+        finally:
+            client.close()
+    else:
+        files = list_local_files(args.root, tops, args.workers)
+    index = BasenameIndex(files)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {csv_file: pool.submit(check_mapping, csv_file, files, index, args.drop_dangling)
+                   for csv_file in args.mappings}
+        for csv_file, future in futures.items():
+            results[csv_file] = future.result()
+
+    referenced = set().union(*(r[2] for r in results.values()))
+    orphans = sorted(p for p in files if is_figure(p) and "/" in p and p not in referenced)
+
+    reports = []
+    for csv_file, (report, fixed, _) in results.items():
+        reports.append(report)
+        print_report(report, args.limit)
+        if args.fix or args.in_place:
+            output = write_mapping(csv_file if args.in_place else fixed_path(csv_file), *fixed)
+            print(f"  已写出修复后的映射: {output}")
+    print(f"孤立图片（未被任何映射引用，已计入修复建议）: {len(orphans)}")
+    for path in orphans[:args.limit]:
+        print(f"  {path}")
+    if len(orphans) > args.limit:
+        print(f"  …… 另有 {len(orphans) - args.limit} 个")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"files": len(files), "mappings": reports, "orphans": orphans}, f, ensure_ascii=False, indent=1)
+    has_issues = any(r["dangling"] or r["duplicates"] for r in reports)
+    return 1 if has_issues else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
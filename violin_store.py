@@ -0,0 +1,346 @@
+import argparse
+import colorsys
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+from expression_matrix import ExpressionMatrix, read_lines, write_lines
+
+# 小提琴图摘要存储与按需渲染
+#
+# 每个meta分类（如 Major.cell.type）一个目录，保存每个 基因 × 分组 的表达分布摘要：
+#   genes.txt / groups.txt   行（基因）和分组顺序
+#   n.npy          int64   (K,)      每组细胞数
+#   quantiles.npy  float32 (G, K, Q) QUANTILES 处的分位数（含最小、最大值）
+#   frac.npy       float32 (G, K)    表达比例（>0 的细胞占比）
+#   grid_max.npy   float32 (G,)      密度网格上限（该基因的最大表达值）
+#   density.npy    float16 (G, K, B) [0, grid_max] 上 B 个网格点的核密度，每组归一化到最大值为1
+#   meta.json      {"build": 构建ID, ...}
+# 摘要由稀疏表达矩阵按基因分块并行计算；渲染只读一个基因的 K×B 个数，用PIL画多边形。
+# 存储大小为 基因数 × 分组数 × B，新增meta分类只需再构建一个目录，不再逐张生成PDF。
+DEFAULT_STORE_DIR = os.environ.get("MAGE_VIOLIN_STORE", "violin_store")
+DEFAULT_CACHE_DIR = os.environ.get("MAGE_VIOLIN_CACHE_DIR", ".violin_cache")
+QUANTILES = (0.0, 0.25, 0.5, 0.75, 1.0)
+GRID_SIZE = 64
+CHUNK_GENES = 512
+DEFAULT_SIZE = (900, 500)
+
+
+# 核密度的高斯平滑矩阵（B × B），sigma以网格单位计
+def smoothing_kernel(size, sigma):
+    offsets = np.arange(size)[:, None] - np.arange(size)[None, :]
+    return np.exp(-0.5 * (offsets / sigma) ** 2).astype(np.float32)
+
+
+# 单个基因在各组上的摘要；codes 为每个细胞的组号（-1 表示无注释），只遍历非零项
+def summarize_gene(cols, values, codes, n, grid_size=GRID_SIZE):
+    k = len(n)
+    gcodes = codes[cols]
+    keep = gcodes >= 0
+    gcodes, values = gcodes[keep], values[keep]
+    nnz = np.bincount(gcodes, minlength=k)
+    zeros = n - nnz
+    grid_max = float(values.max()) if len(values) else 1.0
+
+    # 分位数：组内排序后的序列为 [0]*zeros + sorted(非零值)
+    order = np.lexsort((values, gcodes))
+    sorted_values = values[order]
+    starts = np.concatenate([[0], np.cumsum(nnz)[:-1]])
+    pos = np.asarray(QUANTILES)[None, :] * np.maximum(n - 1, 0)[:, None]
+    lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+
+    def value_at(idx):
+        nz = idx - zeros[:, None]
+        flat = np.clip(starts[:, None] + nz, 0, max(len(sorted_values) - 1, 0))
+        picked = sorted_values[flat] if len(sorted_values) else np.zeros(flat.shape, dtype=np.float32)
+        return np.where(nz >= 0, picked, 0.0)
+
+    frac_pos = pos - lo
+    quantiles = value_at(lo) * (1 - frac_pos) + value_at(hi) * frac_pos
+
+    # 密度：按组的直方图（一次bincount），零值计入第一个网格点，再做高斯平滑
+    bins = np.minimum((values / grid_max * grid_size).astype(np.int64), grid_size - 1)
+    hist = np.bincount(gcodes * grid_size + bins, minlength=k * grid_size).reshape(k, grid_size).astype(np.float32)
+    hist[:, 0] += zeros
+    total = max(int(n.sum()), 1)
+    spread = np.sqrt(max(float((values ** 2).sum()) / total - (float(values.sum()) / total) ** 2, 0.0))
+    sigma = np.clip(1.06 * spread * total ** -0.2 / grid_max * grid_size, 0.75, grid_size / 8)
+    density = hist @ smoothing_kernel(grid_size, sigma)
+    peak = density.max(axis=1, keepdims=True)
+    density = np.divide(density, peak, out=np.zeros_like(density), where=peak > 0)
+
+    frac = np.divide(nnz, n, out=np.zeros(k, dtype=np.float64), where=n > 0)
+    return quantiles.astype(np.float32), frac.astype(np.float32), grid_max, density.astype(np.float16)
+
+
+# 子进程任务：汇总一块基因
+def _summarize_chunk(matrix_path, codes, n, genes):
+    matrix = ExpressionMatrix(matrix_path)
+    results = [summarize_gene(*matrix.row(gene), codes, n) for gene in genes]
+    quantiles, frac, grid_max, density = zip(*results)
+    return np.stack(quantiles), np.stack(frac), np.array(grid_max, dtype=np.float32), np.stack(density)
+
+
+# 为一个meta分类构建摘要目录；groups 为与 matrix.cells 对齐的分组标签（缺失为None/NaN）
+def build_summary(matrix_path, groups, output, workers=None, chunk_genes=CHUNK_GENES):
+    matrix = ExpressionMatrix(matrix_path)
+    labels = pd.Series(groups, dtype="object")
+    annotated = labels.notna().to_numpy()
+    group_names = sorted(labels[annotated].astype(str).unique())
+    codes = np.full(len(labels), -1, dtype=np.int64)
+    codes[annotated] = pd.Categorical(labels[annotated].astype(str), categories=group_names).codes
+    n = np.bincount(codes[annotated], minlength=len(group_names)).astype(np.int64)
+
+    chunks = [matrix.genes[i:i + chunk_genes] for i in range(0, len(matrix.genes), chunk_genes)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_summarize_chunk, [matrix_path] * len(chunks), [codes] * len(chunks),
+                              [n] * len(chunks), chunks))
+
+    os.makedirs(output, exist_ok=True)
+    arrays = {
+        "quantiles": np.concatenate([p[0] for p in parts]),
+        "frac": np.concatenate([p[1] for p in parts]),
+        "grid_max": np.concatenate([p[2] for p in parts]),
+        "density": np.concatenate([p[3] for p in parts]),
+        "n": n,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(output, f"{name}.npy"), array)
+    write_lines(os.path.join(output, "genes.txt"), matrix.genes)
+    write_lines(os.path.join(output, "groups.txt"), group_names)
+    # meta.json 最后写入，其中的构建ID用作渲染缓存的版本
+    with open(os.path.join(output, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"build": uuid.uuid4().hex, "quantiles": QUANTILES, "grid_size": GRID_SIZE,
+                   "n_genes": len(matrix.genes), "n_groups": len(group_names)}, f)
+    return output
+
+
+# 一个meta分类的摘要（内存映射）
+class ViolinSummary:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.build = self.meta["build"]
+        self.genes = read_lines(os.path.join(path, "genes.txt"))
+        self.groups = read_lines(os.path.join(path, "groups.txt"))
+        self.gene_index = {gene: i for i, gene in enumerate(self.genes)}
+        for name in ("n", "quantiles", "frac", "grid_max", "density"):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def __contains__(self, gene):
+        return gene in self.gene_index
+
+
+# 摘要存储根目录：每个子目录一个meta分类，meta.json 变化时重新打开
+class ViolinStore:
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self._summaries = {}  # meta -> (meta.json mtime, ViolinSummary)
+        self._lock = threading.Lock()
+
+    def metas(self):
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if os.path.exists(os.path.join(self.root, n, "meta.json")))
+
+    # meta分类的摘要，不存在时返回None
+    def summary(self, meta):
+        if not meta or os.sep in meta or meta.startswith("."):
+            return None
+        path = os.path.join(self.root, meta)
+        try:
+            mtime = os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._summaries.get(meta)
+            if cached is None or cached[0] != mtime:
+                cached = self._summaries[meta] = (mtime, ViolinSummary(path))
+        return cached[1]
+
+    def has(self, meta, gene):
+        summary = self.summary(meta)
+        return summary is not None and gene in summary
+
+
+# 与 ggplot 默认配色相近的等间隔色相
+def palette(count):
+    return [tuple(int(c * 255) for c in colorsys.hls_to_rgb(i / max(count, 1), 0.65, 0.65)) for i in range(count)]
+
+
+def nice_ticks(maximum, count=5):
+    if maximum <= 0:
+        return [0.0]
+    raw = maximum / count
+    magnitude = 10 ** np.floor(np.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+    return list(np.arange(0, maximum + step * 0.5, step))
+
+
+# 渲染单个基因的小提琴图为PNG字节
+def render_violin(summary, gene, size=DEFAULT_SIZE):
+    width, height = size
+    g = summary.gene_index[gene]
+    groups = summary.groups
+    quantiles = np.asarray(summary.quantiles[g], dtype=np.float64)
+    density = np.asarray(summary.density[g], dtype=np.float64)
+    grid_max = float(summary.grid_max[g])
+    grid_size = density.shape[1]
+
+    font = ImageFont.load_default(size=12)
+    left, right, top, bottom = 64, 16, 36, 120
+    plot_w, plot_h = width - left - right, height - top - bottom
+    ticks = nice_ticks(grid_max)
+    y_max = max(ticks[-1], grid_max) or 1.0
+
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((left + plot_w / 2, top / 2), gene, fill="black", anchor="mm", font=ImageFont.load_default(size=16))
+
+    def to_y(values):
+        return top + (1 - np.asarray(values) / y_max) * plot_h
+
+    for tick in ticks:
+        y = float(to_y(tick))
+        draw.line([(left - 4, y), (left, y)], fill="black")
+        draw.text((left - 6, y), f"{tick:g}", fill="black", anchor="rm", font=font)
+    draw.line([(left, top), (left, top + plot_h), (left + plot_w, top + plot_h)], fill="black")
+    axis_label = Image.new("RGBA", (120, 14), (255, 255, 255, 0))
+    ImageDraw.Draw(axis_label).text((60, 7), "Expression Level", fill="black", anchor="mm", font=font)
+    axis_label = axis_label.rotate(90, expand=True)
+    image.paste(axis_label, (4, int(top + plot_h / 2 - axis_label.height / 2)), axis_label)
+
+    slot = plot_w / max(len(groups), 1)
+    grid = (np.arange(grid_size) + 0.5) / grid_size * grid_max
+    for k, (name, color) in enumerate(zip(groups, palette(len(groups)))):
+        cx = left + slot * (k + 0.5)
+        q_min, q1, median, q3, q_max = quantiles[k]
+        # 小提琴轮廓：在 [最小值, 最大值] 范围内的网格点，左右对称
+        inside = (grid >= q_min) & (grid <= q_max)
+        ys = np.concatenate([[q_min], grid[inside], [q_max]])
+        ds = np.interp(ys, grid, density[k])
+        half = ds * slot * 0.42
+        ys_px = to_y(ys)
+        outline = np.concatenate([np.column_stack([cx - half, ys_px]), np.column_stack([cx + half, ys_px])[::-1]])
+        if np.ptp(ys_px) < 1:
+            draw.line([(cx - slot * 0.42, ys_px[0]), (cx + slot * 0.42, ys_px[0])], fill=color, width=2)
+        else:
+            draw.polygon([tuple(p) for p in outline], fill=color, outline="black")
+        draw.rectangle([cx - 2, float(to_y(q3)), cx + 2, float(to_y(q1))], fill="black")
+        draw.ellipse([cx - 3, float(to_y(median)) - 3, cx + 3, float(to_y(median)) + 3], fill="white")
+
+        # 分组标签竖排
+        label = Image.new("RGBA", (bottom - 8, 14), (255, 255, 255, 0))
+        ImageDraw.Draw(label).text((label.width, 7), name, fill="black", anchor="rm", font=font)
+        label = label.rotate(90, expand=True)
+        image.paste(label, (int(cx - label.width / 2), top + plot_h + 6), label)
+
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", optimize=False)
+    return buffer.getvalue()
+
+
+# 按需渲染 + 缓存：磁盘缓存按构建ID区分版本，内存中保留最近使用的PNG
+class ViolinRenderer:
+    def __init__(self, store=None, cache_dir=DEFAULT_CACHE_DIR, memory_items=256):
+        self.store = store or ViolinStore()
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, meta):
+        summary = self.store.summary(meta)
+        return summary.build if summary is not None else None
+
+    def cache_path(self, summary, meta, gene, size):
+        return os.path.join(self.cache_dir, meta, summary.build, f"{quote(gene, safe='')}_{size[0]}x{size[1]}.png")
+
+    # 返回PNG文件路径；meta或基因不存在时返回None
+    def render_path(self, meta, gene, size=DEFAULT_SIZE):
+        summary = self.store.summary(meta)
+        if summary is None or gene not in summary:
+            return None
+        out = self.cache_path(summary, meta, gene, size)
+        if not os.path.exists(out):
+            png = render_violin(summary, gene, size)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out), suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+            os.replace(tmp, out)
+        return out
+
+    # 返回PNG字节（供Streamlit等直接显示）
+    def render(self, meta, gene, size=DEFAULT_SIZE):
+        key = (self.version(meta), meta, gene, tuple(size))
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        path = self.render_path(meta, gene, size)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            png = f.read()
+        with self._lock:
+            self._memory[key] = png
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        return png
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="小提琴图摘要：构建与渲染")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="由表达矩阵和细胞注释构建摘要")
+    build.add_argument("matrix", help="expression_matrix.py 生成的CSR目录")
+    build.add_argument("cells", help="细胞注释CSV，第一列为细胞条码，其余列为meta分类")
+    build.add_argument("--meta", nargs="+", help="要构建的meta列（默认全部）")
+    build.add_argument("--store", default=DEFAULT_STORE_DIR)
+    build.add_argument("--workers", type=int, default=None, help="并行进程数")
+
+    render = sub.add_parser("render", help="渲染单个基因的小提琴图")
+    render.add_argument("meta")
+    render.add_argument("gene")
+    render.add_argument("-o", "--output", required=True)
+    render.add_argument("--store", default=DEFAULT_STORE_DIR)
+    render.add_argument("--size", type=int, nargs=2, default=list(DEFAULT_SIZE))
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        matrix = ExpressionMatrix(args.matrix)
+        cells = pd.read_csv(args.cells, index_col=0, dtype=str)
+        cells.index = cells.index.astype(str)
+        cells = cells.reindex(matrix.cells)
+        for meta in args.meta or list(cells.columns):
+            if meta not in cells.columns:
+                parser.error(f"细胞注释中没有列 {meta}")
+            out = build_summary(args.matrix, cells[meta].to_numpy(), os.path.join(args.store, meta), args.workers)
+            print(f"{meta}: {len(matrix)} 个基因 × {cells[meta].nunique()} 组 -> {out}")
+    else:
+        summary = ViolinStore(args.store).summary(args.meta)
+        if summary is None or args.gene not in summary:
+            print(f"摘要中没有 {args.meta} / {args.gene}", file=sys.stderr)
+            return 1
+        with open(args.output, "wb") as f:
+            f.write(render_violin(summary, args.gene, tuple(args.size)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())